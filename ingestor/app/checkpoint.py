@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import unicodedata
+from abc import ABC
+from abc import abstractmethod
+from datetime import datetime
+from datetime import timezone
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from data_builder import iter_record_batches
+from extractor import Extractor
+from gcs_client import GCSClientSingleton
+from google.api_core.exceptions import NotFound
+from pipeline import CategoryEnd
+from timing import timed_phase
+from writer import DataChunk
+from writer import write_chunks_to_blob_as_parquet
+from writer import write_chunks_to_local_parquet
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_MODE_ENV = "CHECKPOINT_MODE"
+CHECKPOINT_OFF = "off"
+CHECKPOINT_ON = "on"
+CHECKPOINT_RESUME = "resume"
+CHECKPOINT_MODES = (CHECKPOINT_OFF, CHECKPOINT_ON, CHECKPOINT_RESUME)
+
+MANIFEST_NAME = "_manifest.json"
+PART_NAME_TEMPLATE = "part-{0}.parquet"
+LOCAL_CHECKPOINT_DIR = "data"
+
+
+def get_checkpoint_mode() -> str:
+    mode = os.getenv(CHECKPOINT_MODE_ENV, CHECKPOINT_OFF).strip().lower()
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f"Unsupported checkpoint mode: {mode}. Supported modes are {CHECKPOINT_MODES}.")
+    return mode
+
+
+def category_slug(category_name: str) -> str:
+    """ASCII file-name-safe version of a category ("Aceite, especias y salsas" -> "aceite-especias-y-salsas")."""
+    ascii_name = unicodedata.normalize("NFKD", category_name).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", ascii_name.lower()).strip("-") or "unnamed"
+
+
+def part_name_for(category_name: str) -> str:
+    return PART_NAME_TEMPLATE.format(category_slug(category_name))
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class Manifest:
+    """Progress of one day's run: every completed top-level category with its part file and row count.
+
+    Categories that lost pages are kept apart as failed, with the part of what was captured: a resumed run crawls
+    them again and replaces that part, a run that starts over deletes it.
+    """
+
+    def __init__(
+        self,
+        run_date: str,
+        categories: Optional[Dict[str, Dict[str, Any]]] = None,
+        complete: bool = False,
+        failed: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        self.run_date = run_date
+        self.categories = categories or {}
+        self.complete = complete
+        self.failed = failed or {}
+
+    @classmethod
+    def from_json(cls, text: str) -> Manifest:
+        data = json.loads(text)
+        return cls(data["run_date"], data.get("categories"), data.get("complete", False), data.get("failed"))
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "run_date": self.run_date,
+                "complete": self.complete,
+                "categories": self.categories,
+                "failed": self.failed,
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    def mark_completed(self, category_name: str, part_name: Optional[str], rows: int) -> None:
+        self.failed.pop(category_name, None)
+        self.categories[category_name] = {"part": part_name, "rows": rows, "completed_at": utc_now()}
+
+    def mark_failed(self, category_name: str, part_name: Optional[str], rows: int) -> None:
+        self.failed[category_name] = {"part": part_name, "rows": rows, "failed_at": utc_now()}
+
+    @property
+    def parts(self) -> List[str]:
+        return [entry["part"] for entry in [*self.categories.values(), *self.failed.values()] if entry["part"]]
+
+    @property
+    def total_rows(self) -> int:
+        return sum(entry["rows"] for entry in [*self.categories.values(), *self.failed.values()])
+
+
+class CheckpointStore(ABC):
+    """Where the part files and manifest of one run date live."""
+
+    @abstractmethod
+    def read_manifest(self) -> Optional[Manifest]:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def write_manifest(self, manifest: Manifest) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def write_part(self, part_name: str, data_gen: Iterable[DataChunk]) -> int:
+        """Write a part and return its row count. Nothing is written when there are no rows."""
+        raise NotImplementedError()
+
+    @abstractmethod
+    def delete_part(self, part_name: str) -> None:
+        raise NotImplementedError()
+
+
+class LocalCheckpointStore(CheckpointStore):
+    def __init__(self, run_dir: str):
+        self.run_dir = run_dir
+
+    def read_manifest(self) -> Optional[Manifest]:
+        path = os.path.join(self.run_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return Manifest.from_json(f.read())
+
+    def write_manifest(self, manifest: Manifest) -> None:
+        os.makedirs(self.run_dir, exist_ok=True)
+        path = os.path.join(self.run_dir, MANIFEST_NAME)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(manifest.to_json())
+        os.replace(f"{path}.tmp", path)
+
+    def write_part(self, part_name: str, data_gen: Iterable[DataChunk]) -> int:
+        return write_chunks_to_local_parquet(data_gen, os.path.join(self.run_dir, part_name))
+
+    def delete_part(self, part_name: str) -> None:
+        path = os.path.join(self.run_dir, part_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class BucketCheckpointStore(CheckpointStore):
+    def __init__(self, bucket_name: str, run_prefix: str):
+        self.bucket_name = bucket_name
+        self.run_prefix = run_prefix
+
+    def _blob(self, name: str):
+        return GCSClientSingleton.get_client().bucket(self.bucket_name).blob(f"{self.run_prefix}/{name}")
+
+    def read_manifest(self) -> Optional[Manifest]:
+        try:
+            return Manifest.from_json(self._blob(MANIFEST_NAME).download_as_text())
+        except NotFound:
+            return None
+
+    def write_manifest(self, manifest: Manifest) -> None:
+        self._blob(MANIFEST_NAME).upload_from_string(manifest.to_json(), content_type="application/json")
+
+    def write_part(self, part_name: str, data_gen: Iterable[DataChunk]) -> int:
+        return write_chunks_to_blob_as_parquet(data_gen, self.bucket_name, f"{self.run_prefix}/{part_name}")
+
+    def delete_part(self, part_name: str) -> None:
+        try:
+            self._blob(part_name).delete()
+        except NotFound:
+            pass
+
+
+def get_checkpoint_store(bucket_name: str, bucket_prefix: str, run_date: str, is_test_mode: bool) -> CheckpointStore:
+    if is_test_mode:
+        return LocalCheckpointStore(os.path.join(LOCAL_CHECKPOINT_DIR, bucket_prefix, run_date))
+    return BucketCheckpointStore(bucket_name, f"{bucket_prefix}/{run_date}")
+
+
+class CategoryStream:
+    """Split the grouped page stream of an extractor into the rows of one top-level category after another.
+
+    The rows of a category end at its CategoryEnd marker, without reading further: a capture failure right after it
+    surfaces when the next category starts, not while the finished one is being written. A category whose pages stop
+    without a marker (a different group follows, or capture ends) did not complete.
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, Union[List[Dict[str, Any]], CategoryEnd]]]):
+        self._items = iter(items)
+        self._next: Optional[Tuple[str, Union[List[Dict[str, Any]], CategoryEnd]]] = None
+        self.completed = False
+
+    def categories(self) -> Iterator[str]:
+        while True:
+            item = self._take()
+            if item is None:
+                return
+            self._next = item
+            yield item[0]
+
+    def rows(self, category_name: str) -> Generator[List[Dict[str, Any]], None, None]:
+        self.completed = False
+        while (item := self._take()) is not None:
+            group, page = item
+            if group != category_name:
+                self._next = item
+                return
+            if isinstance(page, CategoryEnd):
+                self.completed = page.completed
+                return
+            yield page
+
+    def _take(self) -> Optional[Tuple[str, Union[List[Dict[str, Any]], CategoryEnd]]]:
+        item, self._next = self._next, None
+        return item if item is not None else next(self._items, None)
+
+
+@timed_phase("writing")
+def ingest_with_checkpoints(
+    extractor: Extractor,
+    store: CheckpointStore,
+    run_date: str,
+    batch_rows: int,
+    resume: bool = False,
+) -> Manifest:
+    """Write every top-level category as its own part as soon as it is complete, recording it in the manifest.
+
+    A category is committed when the extractor marks its end as completed, so a failure costs at most the category
+    in progress, and a category that lost pages is recorded as failed. With resume, categories already completed in
+    the day's manifest are skipped and a retry only crawls what is missing or failed. Without it, any previous parts
+    of the day are deleted and the run starts over.
+    """
+    manifest = store.read_manifest()
+    if manifest and resume:
+        logger.info(
+            f"Resuming run of {run_date}: {len(manifest.categories)} categories already completed, "
+            f"{len(manifest.failed)} to retry"
+        )
+    else:
+        if manifest:
+            logger.info(f"Discarding {len(manifest.categories) + len(manifest.failed)} checkpointed categories")
+            for part_name in manifest.parts:
+                store.delete_part(part_name)
+        manifest = Manifest(run_date)
+
+    extractor.completed_categories = set(manifest.categories)
+    manifest.complete = False
+    store.write_manifest(manifest)
+
+    stream = CategoryStream(extractor.get_grouped_page_sources())
+    for category_name in stream.categories():
+        part_name = part_name_for(category_name)
+        batches = iter_record_batches(stream.rows(category_name), extractor.OUTPUT_SCHEMA, batch_rows)
+        rows = store.write_part(part_name, extractor.metrics.track_batches(batches))
+        if not rows and manifest.failed.get(category_name, {}).get("part"):
+            # An empty retry writes no part, so the partial one of the failed attempt would be left behind
+            store.delete_part(part_name)
+        if stream.completed:
+            manifest.mark_completed(category_name, part_name if rows else None, rows)
+        else:
+            manifest.mark_failed(category_name, part_name if rows else None, rows)
+        store.write_manifest(manifest)
+        outcome = "Checkpointed" if stream.completed else "Recorded failed"
+        logger.info(f"{outcome} category {category_name}: {rows} rows in {part_name if rows else 'no part'}")
+
+    if manifest.total_rows == 0:
+        raise RuntimeError("No data to write: 0 products were extracted. Failing to trigger alert.")
+
+    manifest.complete = True
+    store.write_manifest(manifest)
+    logger.info(
+        f"Run of {run_date} complete: {len(manifest.categories)} categories, {len(manifest.failed)} failed, "
+        f"{manifest.total_rows} rows"
+    )
+    return manifest
@@ -3,25 +3,90 @@ from datetime import datetime
 from typing import Any
 from typing import Dict
 from typing import Generator
+from typing import Iterable
 from typing import List
 
-import pandas as pd
+import pyarrow as pa
 from timing import timed_phase
 
 logger = logging.getLogger(__name__)
 
+DATE_COLUMN = "date"
+DEFAULT_BATCH_ROWS = 10_000
 
-def build_df(product_gen: Generator[Dict[str, Any], None, None]) -> pd.DataFrame:
-    logger.info("Building dataframes")
-    df = pd.DataFrame(product_gen)
-    df["date"] = datetime.now().date().isoformat()
-    logger.info(f"Built dataframe of shape and size: {df.shape}, {df.size}")
-    return df
+
+class RecordBatchBuilder:
+    """Accumulate product rows column by column and emit Arrow record batches against a fixed schema.
+
+    Keys missing from a row are written as nulls and keys not declared in the schema are dropped, so every batch
+    has the same schema and the writer never has to infer or cast one. The date column is filled in per batch.
+    """
+
+    def __init__(self, schema: pa.Schema, date: str, batch_rows: int = DEFAULT_BATCH_ROWS):
+        if batch_rows < 1:
+            raise ValueError(f"batch_rows must be positive, got {batch_rows}")
+        self.schema = schema
+        self.date = date
+        self.batch_rows = batch_rows
+        self._row_fields = [name for name in schema.names if name != DATE_COLUMN]
+        self._columns: Dict[str, List[Any]] = {name: [] for name in self._row_fields}
+        self._num_rows = 0
+        self._unknown_fields = set()
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def append(self, row: Dict[str, Any]) -> bool:
+        """Add a row and return True once the pending rows reach the target batch size."""
+        for name in self._row_fields:
+            self._columns[name].append(row.get(name))
+        if not self._columns.keys() >= row.keys():
+            self._warn_unknown_fields(row)
+        self._num_rows += 1
+        return self._num_rows >= self.batch_rows
+
+    def flush(self) -> pa.RecordBatch:
+        arrays = []
+        for field in self.schema:
+            if field.name == DATE_COLUMN:
+                arrays.append(pa.array([self.date] * self._num_rows, type=field.type))
+            else:
+                arrays.append(pa.array(self._columns[field.name], type=field.type))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        self._columns = {name: [] for name in self._row_fields}
+        self._num_rows = 0
+        return batch
+
+    def _warn_unknown_fields(self, row: Dict[str, Any]) -> None:
+        unknown = row.keys() - self._columns.keys() - self._unknown_fields
+        if unknown:
+            logger.warning(f"Dropping fields not in the output schema: {sorted(unknown)}")
+            self._unknown_fields.update(unknown)
+
+
+def iter_record_batches(
+    product_gen_list: Iterable[Iterable[Dict[str, Any]]],
+    schema: pa.Schema,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+) -> Generator[pa.RecordBatch, None, None]:
+    builder = RecordBatchBuilder(schema, datetime.now().date().isoformat(), batch_rows)
+    for product_gen in product_gen_list:
+        for row in product_gen:
+            if builder.append(row):
+                batch = builder.flush()
+                logger.info(f"Built record batch of {batch.num_rows} rows ({batch.nbytes} bytes)")
+                yield batch
+    if len(builder):
+        batch = builder.flush()
+        logger.info(f"Built final record batch of {batch.num_rows} rows ({batch.nbytes} bytes)")
+        yield batch
 
 
 @timed_phase("data_building")
 def build_data_gen(
-    product_gen_list: List[Generator[Dict[str, Any], None, None]],
-) -> Generator[pd.DataFrame, None, None]:
-    logger.info("Building data generator")
-    return (build_df(product_gen) for product_gen in product_gen_list)
+    product_gen_list: Iterable[Iterable[Dict[str, Any]]],
+    schema: pa.Schema,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+) -> Generator[pa.RecordBatch, None, None]:
+    logger.info(f"Building record batches of up to {batch_rows} rows")
+    return iter_record_batches(product_gen_list, schema, batch_rows)
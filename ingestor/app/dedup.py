@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+
+DEDUP_ROWS_ENV = "DEDUP_ROWS"
+DIGEST_SIZE = 16
+_FIELD_SEPARATOR = "\x1f"
+_NULL = "\x00"
+
+
+def is_row_dedup_enabled() -> bool:
+    value = os.getenv(DEDUP_ROWS_ENV, "on").strip().lower()
+    if value not in ("on", "off"):
+        raise ValueError(f"Unsupported {DEDUP_ROWS_ENV} value: {value}. Supported values are ('on', 'off').")
+    return value == "on"
+
+
+def product_key(row: Dict[str, Any]) -> str:
+    """Stable identity of a product: its URL when the retailer has one, else its name and size."""
+    if row.get("product_url"):
+        return row["product_url"]
+    return f"{row.get('name')}{_FIELD_SEPARATOR}{row.get('size')}"
+
+
+def row_digest(retailer: str, row: Dict[str, Any], columns: Sequence[str]) -> bytes:
+    """128-bit BLAKE2b digest of the retailer, the product key and the given columns of a row."""
+    values = [retailer, product_key(row)]
+    values.extend(_NULL if row.get(column) is None else str(row[column]) for column in columns)
+    return hashlib.blake2b(_FIELD_SEPARATOR.join(values).encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+
+class RowDeduplicator:
+    """Drop rows already seen in this run, e.g. a product repeated by overlapping Carrefour pagination.
+
+    Two rows are duplicates when the retailer, product key and every compared column are equal, so the same product
+    listed under two categories, or at two prices, is kept. Provenance columns such as the page a row was read from
+    are not compared. Only a 16-byte digest per unique row is kept, which is exact (no false positives, unlike a Bloom
+    filter) for the few hundred thousand rows of a run.
+    """
+
+    def __init__(self, retailer: str, columns: Sequence[str]):
+        self.retailer = retailer
+        self.columns = list(columns)
+        self.seen: Set[bytes] = set()
+        self.duplicates = 0
+
+    def filter(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        unique = []
+        for row in rows:
+            digest = row_digest(self.retailer, row, self.columns)
+            if digest in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(digest)
+            unique.append(row)
+        return unique
+
+
+def get_row_deduplicator(
+    retailer: str, columns: Sequence[str], ignored_columns: Sequence[str] = ()
+) -> Optional[RowDeduplicator]:
+    if not is_row_dedup_enabled():
+        return None
+    return RowDeduplicator(retailer, [column for column in columns if column not in ignored_columns])
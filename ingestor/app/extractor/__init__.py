@@ -2,16 +2,42 @@ from __future__ import annotations
 
 import logging
 import os
+import shutil
+import tempfile
+import time
 from abc import ABCMeta
 from abc import abstractmethod
 from datetime import datetime
 from datetime import timezone
 from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import Generator
 from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+from typing import Union
 
+import pyarrow as pa
+from data_builder import DATE_COLUMN
+from dedup import get_row_deduplicator
+from extractor.browser import AdaptiveWaiter
+from extractor.browser import block_urls
+from extractor.browser import get_blocked_url_patterns
+from extractor.browser import get_browser_session
+from extractor.browser import get_wait_strategy
+from extractor.browser import NavigationStats
+from extractor.page_archive import get_page_recorder
 from gcs_client import GCSClientSingleton
+from metrics import IngestionMetrics
+from pipeline import CapturedPage
+from pipeline import CategoryEnd
+from pipeline import DEFAULT_MAX_PENDING_PAGES
+from pipeline import DEFAULT_PARSE_WORKERS
+from pipeline import PageEmitter
+from pipeline import PagePipeline
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
@@ -22,25 +48,166 @@ DEBUG_DIR = "data/debug"
 
 
 class Extractor(metaclass=ABCMeta):
+    # Declared output columns (all strings) the row-batch builder writes, including the ingestion date
+    OUTPUT_SCHEMA: pa.Schema
+    # Short retailer identifier, used to name per-retailer state such as the saved browser session
+    RETAILER: str
+    # Output columns describing where a row was read from rather than the product; ignored when dropping duplicates
+    PROVENANCE_COLUMNS: Tuple[str, ...] = ()
+    # Network.setBlockedURLs patterns of retailer-specific resources the scraper never reads, on top of the common ones
+    BLOCKED_URL_PATTERNS: Tuple[str, ...] = ()
+
     def __init__(self, data_source_url: str, bucket_name: str, break_early: bool = False, is_test_mode: bool = False):
         self.data_source_url = data_source_url
         self.bucket_name = bucket_name
         self.break_early = break_early
         self.is_test_mode = is_test_mode
+        # Top-level categories a previous attempt already wrote (resumed runs); capture_pages skips them
+        self.completed_categories: Set[str] = set()
+        self.navigation_stats = NavigationStats()
+        self.metrics = IngestionMetrics()
+        self.waiter = AdaptiveWaiter(self.navigation_stats, get_wait_strategy())
+        # Chrome profile of the running driver, removed when it quits
+        self.profile_dir: Optional[str] = None
+
+    @abstractmethod
+    def capture_pages(self, emit: PageEmitter) -> None:
+        """Navigate the source and hand every captured page to emit as soon as it is available."""
+        raise NotImplementedError("Subclasses must implement this method.")
 
     @abstractmethod
-    def get_page_sources(self) -> List[Generator[Dict[str, Any], None, None]]:
+    def parse_page(self, page: CapturedPage) -> List[Dict[str, Any]]:
         raise NotImplementedError("Subclasses must implement this method.")
 
+    def get_page_sources(self) -> Generator[List[Dict[str, Any]], None, None]:
+        """Stream the parsed products page by page while the capture keeps navigating."""
+        drop_duplicates = self._duplicate_row_filter()
+        pages = self._build_pipeline(self._timed_parse_page).run(self._timed_capture_pages)
+        return (drop_duplicates(rows) for rows in pages if not isinstance(rows, CategoryEnd))
+
+    def get_grouped_page_sources(
+        self,
+    ) -> Generator[Tuple[str, Union[List[Dict[str, Any]], CategoryEnd]], None, None]:
+        """Like get_page_sources, with every page tagged with its top-level category and the CategoryEnd markers."""
+        drop_duplicates = self._duplicate_row_filter()
+        pages = self._build_pipeline(self._parse_grouped_page).run(self._timed_capture_pages)
+        return (
+            (page.group, page) if isinstance(page, CategoryEnd) else (page[0], drop_duplicates(page[1]))
+            for page in pages
+        )
+
+    def is_category_completed(self, category_name: str) -> bool:
+        if category_name in self.completed_categories:
+            logger.info(f"Skipping category completed by a previous attempt: {category_name}")
+            return True
+        return False
+
+    @staticmethod
+    def end_category(emit: PageEmitter, category_name: str, completed: bool) -> None:
+        """Mark the end of a top-level category, completed only when none of its pages failed or was skipped."""
+        if not completed:
+            logger.warning(f"Category {category_name} was not captured completely")
+        emit(CategoryEnd(category_name, completed))
+
+    def _duplicate_row_filter(self) -> Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """Drops rows already produced in this run. Called on the consumer side, in capture order."""
+        ignored_columns = (DATE_COLUMN, *self.PROVENANCE_COLUMNS)
+        deduplicator = get_row_deduplicator(self.RETAILER, self.OUTPUT_SCHEMA.names, ignored_columns)
+        if deduplicator is None:
+            return lambda rows: rows
+
+        def drop_duplicates(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            unique = deduplicator.filter(rows)
+            self.metrics.record_duplicates(len(rows) - len(unique))
+            return unique
+
+        return drop_duplicates
+
+    def _parse_grouped_page(self, page: CapturedPage) -> Tuple[str, List[Dict[str, Any]]]:
+        return page.group, self._timed_parse_page(page)
+
+    def _timed_parse_page(self, page: CapturedPage) -> List[Dict[str, Any]]:
+        start = time.monotonic()
+        rows = self.parse_page(page)
+        self.metrics.record_parse(page, time.monotonic() - start, len(rows))
+        return rows
+
+    def _timed_capture_pages(self, emit: PageEmitter) -> None:
+        """capture_pages, recording the time spent capturing every page (not the time emit blocks on a full queue)."""
+        captured_since = time.monotonic()
+
+        def timed_emit(page: Union[CapturedPage, CategoryEnd]) -> None:
+            nonlocal captured_since
+            if isinstance(page, CategoryEnd):
+                emit(page)
+                return
+            self.metrics.record_capture(page, time.monotonic() - captured_since)
+            emit(page)
+            captured_since = time.monotonic()
+
+        recorder = get_page_recorder(self)
+        if recorder is None:
+            self.capture_pages(timed_emit)
+            return
+        try:
+            self.capture_pages(recorder.wrap(timed_emit))
+        finally:
+            recorder.close()
+
+    @staticmethod
+    def _build_pipeline(parse_fn: Callable[[CapturedPage], Any]) -> PagePipeline:
+        return PagePipeline(
+            parse_fn,
+            workers=int(os.getenv("PARSE_WORKERS", DEFAULT_PARSE_WORKERS)),
+            max_pending=int(os.getenv("MAX_PENDING_PAGES", DEFAULT_MAX_PENDING_PAGES)),
+        )
+
+    def is_onboarded(self, driver: webdriver.Chrome) -> bool:
+        """Whether the open page is past the onboarding flow, so a restored session can skip it."""
+        return False
+
+    def restore_session(self, driver: webdriver.Chrome) -> bool:
+        """Restore the session saved by a previous run into the open site. Returns True if onboarding can be skipped."""
+        session = get_browser_session(self.RETAILER)
+        if session is None or not session.restore(driver):
+            return False
+        with self.navigation_stats.timed("load", "session restore"):
+            driver.refresh()
+        if self.is_onboarded(driver):
+            logger.info("Restored browser session is valid, skipping onboarding")
+            return True
+        logger.info("Restored browser session is no longer valid, onboarding again")
+        with self.navigation_stats.timed("load", "session discard"):
+            session.discard(driver)
+        return False
+
+    def save_session(self, driver: webdriver.Chrome) -> None:
+        session = get_browser_session(self.RETAILER)
+        if session is None:
+            return
+        try:
+            session.save(driver)
+        except Exception as e:
+            logger.warning(f"Failed to save the browser session: {e}")
+
+    def navigate(self, driver: webdriver.Chrome, url: str) -> None:
+        with self.navigation_stats.timed("load", url):
+            driver.get(url)
+
     @staticmethod
-    def initialize_driver() -> webdriver.Chrome:
+    def initialize_driver(
+        blocked_url_patterns: Sequence[str] = (), user_data_dir: Optional[str] = None
+    ) -> webdriver.Chrome:
+        """Start headless Chrome. Port 0 and a profile per driver let several extraction processes run at once."""
         chrome_options = Options()
         chrome_options.add_argument("--headless=new")
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--remote-debugging-port=9222")
+        chrome_options.add_argument("--remote-debugging-port=0")
+        if user_data_dir:
+            chrome_options.add_argument(f"--user-data-dir={user_data_dir}")
         chrome_options.add_argument("--window-size=1920,1080")
         chrome_options.add_argument("--disable-blink-features=AutomationControlled")
         chrome_options.add_argument("--blink-settings=imagesEnabled=false")
@@ -61,8 +228,21 @@ class Extractor(metaclass=ABCMeta):
             "Page.addScriptToEvaluateOnNewDocument",
             {"source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"},
         )
+        block_urls(driver, list(blocked_url_patterns))
         return driver
 
+    def start_driver(self) -> webdriver.Chrome:
+        self.profile_dir = tempfile.mkdtemp(prefix=f"chrome-{self.RETAILER}-")
+        return self.initialize_driver(get_blocked_url_patterns(self.BLOCKED_URL_PATTERNS), self.profile_dir)
+
+    def quit_driver(self, driver: webdriver.Chrome) -> None:
+        try:
+            driver.quit()
+        finally:
+            if self.profile_dir is not None:
+                shutil.rmtree(self.profile_dir, ignore_errors=True)
+                self.profile_dir = None
+
     @staticmethod
     def upload_to_gcs(local_file_path: str, bucket_name: str, destination_blob_name: str):
         logger.info(
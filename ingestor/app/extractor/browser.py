@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import time
+from collections import Counter
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+logger = logging.getLogger(__name__)
+
+BLOCK_RESOURCES_ENV = "BLOCK_RESOURCES"
+EXTRA_BLOCKED_URLS_ENV = "EXTRA_BLOCKED_URLS"
+BROWSER_SESSION_DIR_ENV = "BROWSER_SESSION_DIR"
+BROWSER_SESSION_MAX_AGE_ENV = "BROWSER_SESSION_MAX_AGE_HOURS"
+DEFAULT_BROWSER_SESSION_MAX_AGE_HOURS = 24
+WAIT_STRATEGY_ENV = "WAIT_STRATEGY"
+ADAPTIVE_WAITS = "adaptive"
+FIXED_WAITS = "fixed"
+WAIT_STRATEGIES = (ADAPTIVE_WAITS, FIXED_WAITS)
+
+# Outcomes of an optional wait
+WAIT_PRESENT = "present"  # the element appeared
+WAIT_SETTLED = "settled"  # the page finished rendering without it
+WAIT_TIMED_OUT = "timeout"  # neither happened within the timeout
+
+# Milliseconds since the DOM last changed. A MutationObserver is installed on the first call for every document.
+DOM_QUIET_MS_SCRIPT = """
+if (document.readyState !== "complete") { return 0; }
+if (window.__lastMutationAt === undefined) {
+    window.__lastMutationAt = performance.now();
+    new MutationObserver(function () { window.__lastMutationAt = performance.now(); })
+        .observe(document, {childList: true, subtree: true, attributes: true});
+}
+return performance.now() - window.__lastMutationAt;
+"""
+
+# Images and media (imagesEnabled=false stops decoding, not every fetch: CSS backgrounds, preloads), then web fonts
+BLOCKED_EXTENSIONS = (
+    *("png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "mp4", "webm"),
+    *("woff", "woff2", "ttf", "otf", "eot"),
+)
+# Analytics, tag managers and ads
+BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googleadservices.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "connect.facebook.net",
+    "hotjar.com",
+    "clarity.ms",
+    "bat.bing.com",
+    "criteo.com",
+    "criteo.net",
+)
+
+# Resources no extractor reads: the scrapers only need the DOM and the scripts rendering it. Patterns use the
+# Network.setBlockedURLs wildcard syntax, matched against the whole URL ("*" matches any run of characters).
+COMMON_BLOCKED_URL_PATTERNS: Tuple[str, ...] = (
+    *(pattern for ext in BLOCKED_EXTENSIONS for pattern in (f"*.{ext}", f"*.{ext}?*")),
+    *(f"*://*{host}/*" for host in BLOCKED_HOSTS),
+)
+
+
+def is_resource_blocking_enabled() -> bool:
+    value = os.getenv(BLOCK_RESOURCES_ENV, "on").strip().lower()
+    if value not in ("on", "off"):
+        raise ValueError(f"Unsupported {BLOCK_RESOURCES_ENV} value: {value}. Supported values are ('on', 'off').")
+    return value == "on"
+
+
+def get_blocked_url_patterns(retailer_patterns: Iterable[str] = ()) -> List[str]:
+    """Common patterns, then the retailer's own, then any from EXTRA_BLOCKED_URLS (comma separated)."""
+    if not is_resource_blocking_enabled():
+        return []
+    extra = [pattern.strip() for pattern in os.getenv(EXTRA_BLOCKED_URLS_ENV, "").split(",") if pattern.strip()]
+    # dict.fromkeys keeps the first occurrence of every pattern in order
+    return list(dict.fromkeys([*COMMON_BLOCKED_URL_PATTERNS, *retailer_patterns, *extra]))
+
+
+def block_urls(driver: webdriver.Chrome, patterns: List[str]) -> None:
+    """Make Chrome fail matching requests before they are sent, for every page the driver loads from now on."""
+    if not patterns:
+        return
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    logger.info(f"Blocking {len(patterns)} URL patterns in the browser")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of values (which must not be empty)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class NavigationStats:
+    """Durations of the browser phases of a crawl, e.g. "load" for driver.get and "ready" for the content wait."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.samples[phase].append(seconds)
+
+    @contextmanager
+    def timed(self, phase: str, target: str = "") -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - start
+            self.record(phase, seconds)
+            logger.debug(f"Navigation {phase} took {seconds:.2f}s {target}".rstrip())
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            phase: {
+                "navigations": len(values),
+                "total_seconds": round(sum(values), 2),
+                "mean_seconds": round(sum(values) / len(values), 3),
+                "p95_seconds": round(percentile(values, 0.95), 3),
+                "max_seconds": round(max(values), 3),
+            }
+            for phase, values in self.samples.items()
+            if values
+        }
+
+    def log_summary(self) -> None:
+        for phase, stats in self.summary().items():
+            logger.info(
+                f"Navigation {phase}: {stats['navigations']} in {stats['total_seconds']}s "
+                f"(mean {stats['mean_seconds']}s, p95 {stats['p95_seconds']}s, max {stats['max_seconds']}s)",
+                extra={"navigation_phase": phase, **stats},
+            )
+
+
+def get_wait_strategy() -> str:
+    strategy = os.getenv(WAIT_STRATEGY_ENV, ADAPTIVE_WAITS).strip().lower()
+    if strategy not in WAIT_STRATEGIES:
+        raise ValueError(f"Unsupported wait strategy: {strategy}. Supported strategies are {WAIT_STRATEGIES}.")
+    return strategy
+
+
+class AdaptiveWaiter:
+    """Waits for elements a page may legitimately not have (pagination, subcategory links).
+
+    A fixed wait pays its whole timeout on every page without the element. Here the wait also ends once the page has
+    settled: the document is loaded and its DOM has not changed for quiet_seconds. Only settling ends a wait early;
+    while the DOM keeps changing the wait goes on up to the ceiling, as the element may still be rendered. When
+    settling counts is learned per wait name: never before its floor, min_timeout or the fastest appearance ever
+    observed, and after min_samples appearances not before margin times their p95 either, so a page that is quiet
+    while its content is still loading is not given up on sooner than it usually renders. With the fixed strategy, or
+    when the settle check fails in the browser, every wait is a plain WebDriverWait for the ceiling.
+    """
+
+    def __init__(
+        self,
+        stats: NavigationStats,
+        strategy: str = ADAPTIVE_WAITS,
+        quiet_seconds: float = 0.5,
+        min_timeout: float = 0.5,
+        min_samples: int = 5,
+        margin: float = 2.0,
+        poll_frequency: float = 0.1,
+    ):
+        self.stats = stats
+        self.adaptive = strategy == ADAPTIVE_WAITS
+        self.quiet_seconds = quiet_seconds
+        self.min_timeout = min_timeout
+        self.min_samples = min_samples
+        self.margin = margin
+        self.poll_frequency = poll_frequency
+        self.outcomes: Dict[str, Counter] = defaultdict(Counter)
+        self.appear_seconds: Dict[str, List[float]] = defaultdict(list)
+
+    def floor_for(self, name: str) -> float:
+        samples = self.appear_seconds[name]
+        return max(self.min_timeout, min(samples)) if samples else self.min_timeout
+
+    def settle_after(self, name: str, ceiling: float) -> float:
+        """Seconds into a wait after which a settled page without the element ends it."""
+        samples = self.appear_seconds[name]
+        if len(samples) < self.min_samples:
+            return min(ceiling, self.floor_for(name))
+        return min(ceiling, max(self.floor_for(name), percentile(samples, 0.95) * self.margin))
+
+    def wait_for_optional(self, driver: webdriver.Chrome, selector: str, name: str, ceiling: float) -> bool:
+        """Wait for selector to match, up to ceiling seconds. Returns whether it did."""
+        start = time.monotonic()
+        try:
+            outcome = WebDriverWait(driver, ceiling, poll_frequency=self.poll_frequency).until(
+                self._present_or_settled(selector, settle_after=start + self.settle_after(name, ceiling))
+            )
+        except TimeoutException:
+            outcome = WAIT_TIMED_OUT
+        except WebDriverException as e:
+            logger.debug(f"Wait for {name} failed in the browser, falling back to a fixed wait: {e}")
+            outcome = self._wait_for_presence(driver, selector, ceiling - (time.monotonic() - start))
+        seconds = time.monotonic() - start
+
+        self.outcomes[name][outcome] += 1
+        self.stats.record(f"wait {name}", seconds)
+        if outcome == WAIT_PRESENT:
+            self.appear_seconds[name].append(seconds)
+        logger.debug(f"Wait for {name}: {outcome} after {seconds:.2f}s")
+        return outcome == WAIT_PRESENT
+
+    def _present_or_settled(self, selector: str, settle_after: float) -> Callable[[webdriver.Chrome], str | bool]:
+        quiet_ms = self.quiet_seconds * 1000
+
+        def condition(driver: webdriver.Chrome) -> str | bool:
+            if driver.find_elements(By.CSS_SELECTOR, selector):
+                return WAIT_PRESENT
+            if (
+                self.adaptive
+                and time.monotonic() >= settle_after
+                and driver.execute_script(DOM_QUIET_MS_SCRIPT) >= quiet_ms
+            ):
+                return WAIT_SETTLED
+            return False
+
+        return condition
+
+    def _wait_for_presence(self, driver: webdriver.Chrome, selector: str, timeout: float) -> str:
+        """The fixed wait: the selector matching within timeout, with browser errors counted as a timeout."""
+        try:
+            WebDriverWait(driver, max(0.0, timeout), poll_frequency=self.poll_frequency).until(
+                lambda d: d.find_elements(By.CSS_SELECTOR, selector)
+            )
+            return WAIT_PRESENT
+        except WebDriverException:
+            return WAIT_TIMED_OUT
+
+    def log_summary(self) -> None:
+        for name, outcomes in self.outcomes.items():
+            counts = ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items()))
+            appeared = self.appear_seconds[name]
+            p95 = f", p95 until present {percentile(appeared, 0.95):.2f}s" if appeared else ""
+            logger.info(f"Wait for {name}: {counts}{p95}")
+
+
+# Keys WebDriver accepts back in add_cookie
+COOKIE_FIELDS = ("name", "value", "path", "domain", "secure", "httpOnly", "expiry", "sameSite")
+
+
+def get_browser_session(retailer: str) -> Optional[BrowserSession]:
+    session_dir = os.getenv(BROWSER_SESSION_DIR_ENV, "").strip()
+    if not session_dir:
+        return None
+    max_age_hours = float(os.getenv(BROWSER_SESSION_MAX_AGE_ENV, DEFAULT_BROWSER_SESSION_MAX_AGE_HOURS))
+    return BrowserSession(os.path.join(session_dir, f"{retailer}.json"), max_age_hours * 3600)
+
+
+class BrowserSession:
+    """Cookies and localStorage of a retailer's site saved after onboarding (consent, postal code).
+
+    Restoring them into a fresh browser lets a later run, or another worker, start scraping without going through the
+    onboarding flow again. A saved session older than max_age_seconds is not restored.
+    """
+
+    def __init__(self, path: str, max_age_seconds: float):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+
+    def restore(self, driver: webdriver.Chrome) -> bool:
+        """Load the saved state into the site currently open in driver. Reload the page for it to take effect."""
+        state = self._read()
+        if state is None:
+            return False
+        age_seconds = time.time() - state["saved_at"]
+        if age_seconds > self.max_age_seconds:
+            logger.info(f"Saved browser session is {age_seconds / 3600:.1f}h old, not restoring it")
+            return False
+
+        restored = 0
+        for cookie in state["cookies"]:
+            try:
+                driver.add_cookie({field: cookie[field] for field in COOKIE_FIELDS if field in cookie})
+                restored += 1
+            except Exception as e:
+                # Cookies of other domains (third parties) cannot be set from this page
+                logger.debug(f"Could not restore cookie {cookie.get('name')}: {e}")
+        driver.execute_script(
+            "for (const [key, value] of Object.entries(arguments[0])) { localStorage.setItem(key, value); }",
+            state["local_storage"],
+        )
+        logger.info(f"Restored browser session: {restored} cookies, {len(state['local_storage'])} localStorage keys")
+        return True
+
+    def save(self, driver: webdriver.Chrome) -> None:
+        state = {
+            "saved_at": time.time(),
+            "url": driver.current_url,
+            "cookies": driver.get_cookies(),
+            "local_storage": driver.execute_script("return Object.assign({}, window.localStorage);"),
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Saved browser session to {self.path}")
+
+    def discard(self, driver: webdriver.Chrome) -> None:
+        """Delete the saved state, and the restored cookies and localStorage from the site open in driver."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        driver.delete_all_cookies()
+        driver.execute_script("localStorage.clear();")
+        driver.refresh()
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable browser session {self.path}: {e}")
+            return None
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import itertools
 import logging
 from typing import Any
 from typing import Dict
@@ -12,9 +11,21 @@ from urllib.parse import urljoin
 from urllib.parse import urlparse
 from urllib.parse import urlunparse
 
+import pyarrow as pa
 import requests as http_requests
-from bs4 import BeautifulSoup
 from extractor import Extractor
+from extractor.html_parser import CssSelector
+from extractor.html_parser import Document
+from extractor.html_parser import Node
+from extractor.html_parser import node_attr
+from extractor.html_parser import node_parent
+from extractor.html_parser import node_tag
+from extractor.html_parser import node_text
+from extractor.html_parser import parse_html
+from extractor.http_cache import CachedFetch
+from extractor.http_cache import get_http_cache
+from pipeline import CapturedPage
+from pipeline import PageEmitter
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
@@ -24,13 +35,35 @@ from timing import timed_phase
 logger = logging.getLogger(__name__)
 
 SKIP_CATEGORIES = {"Mis productos", "Ofertas"}
-
-
-def get_carr_image_url(product_soup: BeautifulSoup) -> Optional[str]:
-    image = product_soup.find("img", class_="product-card__image")
-    if not image:
-        return None
-    src = image.get("src")
+# Present in server-rendered category pages, missing when products are rendered client-side
+SSR_PRODUCT_MARKER = "product-card__parent"
+
+CARD_SELECTOR = CssSelector("div.product-card__parent")
+CARD_TITLE_LINK_SELECTOR = CssSelector("h2.product-card__title a.product-card__title-link")
+CARD_STRIKETHROUGH_PRICE_SELECTOR = CssSelector("span.product-card__price--strikethrough")
+CARD_CURRENT_PRICE_SELECTOR = CssSelector("span.product-card__price--current")
+CARD_PRICE_SELECTOR = CssSelector("span.product-card__price")
+CARD_PRICE_PER_UNIT_SELECTOR = CssSelector("span.product-card__price-per-unit")
+CARD_IMAGE_SELECTOR = CssSelector("img.product-card__image")
+PAGINATION_NEXT_NODE_SELECTOR = CssSelector(".pagination__next")
+
+OUTPUT_SCHEMA = pa.schema(
+    [
+        ("name", pa.string()),
+        ("original_price", pa.string()),
+        ("discount_price", pa.string()),
+        ("price_per_unit", pa.string()),
+        ("category", pa.string()),
+        ("image_url", pa.string()),
+        ("product_url", pa.string()),
+        ("source_page", pa.string()),
+        ("date", pa.string()),
+    ]
+)
+
+
+def get_carr_image_url(product_soup: Node) -> Optional[str]:
+    src = node_attr(CARD_IMAGE_SELECTOR.select_one(product_soup), "src")
     if not src or not isinstance(src, str):
         return None
     parsed = urlparse(src.strip())
@@ -40,36 +73,34 @@ def get_carr_image_url(product_soup: BeautifulSoup) -> Optional[str]:
 
 
 def extract_carr_product_data(
-    page_source: str, category: str, base_url: str = "", source_page: str = ""
+    page_source: str | Document, category: str, base_url: str = "", source_page: str = ""
 ) -> Generator[Dict[str, Any], None, None]:
     logger.info(f"Extracting Carrefour product data for category: {category}")
-    if not page_source:
+    if page_source is None or (isinstance(page_source, str) and not page_source):
         return
 
-    soup = BeautifulSoup(page_source, "html.parser")
-    products = soup.find_all("div", class_="product-card__parent")
+    doc = parse_html(page_source)
+    products = CARD_SELECTOR.select(doc)
 
     for product in products:
-        title_link = product.select_one("h2.product-card__title a.product-card__title-link")
-        if not title_link:
+        title_link = CARD_TITLE_LINK_SELECTOR.select_one(product)
+        if title_link is None:
             continue
-        name = title_link.text.strip()
+        name = node_text(title_link)
 
-        strikethrough = product.select_one("span.product-card__price--strikethrough")
-        current_price = product.select_one("span.product-card__price--current")
+        strikethrough = CARD_STRIKETHROUGH_PRICE_SELECTOR.select_one(product)
+        current_price = CARD_CURRENT_PRICE_SELECTOR.select_one(product)
 
-        if strikethrough and current_price:
-            original_price = strikethrough.text.strip()
-            discount_price = current_price.text.strip()
+        if strikethrough is not None and current_price is not None:
+            original_price = node_text(strikethrough)
+            discount_price = node_text(current_price)
         else:
-            price_el = product.select_one("span.product-card__price")
-            original_price = price_el.text.strip() if price_el else None
+            original_price = node_text(CARD_PRICE_SELECTOR.select_one(product))
             discount_price = None
 
-        price_per_unit_el = product.select_one("span.product-card__price-per-unit")
-        price_per_unit = price_per_unit_el.text.strip() if price_per_unit_el else None
+        price_per_unit = node_text(CARD_PRICE_PER_UNIT_SELECTOR.select_one(product))
 
-        href = title_link.get("href")
+        href = node_attr(title_link, "href")
         product_url = (base_url + href) if href else None
 
         yield {
@@ -85,18 +116,28 @@ def extract_carr_product_data(
 
 
 class CarrExtractor(Extractor):
+    OUTPUT_SCHEMA = OUTPUT_SCHEMA
+    RETAILER = "carr"
+    PROVENANCE_COLUMNS = ("source_page",)
     WAIT_TIMEOUT = 10
     COOKIES_BUTTON_ID = "onetrust-reject-all-handler"
+    # Set by the consent banner once answered; while present the banner is not shown again
+    CONSENT_COOKIE_NAME = "OptanonAlertBoxClosed"
     CATEGORY_LINK_SELECTOR = ".nav-first-level-categories__slide a"
     SUBCATEGORY_LINK_SELECTOR = ".nav-second-level-categories__slide a"
     PRODUCT_CARD_SELECTOR = ".product-card__parent"
     PAGINATION_NEXT_SELECTOR = ".pagination__next"
     PAGINATION_SELECTOR = ".pagination"
+    # Upper bound of the waits for elements not every page has
+    OPTIONAL_WAIT_TIMEOUT = 2
+    # Product images are read from the markup, never displayed
+    BLOCKED_URL_PATTERNS = ("*://static.carrefour.es/hd_*",)
 
     def __init__(self, data_source_url: str, bucket_name: str, break_early: bool = False, is_test_mode: bool = False):
         super().__init__(data_source_url, bucket_name, break_early, is_test_mode)
         parsed = urlparse(data_source_url)
         self.base_url = f"{parsed.scheme}://{parsed.netloc}"
+        self.http_cache = get_http_cache()
 
     def accept_cookies(self, driver: webdriver.Chrome):
         logger.info("Rejecting cookies on Carrefour (looking for 'Reject All' button)")
@@ -111,6 +152,9 @@ class CarrExtractor(Extractor):
         except Exception as e:
             logger.info(f"No 'Reject All' cookies consent dialog found or error: {e}")
 
+    def is_onboarded(self, driver: webdriver.Chrome) -> bool:
+        return driver.get_cookie(self.CONSENT_COOKIE_NAME) is not None
+
     def get_category_links(self, driver: webdriver.Chrome) -> List[Tuple[str, str]]:
         """Return (name, href) tuples for top-level categories."""
         logger.info("Waiting for Carrefour category links to load")
@@ -161,13 +205,13 @@ class CarrExtractor(Extractor):
         return session
 
     @staticmethod
-    def _try_requests_fetch(session: http_requests.Session, url: str) -> Optional[str]:
-        """Fetch a page via HTTP and return HTML if product cards are present (SSR), else None."""
+    def _try_requests_fetch(session: http_requests.Session, url: str) -> Optional[http_requests.Response]:
+        """Fetch a page via HTTP and return the response if product cards are present (SSR), else None."""
         try:
             resp = session.get(url, timeout=15)
             resp.raise_for_status()
-            if "product-card__parent" in resp.text:
-                return resp.text
+            if SSR_PRODUCT_MARKER in resp.text:
+                return resp
         except Exception as e:
             logger.debug(f"requests fetch failed for {url}: {e}")
         return None
@@ -183,169 +227,213 @@ class CarrExtractor(Extractor):
         except Exception:
             return None
 
-    def _find_next_page_url_from_html(self, page_source: str) -> Optional[str]:
+    def _find_next_page_url_from_html(self, page: str | Document) -> Optional[str]:
         """Extract the next-page URL from static HTML (for requests-fetched pages)."""
-        soup = BeautifulSoup(page_source, "html.parser")
-        next_span = soup.select_one(self.PAGINATION_NEXT_SELECTOR)
-        if not next_span:
+        next_span = PAGINATION_NEXT_NODE_SELECTOR.select_one(parse_html(page))
+        if next_span is None:
             return None
-        parent = next_span.parent
-        if not parent or parent.name != "a":
+        parent = node_parent(next_span)
+        if parent is None or node_tag(parent) != "a":
             return None
-        href = parent.get("href")
+        href = node_attr(parent, "href")
         if not href:
             return None
         if not href.startswith("http"):
             href = urljoin(self.base_url, href)
         return href
 
-    def get_all_page_sources(self, driver: webdriver.Chrome) -> List[Tuple[str, str]]:
-        """Collect (page_url, page_source) tuples from all paginated pages of the current category."""
-        pages = [(driver.current_url, driver.page_source)]
+    def capture_category_pages(self, driver: webdriver.Chrome, category_label: str, emit: PageEmitter) -> bool:
+        """Hand every paginated page of the current category to emit as soon as it is captured.
+
+        Returns False when a page failed to load and the pagination stopped before the last page.
+        """
+        emit(CapturedPage(category_label, driver.current_url, driver.page_source))
+        pages_captured = 1
+        completed = True
 
         # Find the first next-page URL using Selenium (proven approach)
         next_url = self._find_next_page_url(driver)
         if not next_url:
-            logger.info("Collected 1 page(s) for category (no pagination)")
-            return pages
+            logger.info("Captured 1 page(s) for category (no pagination)")
+            return completed
 
         # Probe SSR: try fetching the next page via requests
         session = self._build_requests_session(driver)
-        probe_html = self._try_requests_fetch(session, next_url)
+        fetched = self._fetch_ssr_page(session, next_url)
 
-        if probe_html is not None:
+        if fetched is not None:
             # SSR confirmed — use requests for all remaining pages
             logger.info("SSR detected, using requests for pagination")
-            pages.append((next_url, probe_html))
-            current_html = probe_html
-
-            # Follow next-page links via HTML parsing
             while True:
-                next_url = self._find_next_page_url_from_html(current_html)
+                next_url = self._emit_ssr_page(fetched, category_label, emit)
+                pages_captured += 1
                 if not next_url:
                     break
-                html = self._try_requests_fetch(session, next_url)
-                if html is None:
+                fetched = self._fetch_ssr_page(session, next_url)
+                if fetched is None:
                     logger.warning(f"SSR fetch failed for {next_url}, stopping pagination")
+                    completed = False
                     break
-                pages.append((next_url, html))
-                current_html = html
         else:
             # CSR fallback — use Selenium for all pagination (original approach)
             logger.info("CSR detected, using Selenium for pagination")
             while next_url:
                 try:
                     logger.info(f"Navigating to next page: {next_url}")
-                    driver.get(next_url)
-                    WebDriverWait(driver, self.WAIT_TIMEOUT).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, self.PRODUCT_CARD_SELECTOR))
-                    )
-                    pages.append((driver.current_url, driver.page_source))
+                    self.navigate(driver, next_url)
+                    with self.navigation_stats.timed("ready", next_url):
+                        WebDriverWait(driver, self.WAIT_TIMEOUT).until(
+                            EC.presence_of_element_located((By.CSS_SELECTOR, self.PRODUCT_CARD_SELECTOR))
+                        )
+                    emit(CapturedPage(category_label, driver.current_url, driver.page_source))
+                    pages_captured += 1
                     next_url = self._find_next_page_url(driver)
                 except Exception:
                     logger.warning(f"Failed to load page {next_url}, stopping pagination")
+                    completed = False
                     break
 
-        logger.info(f"Collected {len(pages)} page(s) for category")
-        return pages
+        logger.info(f"Captured {pages_captured} page(s) for category")
+        return completed
+
+    def _fetch_ssr_page(self, session: http_requests.Session, url: str) -> Optional[CachedFetch]:
+        """Fetch a page via HTTP, conditionally when the HTTP cache is enabled. None if it is not SSR."""
+        if self.http_cache is None:
+            resp = self._try_requests_fetch(session, url)
+            return None if resp is None else CachedFetch(url, resp.text, "", False, {}, len(resp.content))
+        try:
+            fetched = self.http_cache.fetch(session, url, timeout=15)
+        except Exception as e:
+            logger.debug(f"requests fetch failed for {url}: {e}")
+            return None
+        return fetched if SSR_PRODUCT_MARKER in fetched.text else None
+
+    def _emit_ssr_page(self, fetched: CachedFetch, category_label: str, emit: PageEmitter) -> Optional[str]:
+        """Emit a requests-fetched page and return its next-page URL.
+
+        A page unchanged since a cached parse is emitted with its rows and is not parsed at all. Otherwise the
+        document is parsed once: the next-page link is read here and the products by the parse workers. The link is
+        read before emitting so the document is never used by two threads at once.
+        """
+        cache_key = None
+        if self.http_cache is not None:
+            cache_key = self.http_cache.rows_key(fetched, category_label)
+            if fetched.unchanged and "next_url" in fetched.entry:
+                rows = self.http_cache.load_rows(cache_key)
+                if rows is not None:
+                    emit(CapturedPage(category_label, fetched.url, None, rows=rows, size=fetched.size))
+                    return fetched.entry["next_url"]
+
+        page = parse_html(fetched.text)
+        next_url = self._find_next_page_url_from_html(page)
+        if self.http_cache is not None:
+            self.http_cache.remember_next_url(fetched, next_url)
+        emit(CapturedPage(category_label, fetched.url, page, cache_key=cache_key, size=fetched.size))
+        return next_url
+
+    def parse_page(self, page: CapturedPage) -> List[Dict[str, Any]]:
+        if page.rows is not None:
+            return page.rows
+        rows = list(extract_carr_product_data(page.source, page.category, self.base_url, page.url))
+        if page.cache_key and self.http_cache is not None:
+            self.http_cache.store_rows(page.cache_key, rows)
+        return rows
 
     def _wait_for_products(self, driver: webdriver.Chrome, label: str) -> bool:
         """Wait for product cards to appear. Returns True if products found."""
+        with self.navigation_stats.timed("ready", label):
+            return self._wait_for_product_list(driver, label)
+
+    def _wait_for_product_list(self, driver: webdriver.Chrome, label: str) -> bool:
         try:
             WebDriverWait(driver, self.WAIT_TIMEOUT).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, self.PRODUCT_CARD_SELECTOR))
             )
             # Wait for the full product list to render (pagination appears once all products load).
-            # Categories with fewer than 24 products may not have pagination; ignore the timeout.
-            try:
-                WebDriverWait(driver, 2).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, self.PAGINATION_SELECTOR))
-                )
-            except Exception:
-                pass
+            # Categories with fewer than 24 products may not have pagination, so the page settling also ends the wait.
+            self.waiter.wait_for_optional(driver, self.PAGINATION_SELECTOR, "pagination", self.OPTIONAL_WAIT_TIMEOUT)
             return True
         except Exception:
             logger.warning(f"No product cards found for {label} within timeout")
             self.save_debug_html(driver, f"carr_no_products_{label}")
             return False
 
-    def _extract_products_from_current_page(
-        self, driver: webdriver.Chrome, category_label: str
-    ) -> Generator[Dict[str, Any], None, None]:
-        """Collect all paginated pages and return a chained product generator."""
-        pages = self.get_all_page_sources(driver)
-        return itertools.chain.from_iterable(
-            extract_carr_product_data(page_source, category_label, self.base_url, page_url)
-            for page_url, page_source in pages
-        )
-
     @timed_phase("extraction")
-    def get_page_sources(self) -> List[Generator[Dict[str, Any], None, None]]:
+    def capture_pages(self, emit: PageEmitter) -> None:
         logger.info("Getting Carrefour page content")
-        driver = self.initialize_driver()
+        driver = self.start_driver()
 
         try:
-            driver.get(self.data_source_url)
+            self.navigate(driver, self.data_source_url)
             if self.is_test_mode:
                 self.save_debug_html(driver, "carr_initial_load")
 
-            try:
-                self.accept_cookies(driver)
-            except Exception as e:
-                logger.warning(f"Cookie handling failed: {e}")
+            if not self.restore_session(driver):
+                try:
+                    self.accept_cookies(driver)
+                except Exception as e:
+                    logger.warning(f"Cookie handling failed: {e}")
+                self.save_session(driver)
 
             if self.is_test_mode:
                 self.save_debug_html(driver, "carr_after_cookies")
 
             categories = self.get_category_links(driver)
-            product_gen_list = []
+            categories_captured = 0
             stop = False
 
             for category_name, category_href in categories:
+                if self.is_category_completed(category_name):
+                    continue
+                completed = False
                 try:
                     logger.info(f"Navigating to category: {category_name} ({category_href})")
-                    driver.get(category_href)
+                    self.navigate(driver, category_href)
 
                     # Check for subcategories before waiting for products
-                    try:
-                        WebDriverWait(driver, 2).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, self.SUBCATEGORY_LINK_SELECTOR))
-                        )
-                    except Exception:
-                        pass
+                    self.waiter.wait_for_optional(
+                        driver, self.SUBCATEGORY_LINK_SELECTOR, "subcategories", self.OPTIONAL_WAIT_TIMEOUT
+                    )
 
                     subcategories = self.get_subcategory_links(driver)
 
                     if subcategories:
-                        for subcat_name, subcat_href in subcategories:
+                        completed = True
+                        for index, (subcat_name, subcat_href) in enumerate(subcategories):
                             category_label = f"{category_name} > {subcat_name}"
                             logger.info(f"Navigating to subcategory: {category_label} ({subcat_href})")
-                            driver.get(subcat_href)
+                            self.navigate(driver, subcat_href)
 
                             if not self._wait_for_products(driver, category_label):
+                                completed = False
                                 continue
 
-                            product_gen_list.append(self._extract_products_from_current_page(driver, category_label))
+                            completed = self.capture_category_pages(driver, category_label, emit) and completed
+                            categories_captured += 1
 
                             if self.break_early:
                                 logger.info("Break-early mode: stopping after the first subcategory")
+                                completed = completed and index == len(subcategories) - 1
                                 stop = True
                                 break
-                    else:
-                        if not self._wait_for_products(driver, category_name):
-                            continue
-
-                        product_gen_list.append(self._extract_products_from_current_page(driver, category_name))
+                    elif self._wait_for_products(driver, category_name):
+                        completed = self.capture_category_pages(driver, category_name, emit)
+                        categories_captured += 1
 
                 except Exception as e:
                     logger.error(f"Failed to extract category {category_name}: {e}")
                     self.save_debug_html(driver, f"carr_category_error_{category_name}")
 
+                self.end_category(emit, category_name, completed)
                 if stop or self.break_early:
                     break
 
-            logger.info(f"Extracted {len(product_gen_list)} Carrefour product data generators")
-            return product_gen_list
+            logger.info(f"Captured pages for {categories_captured} Carrefour categories")
+            if self.http_cache is not None:
+                self.http_cache.log_stats()
+                self.http_cache.evict()
 
         finally:
-            driver.quit()
+            self.navigation_stats.log_summary()
+            self.waiter.log_summary()
+            self.quit_driver(driver)
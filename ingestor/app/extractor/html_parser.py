@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any
+from typing import List
+from typing import Optional
+from typing import Union
+
+import lxml.html
+from bs4 import BeautifulSoup
+from bs4 import Tag
+from cssselect import GenericTranslator
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+PARSER_BACKEND_ENV = "HTML_PARSER_BACKEND"
+LXML_BACKEND = "lxml"
+BS4_BACKEND = "bs4"
+SUPPORTED_BACKENDS = (LXML_BACKEND, BS4_BACKEND)
+
+Document = Union[lxml.html.HtmlElement, BeautifulSoup]
+Node = Union[lxml.html.HtmlElement, Tag]
+
+_css_translator = GenericTranslator()
+
+
+def get_parser_backend() -> str:
+    backend = os.getenv(PARSER_BACKEND_ENV, LXML_BACKEND).strip().lower()
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Unsupported HTML parser backend: {backend}. Supported backends are {SUPPORTED_BACKENDS}.")
+    return backend
+
+
+def parse_html(page: Union[str, Document], backend: Optional[str] = None) -> Document:
+    """Parse a page once so the same document can be shared by every selector run against it."""
+    if isinstance(page, (lxml.html.HtmlElement, BeautifulSoup)):
+        return page
+    backend = backend or get_parser_backend()
+    if backend == BS4_BACKEND:
+        return BeautifulSoup(page, "html.parser")
+    if not page or not page.strip():
+        return lxml.html.document_fromstring("<html></html>")
+    return lxml.html.document_fromstring(page)
+
+
+def document_html(document: Document) -> str:
+    """Serialize a parsed document back to HTML."""
+    if isinstance(document, lxml.html.HtmlElement):
+        return lxml.html.tostring(document, encoding="unicode")
+    return str(document)
+
+
+class CssSelector:
+    """A CSS selector compiled once to XPath for lxml and handed as-is to BeautifulSoup."""
+
+    def __init__(self, css: str):
+        self.css = css
+        self._xpath = etree.XPath(_css_translator.css_to_xpath(css, prefix="descendant::"))
+
+    def select(self, node: Union[Document, Node]) -> List[Node]:
+        if isinstance(node, lxml.html.HtmlElement):
+            return self._xpath(node)
+        return node.select(self.css)
+
+    def select_one(self, node: Union[Document, Node]) -> Optional[Node]:
+        if isinstance(node, lxml.html.HtmlElement):
+            matches = self._xpath(node)
+            return matches[0] if matches else None
+        return node.select_one(self.css)
+
+    def __repr__(self) -> str:
+        return f"CssSelector({self.css!r})"
+
+
+def node_text(node: Optional[Node]) -> Optional[str]:
+    if node is None:
+        return None
+    if isinstance(node, lxml.html.HtmlElement):
+        return node.text_content().strip()
+    return node.text.strip()
+
+
+def node_attr(node: Optional[Node], name: str) -> Any:
+    if node is None or not hasattr(node, "get"):
+        return None
+    return node.get(name)
+
+
+def node_parent(node: Node) -> Optional[Node]:
+    if isinstance(node, lxml.html.HtmlElement):
+        return node.getparent()
+    return node.parent
+
+
+def node_tag(node: Optional[Node]) -> Optional[str]:
+    if node is None:
+        return None
+    if isinstance(node, lxml.html.HtmlElement):
+        return node.tag
+    return node.name
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+import requests as http_requests
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_DIR_ENV = "HTTP_CACHE_DIR"
+# Bump when the extraction code changes so rows parsed by an older version are not reused
+ROWS_CACHE_VERSION = 1
+# Entries of URLs not fetched for this long are dropped by evict(), and with them their bodies and rows
+ENTRY_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+class CachedFetch(NamedTuple):
+    url: str
+    text: str
+    content_hash: str
+    # True when the body is the same as the previous run's, either from a 304 or an identical 200
+    unchanged: bool
+    entry: Dict[str, Any]
+    # Size in bytes of the body, not in decoded characters
+    size: int
+
+
+def get_http_cache() -> Optional[HttpPageCache]:
+    cache_dir = os.getenv(HTTP_CACHE_DIR_ENV, "").strip()
+    return HttpPageCache(cache_dir) if cache_dir else None
+
+
+def content_hash_of(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _key_of(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class HttpPageCache:
+    """Disk cache making repeated page fetches conditional and their parsing skippable.
+
+    Per URL it keeps the ETag/Last-Modified validators, the hash of the last body and the next-page link found in it.
+    Bodies are stored once per content hash, and parsed rows per (content hash, category, url), so a page that did
+    not change since the previous run is neither downloaded again (304) nor reparsed. Bodies and rows files are named
+    after their content hash, so evict() can drop those no URL entry points to any more.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        for sub_dir in ("entries", "bodies", "rows"):
+            os.makedirs(os.path.join(cache_dir, sub_dir), exist_ok=True)
+
+    def fetch(self, session: http_requests.Session, url: str, timeout: float) -> CachedFetch:
+        entry = self._read_json(self._entry_path(url)) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        resp = session.get(url, headers=headers, timeout=timeout)
+        if resp.status_code == 304:
+            body = self._read_body(entry.get("content_hash"))
+            if body is not None:
+                self._count("not_modified")
+                # The entry is in use even though it is not rewritten, so evict() must not expire it
+                os.utime(self._entry_path(url))
+                return CachedFetch(url, body, entry["content_hash"], True, entry, len(body.encode("utf-8")))
+            logger.info(f"Cached body missing for {url}, fetching it again")
+            resp = session.get(url, timeout=timeout)
+
+        resp.raise_for_status()
+        text = resp.text
+        content_hash = content_hash_of(text)
+        unchanged = entry.get("content_hash") == content_hash
+        self._count("unchanged" if unchanged else "fetched")
+
+        new_entry = {
+            "url": url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "content_hash": content_hash,
+        }
+        if unchanged and "next_url" in entry:
+            new_entry["next_url"] = entry["next_url"]
+        self._write_body(content_hash, text)
+        self._write_json(self._entry_path(url), new_entry)
+        return CachedFetch(url, text, content_hash, unchanged, new_entry, len(resp.content))
+
+    def remember_next_url(self, fetched: CachedFetch, next_url: Optional[str]) -> None:
+        if "next_url" in fetched.entry and fetched.entry["next_url"] == next_url:
+            return
+        self._write_json(self._entry_path(fetched.url), {**fetched.entry, "next_url": next_url})
+
+    @staticmethod
+    def rows_key(fetched: CachedFetch, category: str) -> str:
+        return f"{fetched.content_hash}-{_key_of(str(ROWS_CACHE_VERSION), fetched.content_hash, category, fetched.url)}"
+
+    def load_rows(self, rows_key: str) -> Optional[List[Dict[str, Any]]]:
+        rows = self._read_json(os.path.join(self.cache_dir, "rows", f"{rows_key}.json.gz"), compressed=True)
+        if rows is not None:
+            self._count("rows_reused")
+        return rows
+
+    def store_rows(self, rows_key: str, rows: List[Dict[str, Any]]) -> None:
+        self._write_json(os.path.join(self.cache_dir, "rows", f"{rows_key}.json.gz"), rows, compressed=True)
+
+    def evict(self, max_age_seconds: float = ENTRY_MAX_AGE_SECONDS) -> None:
+        """Delete the bodies and rows of content no URL entry has any more, and entries unused for max_age_seconds.
+
+        A page whose content changed leaves its previous body and rows behind; call this once the run's fetches are
+        done. Rows still being stored belong to the current content, which the entries point to, so they are kept.
+        """
+        referenced = set()
+        expired_before = time.time() - max_age_seconds
+        entries_dir = os.path.join(self.cache_dir, "entries")
+        for name in os.listdir(entries_dir):
+            path = os.path.join(entries_dir, name)
+            entry = self._read_json(path) if name.endswith(".json") else None
+            if entry is None or os.path.getmtime(path) < expired_before:
+                if not name.endswith(".tmp"):
+                    self._remove(path)
+                    self._count("evicted_entries")
+                continue
+            referenced.add(entry.get("content_hash"))
+
+        for sub_dir, suffix in (("bodies", ".html.gz"), ("rows", ".json.gz")):
+            for name in os.listdir(os.path.join(self.cache_dir, sub_dir)):
+                if not name.endswith(suffix):
+                    continue
+                # Rows are named "<content hash>-<key>"; rows named by the key alone predate eviction
+                if name[: -len(suffix)].split("-", 1)[0] not in referenced:
+                    self._remove(os.path.join(self.cache_dir, sub_dir, name))
+                    self._count(f"evicted_{sub_dir}")
+        logger.info(
+            f"HTTP cache eviction: {self.stats['evicted_entries']} entries, {self.stats['evicted_bodies']} bodies and "
+            f"{self.stats['evicted_rows']} rows files deleted"
+        )
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def log_stats(self) -> None:
+        logger.info(
+            f"HTTP cache: {self.stats['fetched']} fetched, {self.stats['not_modified']} not modified, "
+            f"{self.stats['unchanged']} unchanged, {self.stats['rows_reused']} pages reused without parsing"
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _entry_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, "entries", f"{_key_of(url)}.json")
+
+    def _body_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, "bodies", f"{content_hash}.html.gz")
+
+    def _read_body(self, content_hash: Optional[str]) -> Optional[str]:
+        if not content_hash:
+            return None
+        try:
+            with gzip.open(self._body_path(content_hash), "rt", encoding="utf-8") as f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def _write_body(self, content_hash: str, text: str) -> None:
+        path = self._body_path(content_hash)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path: str, compressed: bool = False) -> Any:
+        try:
+            with (gzip.open if compressed else open)(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {path}: {e}")
+            return None
+
+    @staticmethod
+    def _write_json(path: str, data: Any, compressed: bool = False) -> None:
+        # Written to a temporary file first so a crash never leaves a truncated entry behind
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with (gzip.open if compressed else open)(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import Optional
+
+import requests as http_requests
+from extractor import Extractor
+from extractor.merc_extractor import MercExtractor
+from pipeline import CapturedPage
+from pipeline import PageEmitter
+from timing import timed_phase
+
+logger = logging.getLogger(__name__)
+
+API_PATH = "/api"
+CHANGE_POSTAL_CODE_PATH = "/postal-codes/actions/change-pc/"
+CATEGORIES_PATH = "/categories/"
+CATEGORY_DETAIL_PATH = "/categories/{0}/"
+WAREHOUSE_HEADER = "x-customer-wh"
+
+
+def format_api_price(value: Any) -> Optional[str]:
+    """Render an API price ("1.53") the way the storefront shows it ("1,53 €")."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    return f"{value.replace('.', ',')} €"
+
+
+def format_api_number(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    number = float(value)
+    text = str(int(number)) if number.is_integer() else f"{number:g}"
+    return text.replace(".", ",")
+
+
+def format_api_size(product: Dict[str, Any]) -> Optional[str]:
+    """Rebuild the storefront product-format label (e.g. "Paquete 1 kg") from the API fields."""
+    instructions = product.get("price_instructions") or {}
+    unit_size = format_api_number(instructions.get("unit_size"))
+    size_format = instructions.get("size_format")
+    size = " ".join(part for part in (unit_size, size_format) if part)
+    if instructions.get("is_pack") and instructions.get("total_units"):
+        pack = " ".join(str(part) for part in (instructions["total_units"], instructions.get("unit_name")) if part)
+        size = f"{pack} x {size}"
+    label = " ".join(part for part in (product.get("packaging"), size) if part)
+    return label or None
+
+
+def get_api_image_url(product: Dict[str, Any]) -> Optional[str]:
+    thumbnail = product.get("thumbnail")
+    if not thumbnail or not isinstance(thumbnail, str):
+        return None
+    url = thumbnail.strip().split("?")[0]
+    if not url.startswith(("http://", "https://")):
+        return None
+    return url
+
+
+def extract_api_product_data(category_payload: Dict[str, Any], category: str) -> Generator[Dict[str, Any], None, None]:
+    """Yield products from a /categories/<id>/ payload using the same schema as extract_product_data."""
+    logger.info(f"Extracting API product data for category: {category}")
+    for section in category_payload.get("categories") or []:
+        for product in section.get("products") or []:
+            instructions = product.get("price_instructions") or {}
+            previous_price = format_api_price(instructions.get("previous_unit_price"))
+            unit_price = format_api_price(instructions.get("unit_price"))
+            if unit_price is None:
+                continue
+            yield {
+                "name": (product.get("display_name") or "").strip(),
+                "original_price": previous_price or unit_price,
+                "discount_price": unit_price if previous_price else None,
+                "size": format_api_size(product),
+                "category": category,
+                "image_url": get_api_image_url(product),
+            }
+
+
+class MercApiExtractor(Extractor):
+    """Browser-free Mercadona extractor that reads the storefront JSON API directly."""
+
+    OUTPUT_SCHEMA = MercExtractor.OUTPUT_SCHEMA
+    RETAILER = MercExtractor.RETAILER
+    POSTAL_CODE = MercExtractor.POSTAL_CODE
+    DEFAULT_WAREHOUSE = "mad1"
+    LANG = "es"
+    REQUEST_TIMEOUT = 15
+    USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+
+    def __init__(self, data_source_url: str, bucket_name: str, break_early: bool = False, is_test_mode: bool = False):
+        super().__init__(data_source_url, bucket_name, break_early, is_test_mode)
+        self.api_url = data_source_url.rstrip("/") + API_PATH
+        self.warehouse = self.DEFAULT_WAREHOUSE
+
+    def build_session(self) -> http_requests.Session:
+        session = http_requests.Session()
+        session.headers.update({"User-Agent": self.USER_AGENT, "Accept": "application/json"})
+        return session
+
+    def select_warehouse(self, session: http_requests.Session) -> str:
+        """Set the postal code like the onboarding modal does and return the warehouse serving it."""
+        logger.info(f"Selecting warehouse for postal code: {self.POSTAL_CODE}")
+        try:
+            resp = session.put(
+                self.api_url + CHANGE_POSTAL_CODE_PATH,
+                json={"new_postal_code": self.POSTAL_CODE},
+                timeout=self.REQUEST_TIMEOUT,
+            )
+            resp.raise_for_status()
+            warehouse = resp.headers.get(WAREHOUSE_HEADER)
+            if warehouse:
+                logger.info(f"Using warehouse: {warehouse}")
+                return warehouse
+            logger.warning(f"No warehouse header in postal code response, using default: {self.DEFAULT_WAREHOUSE}")
+        except Exception as e:
+            logger.warning(f"Postal code selection failed, using default warehouse {self.DEFAULT_WAREHOUSE}: {e}")
+        return self.DEFAULT_WAREHOUSE
+
+    def fetch(self, session: http_requests.Session, path: str) -> http_requests.Response:
+        resp = session.get(
+            self.api_url + path,
+            params={"lang": self.LANG, "wh": self.warehouse},
+            timeout=self.REQUEST_TIMEOUT,
+        )
+        resp.raise_for_status()
+        return resp
+
+    def parse_page(self, page: CapturedPage) -> List[Dict[str, Any]]:
+        return list(extract_api_product_data(json.loads(page.source), page.category))
+
+    @timed_phase("extraction")
+    def capture_pages(self, emit: PageEmitter) -> None:
+        logger.info("Getting Mercadona API content")
+        session = self.build_session()
+
+        try:
+            self.warehouse = self.select_warehouse(session)
+            main_categories = self.fetch(session, CATEGORIES_PATH).json().get("results") or []
+            logger.info(f"Found {len(main_categories)} main categories")
+
+            pages_captured = 0
+            for main_category in main_categories:
+                category_name = main_category.get("name")
+                if self.is_category_completed(category_name):
+                    continue
+                completed = True
+                for subcategory in main_category.get("categories") or []:
+                    category_label = f"{category_name} > {subcategory.get('name')}"
+                    logger.info(f"Fetching subcategory: {category_label} (id={subcategory.get('id')})")
+                    try:
+                        resp = self.fetch(session, CATEGORY_DETAIL_PATH.format(subcategory.get("id")))
+                    except Exception as e:
+                        logger.error(f"Failed to fetch subcategory {category_label}: {e}")
+                        completed = False
+                        continue
+                    emit(CapturedPage(category_label, resp.url, resp.text))
+                    pages_captured += 1
+
+                self.end_category(emit, category_name, completed)
+                if self.break_early:
+                    logger.info("Break-early mode: stopping after the first category")
+                    break
+
+            logger.info(f"Captured {pages_captured} subcategory payloads")
+
+        finally:
+            session.close()
@@ -7,11 +7,20 @@ from typing import Generator
 from typing import List
 from typing import Optional
 
-from bs4 import BeautifulSoup
+import pyarrow as pa
 from extractor import Extractor
+from extractor.html_parser import CssSelector
+from extractor.html_parser import Document
+from extractor.html_parser import Node
+from extractor.html_parser import node_attr
+from extractor.html_parser import node_text
+from extractor.html_parser import parse_html
+from pipeline import CapturedPage
+from pipeline import PageEmitter
 from selenium import webdriver
 from selenium.common.exceptions import NoSuchElementException
 from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.expected_conditions import presence_of_element_located
@@ -20,10 +29,32 @@ from timing import timed_phase
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_CELL_SELECTOR = CssSelector("div[data-testid='product-cell']")
+PRODUCT_NAME_SELECTOR = CssSelector("h4[data-testid='product-cell-name']")
+PRODUCT_PRICE_SELECTOR = CssSelector("p[data-testid='product-price']")
+PRODUCT_FORMAT_SELECTOR = CssSelector("div.product-format")
+PRODUCT_IMAGE_SELECTOR = CssSelector("img")
+
+OUTPUT_SCHEMA = pa.schema(
+    [
+        ("name", pa.string()),
+        ("original_price", pa.string()),
+        ("discount_price", pa.string()),
+        ("size", pa.string()),
+        ("category", pa.string()),
+        ("image_url", pa.string()),
+        ("date", pa.string()),
+    ]
+)
+
 
 class MercExtractor(Extractor):
+    OUTPUT_SCHEMA = OUTPUT_SCHEMA
+    RETAILER = "merc"
     POSTAL_CODE = "28050"
     WAIT_TIMEOUT = 10
+    # How long a restored session gets to show the categories button before onboarding runs again
+    SESSION_CHECK_TIMEOUT = 5
     COOKIES_BUTTON_XPATH = "//button[contains(text(), 'Aceptar')]"
     POSTAL_CODE_INPUT_BOX_SELECTOR = "[data-testid='postal-code-checker-input']"
     CATEGORY_SELECTOR = ".category-menu__item button span label"
@@ -31,6 +62,8 @@ class MercExtractor(Extractor):
     CATEGORY_BUTTON_SELECTOR_TEMPLATE = "//label[contains(text(), '{0}')]"
     SUBCATEGORY_SELECTOR = "ul li.category-item button"
     SUBCATEGORY_BUTTON_SELECTOR_TEMPLATE = "//button[contains(text(), '{0}')]"
+    # Product images are read from the markup, never displayed
+    BLOCKED_URL_PATTERNS = ("*://prod-mercadona.imgix.net/*",)
 
     def __init__(self, data_source_url: str, bucket_name: str, break_early: bool = False, is_test_mode: bool = False):
         super().__init__(data_source_url, bucket_name, break_early, is_test_mode)
@@ -53,6 +86,16 @@ class MercExtractor(Extractor):
             presence_of_element_located((By.CSS_SELECTOR, self.CATEGORY_BUTTON_SELECTOR))
         )
 
+    def is_onboarded(self, driver: webdriver.Chrome) -> bool:
+        # The categories button only shows once a postal code is set
+        try:
+            WebDriverWait(driver, self.SESSION_CHECK_TIMEOUT).until(
+                presence_of_element_located((By.CSS_SELECTOR, self.CATEGORY_BUTTON_SELECTOR))
+            )
+            return True
+        except TimeoutException:
+            return False
+
     @staticmethod
     def _click_element(by: str, value: str):
         def _attempt(driver):
@@ -94,7 +137,7 @@ class MercExtractor(Extractor):
 
     def extract_page_source_for_subcategory(
         self, driver: webdriver.Chrome, category_name: str, subcategory_name: str, click: bool = True
-    ):
+    ) -> CapturedPage:
         if click:
             logger.info(f"Clicking subcategory: {subcategory_name}")
             subcategory_button = driver.find_element(
@@ -103,25 +146,31 @@ class MercExtractor(Extractor):
             subcategory_button.click()
 
         logger.info(f"Extracting page source for category '{category_name}', subcategory '{subcategory_name}'")
-        WebDriverWait(driver, self.WAIT_TIMEOUT).until(
-            presence_of_element_located((By.CSS_SELECTOR, "[data-testid='product-cell']"))
-        )
-        return extract_product_data(driver.page_source, f"{category_name} > {subcategory_name}")
+        with self.navigation_stats.timed("ready", subcategory_name):
+            WebDriverWait(driver, self.WAIT_TIMEOUT).until(
+                presence_of_element_located((By.CSS_SELECTOR, "[data-testid='product-cell']"))
+            )
+        return CapturedPage(f"{category_name} > {subcategory_name}", driver.current_url, driver.page_source)
+
+    def parse_page(self, page: CapturedPage) -> List[Dict[str, Any]]:
+        return list(extract_product_data(page.source, page.category))
 
     @timed_phase("extraction")
-    def get_page_sources(self) -> List[Generator[Dict[str, Any], None, None]]:
+    def capture_pages(self, emit: PageEmitter) -> None:
         logger.info("Getting page content")
-        driver = self.initialize_driver()
+        driver = self.start_driver()
 
         try:
-            driver.get(self.data_source_url)
-            WebDriverWait(driver, self.WAIT_TIMEOUT).until(
-                presence_of_element_located((By.XPATH, self.COOKIES_BUTTON_XPATH))
-            )
+            self.navigate(driver, self.data_source_url)
 
             try:
-                self.accept_cookies(driver)
-                self.enter_postal_code(driver)
+                if not self.restore_session(driver):
+                    WebDriverWait(driver, self.WAIT_TIMEOUT).until(
+                        presence_of_element_located((By.XPATH, self.COOKIES_BUTTON_XPATH))
+                    )
+                    self.accept_cookies(driver)
+                    self.enter_postal_code(driver)
+                    self.save_session(driver)
                 self.navigate_to_categories(driver)
             except Exception as e:
                 logger.error(f"Exception during initial navigation: {e}")
@@ -130,11 +179,13 @@ class MercExtractor(Extractor):
                 self.save_screenshot(driver, "initial_navigation_error.png")
                 raise
 
-            product_gen_list = []
+            pages_captured = 0
             category_names = self.get_main_categories(driver)
 
             # Iterate over each main category
             for category_name in category_names:
+                if self.is_category_completed(category_name):
+                    continue
                 logger.info(f"Clicking category: {category_name}")
                 try:
                     category_button = driver.find_element(
@@ -150,40 +201,41 @@ class MercExtractor(Extractor):
                         f"Page source snippet: {driver.page_source[:1000]}"
                     )
                     self.save_screenshot(driver, "category_navigation_error.png")
+                    # The subcategories on screen belong to another category
+                    self.end_category(emit, category_name, completed=False)
+                    continue
 
                 # Collect subcategory names for the current category
                 subcategory_names = self.get_subcategories(driver)
 
                 # Get page source for the first subcategory (already loaded)
                 if subcategory_names:
-                    product_gen_list.append(
+                    emit(
                         self.extract_page_source_for_subcategory(
                             driver, category_name, subcategory_names[0], click=False
                         )
                     )
+                    pages_captured += 1
 
                     # For remaining subcategories, click and get page source
                     for subcategory_name in subcategory_names[1:]:
-                        product_gen_list.append(
-                            self.extract_page_source_for_subcategory(driver, category_name, subcategory_name)
-                        )
+                        emit(self.extract_page_source_for_subcategory(driver, category_name, subcategory_name))
+                        pages_captured += 1
 
+                self.end_category(emit, category_name, completed=bool(subcategory_names))
                 if self.break_early:
                     logger.info("Break-early mode: stopping after the first category")
                     break
 
-            logger.info(f"Extracted {len(product_gen_list)} product data generators")
-            return product_gen_list
+            logger.info(f"Captured {pages_captured} subcategory pages")
 
         finally:
-            driver.quit()
+            self.navigation_stats.log_summary()
+            self.quit_driver(driver)
 
 
-def get_image_url(soup: BeautifulSoup) -> Optional[str]:
-    image = soup.find("img")
-    if not image or not hasattr(image, "get"):
-        return None
-    src = image.get("src")
+def get_image_url(soup: Node) -> Optional[str]:
+    src = node_attr(PRODUCT_IMAGE_SELECTOR.select_one(soup), "src")
     if not src or not isinstance(src, str):
         return None
     url = src.strip().split("?")[0]
@@ -192,22 +244,22 @@ def get_image_url(soup: BeautifulSoup) -> Optional[str]:
     return url
 
 
-def extract_product_data(page_source: str, category: str) -> Generator[Dict[str, Any], None, None] | None:
+def extract_product_data(page_source: str | Document, category: str) -> Generator[Dict[str, Any], None, None] | None:
     logger.info(f"Extracting product data for category: {category}")
-    if not page_source:
+    if page_source is None or (isinstance(page_source, str) and not page_source):
         return (item for item in [])
 
-    soup = BeautifulSoup(page_source, "html.parser")
-    products = soup.find_all("div", {"data-testid": "product-cell"})
+    doc = parse_html(page_source)
+    products = PRODUCT_CELL_SELECTOR.select(doc)
     return (
         {
-            "name": product.find("h4", {"data-testid": "product-cell-name"}).text.strip(),
-            "original_price": (prices[0].text.strip() if prices else None),
-            "discount_price": (prices[1].text.strip() if len(prices) > 1 else None),
-            "size": product.find("div", class_="product-format").text.strip(),
+            "name": node_text(PRODUCT_NAME_SELECTOR.select_one(product)),
+            "original_price": (node_text(prices[0]) if prices else None),
+            "discount_price": (node_text(prices[1]) if len(prices) > 1 else None),
+            "size": node_text(PRODUCT_FORMAT_SELECTOR.select_one(product)),
             "category": category,
             "image_url": get_image_url(product),
         }
         for product in products
-        if (prices := product.find_all("p", {"data-testid": "product-price"}))
+        if (prices := PRODUCT_PRICE_SELECTOR.select(product))
     )
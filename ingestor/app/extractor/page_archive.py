@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from datetime import timezone
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from extractor.html_parser import document_html
+from pipeline import CapturedPage
+from pipeline import CategoryEnd
+from pipeline import PageEmitter
+
+logger = logging.getLogger(__name__)
+
+RECORD_PAGES_DIR_ENV = "RECORD_PAGES_DIR"
+ARCHIVE_FORMAT_VERSION = 1
+
+
+def get_page_recorder(extractor: Any) -> Optional[PageRecorder]:
+    """Recorder for the pages an extractor captures, when RECORD_PAGES_DIR is set."""
+    record_dir = os.getenv(RECORD_PAGES_DIR_ENV, "").strip()
+    if not record_dir:
+        return None
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(record_dir, f"{extractor.RETAILER}-{timestamp}.jsonl.gz")
+    return PageRecorder(path, type(extractor).__name__, extractor.data_source_url)
+
+
+class PageRecorder:
+    """Write every captured page of a run to a gzipped JSON-lines archive that replay.py can process offline.
+
+    The first line describes the run (extractor class, source URL), every following line is one page in capture
+    order. Pages already parsed during capture are serialized back to HTML; pages reused from the HTTP cache have no
+    source and are not recorded.
+    """
+
+    def __init__(self, path: str, extractor_name: str, data_source_url: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.pages = 0
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        header = {
+            "format": ARCHIVE_FORMAT_VERSION,
+            "extractor": extractor_name,
+            "data_source_url": data_source_url,
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        self._file.write(json.dumps(header) + "\n")
+
+    def record(self, page: CapturedPage) -> None:
+        source = page.source
+        if source is None:
+            return
+        if not isinstance(source, str):
+            source = document_html(source)
+        self._file.write(json.dumps({"category": page.category, "url": page.url, "source": source}) + "\n")
+        self.pages += 1
+
+    def wrap(self, emit: PageEmitter) -> PageEmitter:
+        def recording_emit(page: Union[CapturedPage, CategoryEnd]) -> None:
+            # Recorded before emitting: once emitted, a parsed document belongs to the parse workers
+            if isinstance(page, CapturedPage):
+                self.record(page)
+            emit(page)
+
+        return recording_emit
+
+    def close(self) -> None:
+        self._file.close()
+        logger.info(f"Recorded {self.pages} pages to {self.path}")
+
+
+def read_page_archive(path: str) -> Tuple[Dict[str, Any], Iterator[CapturedPage]]:
+    """Header of a recorded archive and a lazy iterator over its pages."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+    if header.get("format") != ARCHIVE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported page archive format: {header.get('format')}")
+
+    def pages() -> Iterator[CapturedPage]:
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            archive.readline()
+            for line in archive:
+                entry = json.loads(line)
+                yield CapturedPage(entry["category"], entry["url"], entry["source"])
+
+    return header, pages()
@@ -4,10 +4,20 @@ import os
 import sys
 from datetime import datetime
 from datetime import timezone
-
+from typing import NamedTuple
+from typing import Tuple
+from typing import Type
+
+from checkpoint import CHECKPOINT_OFF
+from checkpoint import CHECKPOINT_RESUME
+from checkpoint import get_checkpoint_mode
+from checkpoint import get_checkpoint_store
+from checkpoint import ingest_with_checkpoints
 from data_builder import build_data_gen
+from data_builder import DEFAULT_BATCH_ROWS
 from extractor import Extractor
 from extractor.carr_extractor import CarrExtractor
+from extractor.merc_api_extractor import MercApiExtractor
 from extractor.merc_extractor import MercExtractor
 from timing import timed_phase
 from writer import write_data
@@ -15,7 +25,18 @@ from writer import write_data
 
 # LOGGING
 class _JsonFormatter(logging.Formatter):
-    _EXTRA_FIELDS = ("phase", "duration_seconds", "duration_minutes")
+    _EXTRA_FIELDS = (
+        "phase",
+        "duration_seconds",
+        "duration_minutes",
+        "navigation_phase",
+        "navigations",
+        "total_seconds",
+        "mean_seconds",
+        "p95_seconds",
+        "max_seconds",
+        "metrics",
+    )
 
     def format(self, record):
         log_entry = {
@@ -54,11 +75,15 @@ def parse_args():
     return bucket_uri, data_source_url
 
 
-@timed_phase("total")
-def ingest_data(data_source_url: str, dest_bucket_uri: str) -> None:
-    logging.info("🚀 Starting data ingestion")
-    bucket_name, bucket_prefix = dest_bucket_uri.replace("gs://", "").split("/", maxsplit=1)
+class RunOptions(NamedTuple):
+    is_test_mode: bool
+    break_early: bool
+    extractor_type: str
+    batch_rows: int
+    checkpoint_mode: str
+
 
+def get_run_options() -> RunOptions:
     _test_mode_env = os.getenv("TEST_MODE", "").strip().lower()
     is_test_mode = bool(_test_mode_env)
     break_early = is_test_mode and _test_mode_env != "full"
@@ -66,26 +91,80 @@ def ingest_data(data_source_url: str, dest_bucket_uri: str) -> None:
     if is_test_mode:
         logging.info(f"Running test mode: TEST_MODE={_test_mode_env!r}, break_early={break_early}")
 
-    extractor = get_extractor(data_source_url, bucket_name, break_early, is_test_mode)
-    sources = extractor.get_page_sources()
-    data_gen = build_data_gen(sources)
-    write_data(data_gen, bucket_name, bucket_prefix, is_test_mode)
+    return RunOptions(
+        is_test_mode=is_test_mode,
+        break_early=break_early,
+        extractor_type=os.getenv("EXTRACTOR_TYPE", "browser").strip().lower(),
+        batch_rows=int(os.getenv("ROW_BATCH_SIZE", DEFAULT_BATCH_ROWS)),
+        checkpoint_mode=get_checkpoint_mode(),
+    )
+
+
+def split_bucket_uri(bucket_uri: str) -> Tuple[str, str]:
+    bucket_name, bucket_prefix = bucket_uri.replace("gs://", "").split("/", maxsplit=1)
+    return bucket_name, bucket_prefix
+
+
+def ingest_checkpointed(extractor: Extractor, bucket_name: str, bucket_prefix: str, options: RunOptions) -> int:
+    run_date = datetime.now().date().isoformat()
+    store = get_checkpoint_store(bucket_name, bucket_prefix, run_date, options.is_test_mode)
+    resume = options.checkpoint_mode == CHECKPOINT_RESUME
+    manifest = ingest_with_checkpoints(extractor, store, run_date, options.batch_rows, resume=resume)
+    return manifest.total_rows
+
+
+@timed_phase("total")
+def ingest_data(data_source_url: str, dest_bucket_uri: str) -> None:
+    logging.info("🚀 Starting data ingestion")
+    bucket_name, bucket_prefix = split_bucket_uri(dest_bucket_uri)
+    options = get_run_options()
+    extractor = get_extractor(
+        data_source_url, bucket_name, options.break_early, options.is_test_mode, options.extractor_type
+    )
+
+    try:
+        if options.checkpoint_mode != CHECKPOINT_OFF:
+            ingest_checkpointed(extractor, bucket_name, bucket_prefix, options)
+            return
+
+        sources = extractor.get_page_sources()
+        data_gen = build_data_gen(sources, extractor.OUTPUT_SCHEMA, options.batch_rows)
+        write_data(extractor.metrics.track_batches(data_gen), bucket_name, bucket_prefix, options.is_test_mode)
+    finally:
+        extractor.metrics.log_summary()
 
 
 def get_extractor(
-    data_source_url: str, bucket_name: str, break_early: bool = False, is_test_mode: bool = False
+    data_source_url: str,
+    bucket_name: str,
+    break_early: bool = False,
+    is_test_mode: bool = False,
+    extractor_type: str = "browser",
 ) -> Extractor:
     logging.info(
         f"Creating extractor for data_source_url={data_source_url}, bucket_name={bucket_name}, "
-        f"break_early={break_early}, is_test_mode={is_test_mode}"
+        f"break_early={break_early}, is_test_mode={is_test_mode}, extractor_type={extractor_type}"
     )
-    if "mercadona" in data_source_url:
-        logging.info("Using MercExtractor for Mercadona data source")
-        return MercExtractor(data_source_url, bucket_name, break_early, is_test_mode)
+    extractor_cls = get_extractor_class(data_source_url, extractor_type)
+    logging.info(f"Using {extractor_cls.__name__} for {data_source_url}")
+    return extractor_cls(data_source_url, bucket_name, break_early, is_test_mode)
+
+
+def get_extractor_class(data_source_url: str, extractor_type: str = "browser") -> Type[Extractor]:
+    if extractor_type not in ("browser", "api"):
+        raise ValueError(f"Unsupported extractor type: {extractor_type}. Supported types are browser and api.")
+
+    if "mercadona" in data_source_url and extractor_type == "api":
+        return MercApiExtractor
+
+    elif "mercadona" in data_source_url:
+        return MercExtractor
+
+    elif "carrefour" in data_source_url and extractor_type == "api":
+        raise ValueError("The api extractor type is only available for Mercadona.")
 
     elif "carrefour" in data_source_url:
-        logging.info("Using CarrExtractor for Carrefour data source")
-        return CarrExtractor(data_source_url, bucket_name, break_early, is_test_mode)
+        return CarrExtractor
 
     else:
         logging.error("Unsupported data source URL")
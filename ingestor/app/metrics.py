@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any
+from typing import Dict
+from typing import Generator
+from typing import Iterable
+
+import pyarrow as pa
+from pipeline import CapturedPage
+
+logger = logging.getLogger(__name__)
+
+
+def page_size(page: CapturedPage) -> int:
+    """Size in bytes of the raw page behind a captured page."""
+    if page.size is not None:
+        return page.size
+    if isinstance(page.source, str):
+        return len(page.source.encode("utf-8"))
+    return 0
+
+
+def chunk_size_bytes(chunk: Any) -> int:
+    if isinstance(chunk, pa.RecordBatch):
+        return chunk.nbytes
+    return int(chunk.memory_usage(deep=True).sum())
+
+
+class CategoryMetrics:
+    def __init__(self):
+        self.pages = 0
+        self.html_bytes = 0
+        self.capture_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.rows = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "rows": self.rows,
+            "html_bytes": self.html_bytes,
+            "capture_seconds": round(self.capture_seconds, 3),
+            "parse_seconds": round(self.parse_seconds, 3),
+        }
+
+
+class IngestionMetrics:
+    """Throughput counters of one ingestion run.
+
+    Capture and parsing run concurrently and the writer pulls batches lazily, so phase durations alone charge every
+    cost to whichever phase happens to consume the generator. These counters are fed where the work actually happens:
+    the capture thread (time and bytes per page), the parse workers (time and rows per page) and the writer loop (time
+    waiting for a batch vs time writing it).
+    """
+
+    def __init__(self):
+        self.categories: Dict[str, CategoryMetrics] = defaultdict(CategoryMetrics)
+        self.duplicate_rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self.batch_bytes = 0
+        self.wait_seconds = 0.0
+        self.write_seconds = 0.0
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record_capture(self, page: CapturedPage, seconds: float) -> None:
+        with self._lock:
+            category = self.categories[page.category]
+            category.pages += 1
+            category.html_bytes += page_size(page)
+            category.capture_seconds += seconds
+
+    def record_parse(self, page: CapturedPage, seconds: float, rows: int) -> None:
+        with self._lock:
+            category = self.categories[page.category]
+            category.parse_seconds += seconds
+            category.rows += rows
+
+    def record_duplicates(self, rows: int) -> None:
+        self.duplicate_rows += rows
+
+    def track_batches(self, data_gen: Iterable[Any]) -> Generator[Any, None, None]:
+        """Pass data_gen through, splitting the consumer's time into waiting for batches and writing them."""
+        iterator = iter(data_gen)
+        while True:
+            start = time.monotonic()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                self.wait_seconds += time.monotonic() - start
+                return
+            received = time.monotonic()
+            self.wait_seconds += received - start
+            self.batches += 1
+            self.batch_rows += len(chunk)
+            self.batch_bytes += chunk_size_bytes(chunk)
+            yield chunk
+            self.write_seconds += time.monotonic() - received
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started
+        with self._lock:
+            categories = list(self.categories.values())
+        pages = sum(category.pages for category in categories)
+        rows = sum(category.rows for category in categories)
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "categories": len(categories),
+            "pages": pages,
+            "rows": rows,
+            "duplicate_rows": self.duplicate_rows,
+            "html_bytes": sum(category.html_bytes for category in categories),
+            "capture_seconds": round(sum(category.capture_seconds for category in categories), 2),
+            "parse_seconds": round(sum(category.parse_seconds for category in categories), 2),
+            "batches": self.batches,
+            "batch_rows": self.batch_rows,
+            "batch_bytes": self.batch_bytes,
+            "wait_seconds": round(self.wait_seconds, 2),
+            "write_seconds": round(self.write_seconds, 2),
+            "pages_per_second": round(pages / elapsed, 2) if elapsed else 0.0,
+            "rows_per_second": round(rows / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def log_summary(self) -> None:
+        with self._lock:
+            categories = {name: category.as_dict() for name, category in self.categories.items()}
+        for name, category in categories.items():
+            logger.info(
+                f"Category {name}: {category['pages']} pages, {category['rows']} rows, "
+                f"{category['html_bytes']} HTML bytes, capture {category['capture_seconds']}s, "
+                f"parse {category['parse_seconds']}s",
+                extra={"metrics": {"category": name, **category}},
+            )
+        summary = self.summary()
+        logger.info(
+            f"Ingestion summary: {summary['pages']} pages ({summary['pages_per_second']}/s), "
+            f"{summary['rows']} rows ({summary['rows_per_second']}/s, {summary['duplicate_rows']} duplicates dropped), "
+            f"{summary['html_bytes']} HTML bytes; "
+            f"capture {summary['capture_seconds']}s, parse {summary['parse_seconds']}s (summed over workers), "
+            f"waiting for batches {summary['wait_seconds']}s, writing {summary['write_seconds']}s",
+            extra={"metrics": summary},
+        )
@@ -0,0 +1,343 @@
+"""Ingest several data sources in one container: one extraction process per source, one shared pool of writers.
+
+    python3 orchestrator.py <data_source_url> <bucket_uri> [<data_source_url> <bucket_uri> ...]
+
+Each source is extracted in its own process (its own Chrome and parse workers) and streams its record batches back to
+the parent as Arrow IPC messages, where a pool of WRITER_WORKERS threads writes them exactly as main.py would.
+RETAILER_CONCURRENCY caps how many sources of the same retailer are crawled at once.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Generator
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+import pyarrow as pa
+from checkpoint import CHECKPOINT_OFF
+from data_builder import build_data_gen
+from extractor import Extractor
+from extractor.browser import BROWSER_SESSION_DIR_ENV
+from extractor.http_cache import HTTP_CACHE_DIR_ENV
+from main import get_extractor
+from main import get_extractor_class
+from main import get_run_options
+from main import ingest_checkpointed
+from main import RunOptions
+from main import split_bucket_uri
+from timing import timed_phase
+from writer import write_data
+
+RETAILER_CONCURRENCY_ENV = "RETAILER_CONCURRENCY"
+WRITER_WORKERS_ENV = "WRITER_WORKERS"
+DEFAULT_RETAILER_CONCURRENCY = 1
+DEFAULT_WRITER_WORKERS = 2
+# Record batches in flight between an extraction process and its writer
+MAX_QUEUED_BATCHES = 4
+# How often a writer waiting for batches checks that its extraction process is still alive
+POLL_SECONDS = 1.0
+
+MESSAGE_BATCH = "batch"
+MESSAGE_DONE = "done"
+MESSAGE_ERROR = "error"
+# Directories of per-retailer state that sources of one retailer crawled at the same time must not share
+SOURCE_STATE_DIR_ENVS = (HTTP_CACHE_DIR_ENV, BROWSER_SESSION_DIR_ENV)
+
+logger = logging.getLogger(__name__)
+
+ExtractorFactory = Callable[["IngestionSource", RunOptions], Extractor]
+WriteFunction = Callable[[Iterable[pa.RecordBatch], str, str, bool], None]
+
+
+class IngestionSource(NamedTuple):
+    data_source_url: str
+    bucket_uri: str
+    retailer: str
+
+
+class SourceResult(NamedTuple):
+    source: IngestionSource
+    rows: Optional[int]
+    seconds: float
+    error: Optional[str] = None
+
+
+def get_retailer_concurrency() -> Dict[str, int]:
+    """Parse RETAILER_CONCURRENCY, e.g. "merc=1,carr=2". Retailers not listed get one source at a time."""
+    limits = {}
+    for entry in filter(None, (e.strip() for e in os.getenv(RETAILER_CONCURRENCY_ENV, "").split(","))):
+        retailer, _, limit = entry.partition("=")
+        if not limit.strip().isdigit() or int(limit) < 1:
+            raise ValueError(
+                f"Unsupported {RETAILER_CONCURRENCY_ENV} entry: {entry!r}. Expected <retailer>=<positive integer>."
+            )
+        limits[retailer.strip()] = int(limit)
+    return limits
+
+
+def get_writer_workers() -> int:
+    workers = int(os.getenv(WRITER_WORKERS_ENV, DEFAULT_WRITER_WORKERS))
+    if workers < 1:
+        raise ValueError(f"{WRITER_WORKERS_ENV} must be at least 1, got {workers}")
+    return workers
+
+
+def parse_sources(args: List[str], extractor_type: str) -> List[IngestionSource]:
+    if not args or len(args) % 2:
+        raise ValueError("Expected pairs of <data_source_url> <bucket_uri> arguments.")
+    return [
+        IngestionSource(url, bucket_uri, get_extractor_class(url, extractor_type).RETAILER)
+        for url, bucket_uri in zip(args[::2], args[1::2])
+    ]
+
+
+def batch_to_ipc(batch: pa.RecordBatch) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def batch_from_ipc(message: bytes) -> pa.RecordBatch:
+    return pa.ipc.open_stream(message).read_next_batch()
+
+
+def source_state_env(source: IngestionSource) -> Dict[str, str]:
+    """Subdirectories of the configured state directories for this source alone.
+
+    They are named after the source's URL and bucket, so the same source finds its page cache and browser session again
+    on the next run.
+    """
+    key = hashlib.sha256(f"{source.data_source_url} {source.bucket_uri}".encode("utf-8")).hexdigest()[:12]
+    return {
+        name: os.path.join(os.environ[name].strip(), f"{source.retailer}-{key}")
+        for name in SOURCE_STATE_DIR_ENVS
+        if os.getenv(name, "").strip()
+    }
+
+
+def create_extractor(source: IngestionSource, options: RunOptions) -> Extractor:
+    bucket_name, _ = split_bucket_uri(source.bucket_uri)
+    return get_extractor(
+        source.data_source_url, bucket_name, options.break_early, options.is_test_mode, options.extractor_type
+    )
+
+
+def extract_source(
+    source: IngestionSource,
+    options: RunOptions,
+    messages: Any,
+    extractor_factory: ExtractorFactory,
+    state_env: Optional[Dict[str, str]] = None,
+) -> None:
+    """Extraction process: send the source's record batches, then MESSAGE_DONE or MESSAGE_ERROR.
+
+    Checkpointed runs write their own per-category parts from this process, as they need the category boundaries.
+    state_env overrides the state directories for this process only.
+    """
+    os.environ.update(state_env or {})
+    extractor = None
+    try:
+        extractor = extractor_factory(source, options)
+        if options.checkpoint_mode != CHECKPOINT_OFF:
+            bucket_name, bucket_prefix = split_bucket_uri(source.bucket_uri)
+            messages.put((MESSAGE_DONE, ingest_checkpointed(extractor, bucket_name, bucket_prefix, options)))
+            return
+
+        data_gen = build_data_gen(extractor.get_page_sources(), extractor.OUTPUT_SCHEMA, options.batch_rows)
+        for batch in extractor.metrics.track_batches(data_gen):
+            messages.put((MESSAGE_BATCH, batch_to_ipc(batch)))
+        messages.put((MESSAGE_DONE, None))
+    except Exception as e:
+        logger.exception(f"Extraction of {source.data_source_url} failed")
+        messages.put((MESSAGE_ERROR, f"{type(e).__name__}: {e}"))
+    finally:
+        if extractor is not None:
+            extractor.metrics.log_summary()
+
+
+class SourceRun:
+    """One source being ingested: its extraction process and the writer draining it."""
+
+    def __init__(self, source: IngestionSource, process: Any, messages: Any):
+        self.source = source
+        self.process = process
+        self.messages = messages
+        self.rows: Optional[int] = 0
+        self.started = time.monotonic()
+
+    def receive_batches(self) -> Generator[pa.RecordBatch, None, None]:
+        while True:
+            try:
+                kind, payload = self.messages.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(
+                        f"Extraction process of {self.source.data_source_url} exited with code {self.process.exitcode}"
+                    )
+                continue
+            if kind == MESSAGE_BATCH:
+                batch = batch_from_ipc(payload)
+                self.rows += batch.num_rows
+                yield batch
+            elif kind == MESSAGE_ERROR:
+                raise RuntimeError(f"Extraction of {self.source.data_source_url} failed: {payload}")
+            else:
+                if payload is not None:
+                    self.rows = payload
+                return
+
+    def write(self, write: WriteFunction, options: RunOptions) -> SourceResult:
+        bucket_name, bucket_prefix = split_bucket_uri(self.source.bucket_uri)
+        try:
+            if options.checkpoint_mode != CHECKPOINT_OFF:
+                # The extraction process wrote its parts itself and only reports the rows
+                for _ in self.receive_batches():
+                    pass
+            else:
+                write(self.receive_batches(), bucket_name, bucket_prefix, options.is_test_mode)
+        except BaseException:
+            # A failed write stops consuming: do not leave the process blocked on a full queue
+            self.process.terminate()
+            raise
+        finally:
+            self.process.join()
+        return SourceResult(self.source, self.rows, time.monotonic() - self.started)
+
+
+@timed_phase("total")
+def ingest_sources(
+    sources: List[IngestionSource],
+    options: RunOptions,
+    retailer_concurrency: Optional[Dict[str, int]] = None,
+    writer_workers: int = DEFAULT_WRITER_WORKERS,
+    extractor_factory: ExtractorFactory = create_extractor,
+    write: WriteFunction = write_data,
+    start_method: str = "spawn",
+) -> List[SourceResult]:
+    """Ingest sources concurrently and return one result per source, in the order given.
+
+    Processes are spawned rather than forked, as the parent already runs writer threads. Raises once every source has
+    finished if any of them failed, so one retailer failing does not cut the others short.
+    """
+    retailer_concurrency = retailer_concurrency or {}
+    context = multiprocessing.get_context(start_method)
+    # Sources whose retailer may have several crawls running at once each get their own state directories
+    sources_per_retailer = Counter(source.retailer for source in sources)
+    concurrent_retailers = {
+        retailer
+        for retailer, count in sources_per_retailer.items()
+        if count > 1 and retailer_concurrency.get(retailer, DEFAULT_RETAILER_CONCURRENCY) > 1
+    }
+    pending = list(sources)
+    active: Counter = Counter()
+    running: Dict[Future, SourceRun] = {}
+    results: Dict[IngestionSource, SourceResult] = {}
+    started = time.monotonic()
+
+    def can_start(source: IngestionSource) -> bool:
+        return active[source.retailer] < retailer_concurrency.get(source.retailer, DEFAULT_RETAILER_CONCURRENCY)
+
+    with ThreadPoolExecutor(max_workers=writer_workers, thread_name_prefix="writer") as writers:
+        while pending or running:
+            for source in list(pending):
+                if not can_start(source):
+                    continue
+                pending.remove(source)
+                messages = context.Queue(maxsize=MAX_QUEUED_BATCHES)
+                process = context.Process(
+                    target=extract_source,
+                    args=(
+                        source,
+                        options,
+                        messages,
+                        extractor_factory,
+                        source_state_env(source) if source.retailer in concurrent_retailers else None,
+                    ),
+                    name=f"extract-{source.retailer}",
+                )
+                process.start()
+                logger.info(f"Started extraction of {source.data_source_url} ({source.retailer}, pid {process.pid})")
+                run = SourceRun(source, process, messages)
+                running[writers.submit(run.write, write, options)] = run
+                active[source.retailer] += 1
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                run = running.pop(future)
+                active[run.source.retailer] -= 1
+                try:
+                    results[run.source] = future.result()
+                except Exception as e:
+                    logger.exception(f"Ingestion of {run.source.data_source_url} failed")
+                    results[run.source] = SourceResult(run.source, None, time.monotonic() - run.started, str(e))
+
+    ordered = [results[source] for source in sources]
+    log_results(ordered, time.monotonic() - started)
+    failed = [result for result in ordered if result.error]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(ordered)} sources failed: " + "; ".join(r.error for r in failed))
+    return ordered
+
+
+def log_results(results: List[SourceResult], wall_seconds: float) -> None:
+    for result in results:
+        logger.info(
+            f"Source {result.source.data_source_url} ({result.source.retailer}): "
+            f"{'failed' if result.error else f'{result.rows} rows'} in {round(result.seconds, 2)}s",
+            extra={
+                "metrics": {
+                    "data_source_url": result.source.data_source_url,
+                    "retailer": result.source.retailer,
+                    "rows": result.rows,
+                    "seconds": round(result.seconds, 2),
+                    "failed": bool(result.error),
+                }
+            },
+        )
+    sequential_seconds = sum(result.seconds for result in results)
+    logger.info(
+        f"Ingested {len(results)} sources in {round(wall_seconds, 2)}s "
+        f"({round(sequential_seconds, 2)}s one after another)",
+        extra={
+            "metrics": {
+                "sources": len(results),
+                "rows": sum(result.rows or 0 for result in results),
+                "wall_seconds": round(wall_seconds, 2),
+                "sequential_seconds": round(sequential_seconds, 2),
+            }
+        },
+    )
+
+
+def parse_args() -> Tuple[List[IngestionSource], RunOptions]:
+    options = get_run_options()
+    try:
+        return parse_sources(sys.argv[1:], options.extractor_type), options
+    except ValueError as e:
+        logger.error(f"{e} Usage: orchestrator.py <data_source_url> <bucket_uri> [<data_source_url> <bucket_uri> ...]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    sources, options = parse_args()
+    logger.info(f"Starting ingestion of {len(sources)} sources")
+    ingest_sources(sources, options, get_retailer_concurrency(), get_writer_workers())
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Generator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARSE_WORKERS = 2
+DEFAULT_MAX_PENDING_PAGES = 8
+QUEUE_POLL_SECONDS = 0.5
+CATEGORY_SEPARATOR = " > "
+CAPTURE_JOIN_TIMEOUT_SECONDS = 30
+
+
+class CapturedPage(NamedTuple):
+    category: str
+    url: str
+    source: Any
+    # Rows already known for this page (e.g. unchanged since a cached parse); parse_page returns them as-is
+    rows: Optional[List[Dict[str, Any]]] = None
+    # Where parse_page should store the rows it extracts for reuse by later runs
+    cache_key: Optional[str] = None
+    # Size in bytes of the raw page, when source is not the raw text (a parsed document or cached rows)
+    size: Optional[int] = None
+
+    @property
+    def group(self) -> str:
+        """Top-level category of the page ("Frescos" for "Frescos > Frutas"), the unit runs are checkpointed by."""
+        return self.category.split(CATEGORY_SEPARATOR, 1)[0]
+
+
+class CategoryEnd(NamedTuple):
+    """Emitted after the last page of a top-level category: whether every page of it was captured.
+
+    Capture loops log and skip what fails inside a category, so only this marker tells a finished category from one
+    that lost pages; checkpointed runs commit a category on it.
+    """
+
+    group: str
+    completed: bool
+
+
+PageEmitter = Callable[[Union[CapturedPage, CategoryEnd]], None]
+
+
+class PipelineClosed(BaseException):
+    """Raised in the capture thread once the consumer stops reading.
+
+    It derives from BaseException so the broad ``except Exception`` blocks in the navigation loops let it through.
+    """
+
+
+class _CaptureFailed(NamedTuple):
+    error: BaseException
+
+
+_CAPTURE_DONE = object()
+
+
+class PagePipeline:
+    """Overlap page capture (browser/HTTP waits) with parsing (CPU).
+
+    The capture function runs in its own thread and hands every page to ``emit`` as soon as it is captured. Pages
+    are parsed by a small worker pool and the parsed rows are yielded in capture order. At most ``max_pending``
+    pages are in flight, so memory stays bounded no matter how large the site is. CategoryEnd markers are not
+    parsed: they are yielded as they are, in capture order.
+    """
+
+    def __init__(
+        self,
+        parse_fn: Callable[[CapturedPage], Any],
+        workers: int = DEFAULT_PARSE_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING_PAGES,
+    ):
+        if workers < 1 or max_pending < 1:
+            raise ValueError(f"workers and max_pending must be positive, got {workers} and {max_pending}")
+        self.parse_fn = parse_fn
+        self.workers = workers
+        self.max_pending = max_pending
+
+    def run(self, capture_fn: Callable[[PageEmitter], None]) -> Generator[Any, None, None]:
+        logger.info(f"Starting page pipeline with {self.workers} parse workers and {self.max_pending} pending pages")
+        pending: queue.Queue = queue.Queue(maxsize=self.max_pending)
+        closed = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="page-parser")
+
+        def put(item: Any) -> None:
+            while not closed.is_set():
+                try:
+                    pending.put(item, timeout=QUEUE_POLL_SECONDS)
+                    return
+                except queue.Full:
+                    continue
+            raise PipelineClosed()
+
+        def emit(page: Union[CapturedPage, CategoryEnd]) -> None:
+            if closed.is_set():
+                raise PipelineClosed()
+            if isinstance(page, CategoryEnd):
+                put(page)
+                return
+            future: Future = executor.submit(self.parse_fn, page)
+            try:
+                put(future)
+            except PipelineClosed:
+                future.cancel()
+                raise
+
+        def capture() -> None:
+            try:
+                capture_fn(emit)
+                put(_CAPTURE_DONE)
+            except PipelineClosed:
+                logger.info("Page pipeline closed by the consumer, stopping capture")
+            except BaseException as e:
+                try:
+                    put(_CaptureFailed(e))
+                except PipelineClosed:
+                    logger.error(f"Capture failed after the page pipeline was closed: {e}")
+
+        capture_thread = threading.Thread(target=capture, name="page-capture", daemon=True)
+        capture_thread.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is _CAPTURE_DONE:
+                    break
+                if isinstance(item, _CaptureFailed):
+                    raise item.error
+                yield item if isinstance(item, CategoryEnd) else item.result()
+        finally:
+            closed.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            capture_thread.join(CAPTURE_JOIN_TIMEOUT_SECONDS)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from data_builder import build_data_gen
+from data_builder import DEFAULT_BATCH_ROWS
+from extractor import Extractor
+from extractor.carr_extractor import CarrExtractor
+from extractor.merc_api_extractor import MercApiExtractor
+from extractor.merc_extractor import MercExtractor
+from extractor.page_archive import PageRecorder
+from extractor.page_archive import read_page_archive
+from pipeline import CapturedPage
+from pipeline import PageEmitter
+from writer import write_chunks_to_local_parquet
+
+# Extractors a recorded archive can be replayed through, by class name
+REPLAY_EXTRACTORS = {cls.__name__: cls for cls in (MercExtractor, MercApiExtractor, CarrExtractor)}
+
+
+class ReplayResult(NamedTuple):
+    pages: int
+    page_bytes: int
+    rows: int
+    output_bytes: int
+    seconds: float
+
+
+def extractor_for_archive(header: Dict[str, Any]) -> Extractor:
+    extractor_cls = REPLAY_EXTRACTORS.get(header["extractor"])
+    if extractor_cls is None:
+        raise ValueError(f"Cannot replay pages of {header['extractor']}. Supported: {sorted(REPLAY_EXTRACTORS)}.")
+    return extractor_cls(header["data_source_url"], "replay", is_test_mode=True)
+
+
+def write_page_archive(path: str, extractor: Extractor, pages: Iterable[Tuple[str, str, Any]]) -> int:
+    """Write (category, url, source) tuples as an archive of extractor, e.g. to build one from saved fixtures."""
+    recorder = PageRecorder(path, type(extractor).__name__, extractor.data_source_url)
+    try:
+        for category, url, source in pages:
+            recorder.record(CapturedPage(category, url, source))
+    finally:
+        recorder.close()
+    return recorder.pages
+
+
+def replay_archive(
+    path: str,
+    output_path: str,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    extractor: Optional[Extractor] = None,
+) -> ReplayResult:
+    """Run recorded pages through parse -> record batches -> local Parquet, like a live run without the sites.
+
+    The pages go through the same page pipeline and parse workers as a live run (PARSE_WORKERS, MAX_PENDING_PAGES),
+    so parser, builder and writer changes can be measured on the same input every time.
+    """
+    header, pages = read_page_archive(path)
+    extractor = extractor or extractor_for_archive(header)
+    pages_replayed = 0
+    page_bytes = 0
+
+    def capture(emit: PageEmitter) -> None:
+        nonlocal pages_replayed, page_bytes
+        for page in pages:
+            pages_replayed += 1
+            page_bytes += len(page.source.encode("utf-8"))
+            emit(page)
+
+    start = time.perf_counter()
+    drop_duplicates = extractor._duplicate_row_filter()
+    pages_parsed = extractor._build_pipeline(extractor._timed_parse_page).run(capture)
+    sources = (drop_duplicates(rows) for rows in pages_parsed)
+    rows = write_chunks_to_local_parquet(build_data_gen(sources, extractor.OUTPUT_SCHEMA, batch_rows), output_path)
+    seconds = time.perf_counter() - start
+
+    output_bytes = os.path.getsize(output_path) if rows else 0
+    return ReplayResult(pages_replayed, page_bytes, rows, output_bytes, seconds)
@@ -1,8 +1,9 @@
 import logging
 import os
+import time
 from datetime import datetime
-from io import BytesIO
-from typing import Generator
+from typing import Iterable
+from typing import Union
 
 import pandas as pd
 import pyarrow as pa
@@ -12,17 +13,36 @@ from google.auth.transport.requests import AuthorizedSession
 from google.cloud.storage import Client
 from google.resumable_media.common import InvalidResponse
 from google.resumable_media.requests import ResumableUpload
+from requests.exceptions import ConnectionError as HttpConnectionError
 from timing import timed_phase
 
 CHUNK_SIZE = 256 * 1024  # 256 KiB
-GCP_STORAGE_RESUMABLE_UPLOAD_URL = "https://www.googleapis.com/upload/storage/v1/b/{0}/o?uploadType=resumable"
+PARQUET_CHUNK_SIZE = 32 * CHUNK_SIZE  # 8 MiB
+PARQUET_CONTENT_TYPE = "application/octet-stream"
+MAX_RECOVER_ATTEMPTS = 5
+INITIAL_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 32.0
+GCP_STORAGE_HOST = "https://www.googleapis.com"
+GCP_STORAGE_RESUMABLE_UPLOAD_URL = "{0}/upload/storage/v1/b/{1}/o?uploadType=resumable"
+STORAGE_EMULATOR_HOST_ENV = "STORAGE_EMULATOR_HOST"
 
 logger = logging.getLogger(__name__)
 
+DataChunk = Union[pa.RecordBatch, pd.DataFrame]
+
+
+def get_resumable_upload_url(bucket_name: str) -> str:
+    host = os.getenv(STORAGE_EMULATOR_HOST_ENV, GCP_STORAGE_HOST).rstrip("/")
+    return GCP_STORAGE_RESUMABLE_UPLOAD_URL.format(host, bucket_name)
+
+
+def chunk_to_pandas(chunk: DataChunk) -> pd.DataFrame:
+    return chunk if isinstance(chunk, pd.DataFrame) else chunk.to_pandas()
+
 
 @timed_phase("writing")
 def write_data(
-    data_gen: Generator[pd.DataFrame, None, None],
+    data_gen: Iterable[DataChunk],
     dest_bucket_name: str,
     dest_bucket_prefix: str,
     test_mode: bool,
@@ -33,7 +53,7 @@ def write_data(
         write_pandas_to_bucket_as_parquet(data_gen, dest_bucket_name, dest_bucket_prefix)
 
 
-def write_pandas_to_local_csv(data_gen: Generator[pd.DataFrame, None, None], filename_prefix: str = "data") -> None:
+def write_pandas_to_local_csv(data_gen: Iterable[DataChunk], filename_prefix: str = "data") -> None:
     logger.info("Running in test mode 🧪")
     os.makedirs("data", exist_ok=True)
     output_path = f"data/{filename_prefix}_{datetime.now().isoformat(timespec='minutes')}.csv"
@@ -41,11 +61,12 @@ def write_pandas_to_local_csv(data_gen: Generator[pd.DataFrame, None, None], fil
 
     headers_written = False
     chunks_written = 0
-    for df_chunk in data_gen:
-        if df_chunk.empty:
+    for chunk in data_gen:
+        if len(chunk) == 0:
             logger.info("Skipping empty chunk")
             continue
 
+        df_chunk = chunk_to_pandas(chunk)
         mode = "w" if not headers_written else "a"
         header = not headers_written
 
@@ -65,49 +86,107 @@ def write_pandas_to_local_csv(data_gen: Generator[pd.DataFrame, None, None], fil
     logger.info("Local write completed successfully.")
 
 
-def write_pandas_to_bucket_as_parquet(
-    data_gen: Generator[pd.DataFrame, None, None], bucket_name: str, bucket_prefix: str
-) -> None:
+def chunk_to_arrow(chunk: DataChunk) -> pa.Table:
+    if isinstance(chunk, pa.RecordBatch):
+        # Built against the declared extractor schema: written as one row group, no inference or cast
+        return pa.Table.from_batches([chunk])
+    return pa.Table.from_pandas(chunk, preserve_index=False)
+
+
+def parquet_file_schema(table: pa.Table) -> pa.Schema:
+    return pa.schema([pa.field(f.name, pa.string()) if f.type == pa.null() else f for f in table.schema])
+
+
+def write_pandas_to_bucket_as_parquet(data_gen: Iterable[DataChunk], bucket_name: str, bucket_prefix: str) -> None:
     logger.info(f"Writing Parquet data to bucket: {bucket_name}, prefix: {bucket_prefix}")
+    blob_name = f"{bucket_prefix}/{datetime.now().date().isoformat()}.parquet"
+    if write_chunks_to_blob_as_parquet(data_gen, bucket_name, blob_name) == 0:
+        raise RuntimeError("No data to write: 0 products were extracted. Failing to trigger alert.")
+
+
+def write_chunks_to_blob_as_parquet(data_gen: Iterable[DataChunk], bucket_name: str, blob_name: str) -> int:
+    """Stream row groups into a resumable upload as they are produced, so memory stays at about one upload chunk.
 
-    buffer = BytesIO()
+    The upload is only started with the first non-empty chunk and only finalized once every chunk has been written:
+    nothing is uploaded when there are no rows, and if extraction fails half way no partial file is published.
+    Returns the number of rows written.
+    """
+    uploader = None
+    sink = None
     writer = None
     file_schema = None
     chunks_written = 0
+    rows_written = 0
 
     for chunk in data_gen:
-        if chunk.empty:
+        if len(chunk) == 0:
             logger.info("Skipping empty chunk")
             continue
-        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        table = chunk_to_arrow(chunk)
         if writer is None:
-            file_schema = pa.schema([pa.field(f.name, pa.string()) if f.type == pa.null() else f for f in table.schema])
+            file_schema = parquet_file_schema(table)
+            uploader = StorageStreamUploader(
+                GCSClientSingleton.get_client(),
+                bucket_name,
+                blob_name,
+                chunk_size=PARQUET_CHUNK_SIZE,
+                content_type=PARQUET_CONTENT_TYPE,
+            )
+            uploader.start()
+            sink = UploaderSink(uploader)
+            writer = pq.ParquetWriter(sink, file_schema, compression="snappy")
+        if table.schema != file_schema:
             table = table.cast(file_schema)
-            writer = pq.ParquetWriter(buffer, file_schema, compression="snappy")
-        else:
-            table = table.cast(file_schema)
-        writer.write_table(table)
+        writer.write_table(table, row_group_size=len(table))
         chunks_written += 1
-        logger.info(f"Written chunk {chunks_written} ({len(chunk)} rows)")
+        rows_written += len(table)
+        logger.info(f"Written chunk {chunks_written} ({len(chunk)} rows, {sink.tell()} bytes so far)")
 
-    if writer:
-        writer.close()
+    if writer is None:
+        return 0
 
-    if chunks_written == 0:
-        raise RuntimeError("No data to write: 0 products were extracted. Failing to trigger alert.")
+    writer.close()
+    uploader.stop()
+    logger.info(f"Uploaded {blob_name} ({rows_written} rows, {sink.tell()} bytes)")
+    return rows_written
 
-    blob_name = f"{bucket_prefix}/{datetime.now().date().isoformat()}.parquet"
-    buffer.seek(0)
-    storage_client = GCSClientSingleton.get_client()
-    bucket = storage_client.get_bucket(bucket_name)
-    blob = bucket.blob(blob_name)
-    blob.upload_from_file(buffer, content_type="application/octet-stream")
-    logger.info(f"Uploaded {blob_name} ({buffer.getbuffer().nbytes} bytes)")
 
+def write_chunks_to_local_parquet(data_gen: Iterable[DataChunk], output_path: str) -> int:
+    """Local counterpart of write_chunks_to_blob_as_parquet, used by checkpointed runs in test mode."""
+    writer = None
+    file_schema = None
+    rows_written = 0
+    tmp_path = f"{output_path}.tmp"
 
-def write_pandas_to_bucket_as_csv(
-    data_gen: Generator[pd.DataFrame, None, None], bucket_name: str, bucket_prefix: str
-) -> None:
+    try:
+        for chunk in data_gen:
+            if len(chunk) == 0:
+                continue
+            table = chunk_to_arrow(chunk)
+            if writer is None:
+                file_schema = parquet_file_schema(table)
+                os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+                writer = pq.ParquetWriter(tmp_path, file_schema, compression="snappy")
+            if table.schema != file_schema:
+                table = table.cast(file_schema)
+            writer.write_table(table, row_group_size=len(table))
+            rows_written += len(table)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+
+    if writer is None:
+        return 0
+
+    writer.close()
+    os.replace(tmp_path, output_path)
+    logger.info(f"Wrote {output_path} ({rows_written} rows)")
+    return rows_written
+
+
+def write_pandas_to_bucket_as_csv(data_gen: Iterable[DataChunk], bucket_name: str, bucket_prefix: str) -> None:
     logger.info(f"Writing data to bucket: {bucket_name}, key: {bucket_prefix}")
 
     storage_client = GCSClientSingleton.get_client()
@@ -126,7 +205,8 @@ def write_pandas_to_bucket_as_csv(
     ) as uploader:
         headers_written = False
 
-        for df_chunk in data_gen:
+        for chunk in data_gen:
+            df_chunk = chunk_to_pandas(chunk)
             if not headers_written:
                 csv_content = df_chunk.to_csv(index=False).encode("utf-8")
                 logger.info(f"Uploading chunk with headers of size: {len(csv_content)} bytes")
@@ -142,21 +222,38 @@ def write_pandas_to_bucket_as_csv(
 
 
 class StorageStreamUploader(object):
+    """Resumable upload fed by write() calls, transmitting a chunk every time chunk_size bytes are buffered.
+
+    Pending bytes live in a single bytearray: appends are amortized O(1) and chunks are taken with a memoryview and
+    dropped from the front in place, so the cost of an upload is linear in its size whatever the write pattern.
+    """
+
     def __init__(
         self,
         client: Client,
         bucket_name: str,
         blob_name: str,
         chunk_size: int = CHUNK_SIZE,
+        content_type: str = "text/csv",
+        max_recover_attempts: int = MAX_RECOVER_ATTEMPTS,
+        initial_backoff: float = INITIAL_BACKOFF_SECONDS,
+        max_backoff: float = MAX_BACKOFF_SECONDS,
     ):
+        if chunk_size <= 0 or chunk_size % CHUNK_SIZE:
+            raise ValueError(f"chunk_size must be a positive multiple of {CHUNK_SIZE} bytes, got {chunk_size}")
         self._client = client
         self._bucket = self._client.bucket(bucket_name)
         self._blob = self._bucket.blob(blob_name)
+        self._content_type = content_type
 
-        self._buffer = b""
-        self._buffer_size = 0
+        self._buffer = bytearray()
         self._chunk_size = chunk_size
         self._read = 0
+        # The last chunk handed to the upload is kept until the next one so recover() can seek back into it
+        self._last_chunk = b""
+        self._max_recover_attempts = max_recover_attempts
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
 
         self._transport = AuthorizedSession(credentials=self._client._credentials)
         self._request: ResumableUpload = None
@@ -171,11 +268,11 @@ class StorageStreamUploader(object):
 
     def start(self):
         logger.info("Initializing upload")
-        url = GCP_STORAGE_RESUMABLE_UPLOAD_URL.format(self._bucket.name)
+        url = get_resumable_upload_url(self._bucket.name)
         self._request = ResumableUpload(upload_url=url, chunk_size=self._chunk_size)
         self._request.initiate(
             transport=self._transport,
-            content_type="text/csv",  # "application/octet-stream",
+            content_type=self._content_type,
             stream=self,
             stream_final=False,
             metadata={"name": self._blob.name},
@@ -183,29 +280,82 @@ class StorageStreamUploader(object):
 
     def stop(self):
         logger.info("Finalizing upload")
-        self._request.transmit_next_chunk(self._transport)
+        while not self._request.finished:
+            self._transmit_next_chunk()
 
-    def write(self, data: bytes) -> int:
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> int:
         data_len = len(data)
-        self._buffer_size += data_len
         self._buffer += data
         del data
-        while self._buffer_size >= self._chunk_size:
+        while len(self._buffer) >= self._chunk_size:
+            logger.info(f"Transmiting next chunk of size: {self._chunk_size} bytes")
+            self._transmit_next_chunk()
+        return data_len
+
+    def _transmit_next_chunk(self) -> None:
+        for attempt in range(1, self._max_recover_attempts + 1):
             try:
-                logger.info(f"Transmiting next chunk of size: {self._chunk_size} bytes")
                 self._request.transmit_next_chunk(self._transport)
-            except InvalidResponse:
-                logger.error("Invalid response received. Recovering upload.")
+            except (InvalidResponse, HttpConnectionError) as e:
+                if attempt == self._max_recover_attempts:
+                    raise
+                backoff = min(self._initial_backoff * 2 ** (attempt - 1), self._max_backoff)
+                logger.error(f"Chunk upload failed (attempt {attempt}), recovering upload in {backoff}s: {e}")
+                time.sleep(backoff)
                 self._request.recover(self._transport)
-        return data_len
+                continue
+            if self._request.bytes_uploaded != self._read and not self._request.finished:
+                # The server persisted only part of the chunk: resend the rest with the next one
+                self.seek(self._request.bytes_uploaded)
+            return
 
     def read(self, chunk_size: int) -> bytes:
-        to_read = min(chunk_size, self._buffer_size)
-        memview = memoryview(self._buffer)
-        self._buffer = memview[to_read:].tobytes()
+        to_read = min(chunk_size, len(self._buffer))
+        with memoryview(self._buffer) as view:
+            self._last_chunk = bytes(view[:to_read])
+        del self._buffer[:to_read]
         self._read += to_read
-        self._buffer_size -= to_read
-        return memview[:to_read].tobytes()
+        return self._last_chunk
+
+    def seek(self, position: int) -> int:
+        chunk_start = self._read - len(self._last_chunk)
+        if not chunk_start <= position <= self._read:
+            raise ValueError(f"Cannot seek to {position}, only bytes {chunk_start}-{self._read} are still buffered")
+        rewind = self._read - position
+        if rewind:
+            kept = len(self._last_chunk) - rewind
+            self._buffer[:0] = self._last_chunk[kept:]
+            self._last_chunk = self._last_chunk[:kept]
+            self._read = position
+        return self._read
 
     def tell(self) -> int:
         return self._read
+
+
+class UploaderSink(object):
+    """Writable file object over a StorageStreamUploader that reports the position written, not uploaded.
+
+    pyarrow records row group offsets from tell(), which must count every byte handed to the sink.
+    """
+
+    def __init__(self, uploader: StorageStreamUploader):
+        self._uploader = uploader
+        self._written = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        self._written += self._uploader.write(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._written
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
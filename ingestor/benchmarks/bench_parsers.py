@@ -0,0 +1,93 @@
+"""Micro-benchmark of the HTML parser backends on the saved category pages in tests/fixtures/html.
+
+Run from the ingestor directory:
+
+    PYTHONPATH=app python benchmarks/bench_parsers.py --repeat 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+
+from extractor.carr_extractor import CarrExtractor
+from extractor.carr_extractor import extract_carr_product_data
+from extractor.html_parser import BS4_BACKEND
+from extractor.html_parser import LXML_BACKEND
+from extractor.html_parser import parse_html
+from extractor.merc_extractor import extract_product_data
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "html")
+CARR_BASE_URL = "https://www.carrefour.es"
+CARR_PAGE_URL = "https://www.carrefour.es/supermercado/frescos/cat20002/c"
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def merc_page(html: str, backend: str) -> List[Dict]:
+    return list(extract_product_data(parse_html(html, backend), "Aceite > Aceite de oliva"))
+
+
+def carr_page_double_parse(html: str, backend: str) -> List[Dict]:
+    """Previous behaviour: one parse for the products and another one for the next-page link."""
+    extractor = CarrExtractor(CARR_PAGE_URL, "bench")
+    rows = list(extract_carr_product_data(parse_html(html, backend), "Frescos", CARR_BASE_URL, CARR_PAGE_URL))
+    extractor._find_next_page_url_from_html(parse_html(html, backend))
+    return rows
+
+
+def carr_page_single_parse(html: str, backend: str) -> List[Dict]:
+    extractor = CarrExtractor(CARR_PAGE_URL, "bench")
+    page = parse_html(html, backend)
+    rows = list(extract_carr_product_data(page, "Frescos", CARR_BASE_URL, CARR_PAGE_URL))
+    extractor._find_next_page_url_from_html(page)
+    return rows
+
+
+def time_case(fn: Callable[[str, str], List[Dict]], html: str, backend: str, repeat: int) -> float:
+    fn(html, backend)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(html, backend)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML parser backends on saved category pages")
+    parser.add_argument("--repeat", type=int, default=50, help="Iterations per case")
+    args = parser.parse_args()
+
+    merc_html = load_fixture("merc_category.html")
+    carr_html = load_fixture("carr_category.html")
+
+    assert merc_page(merc_html, BS4_BACKEND) == merc_page(merc_html, LXML_BACKEND), "Mercadona output differs"
+    assert carr_page_single_parse(carr_html, BS4_BACKEND) == carr_page_single_parse(
+        carr_html, LXML_BACKEND
+    ), "Carrefour output differs"
+    print("Output is identical across backends\n")
+
+    cases = [
+        ("merc category page", (merc_page, BS4_BACKEND), (merc_page, LXML_BACKEND), merc_html),
+        (
+            "carr page (bs4 double parse vs lxml single parse)",
+            (carr_page_double_parse, BS4_BACKEND),
+            (carr_page_single_parse, LXML_BACKEND),
+            carr_html,
+        ),
+    ]
+    print(f"{'case':<52} {'bs4 ms':>10} {'lxml ms':>10} {'speedup':>9}")
+    for label, (baseline_fn, baseline_backend), (candidate_fn, candidate_backend), html in cases:
+        baseline = time_case(baseline_fn, html, baseline_backend, args.repeat)
+        candidate = time_case(candidate_fn, html, candidate_backend, args.repeat)
+        print(f"{label:<52} {baseline:>10.2f} {candidate:>10.2f} {baseline / candidate:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
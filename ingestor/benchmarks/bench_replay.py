@@ -0,0 +1,84 @@
+"""End-to-end offline benchmark: replay recorded pages through parse -> record batches -> local Parquet.
+
+Record an archive from a live run with RECORD_PAGES_DIR set (one <retailer>-<timestamp>.jsonl.gz per run), then replay
+it as often as needed without touching the sites. Without an archive, one is built from the saved category pages in
+tests/fixtures/html, repeated --pages times.
+
+Run from the ingestor directory:
+
+    PYTHONPATH=app python benchmarks/bench_replay.py --retailer carr --pages 500
+    PYTHONPATH=app PARSE_WORKERS=4 python benchmarks/bench_replay.py data/pages/carr-20261019T060000.jsonl.gz
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import resource
+import tempfile
+import tracemalloc
+
+from data_builder import DEFAULT_BATCH_ROWS
+from extractor.carr_extractor import CarrExtractor
+from extractor.merc_extractor import MercExtractor
+from replay import replay_archive
+from replay import write_page_archive
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "html")
+FIXTURE_SOURCES = {
+    "merc": (MercExtractor, "https://tienda.mercadona.es", "merc_category.html"),
+    "carr": (CarrExtractor, "https://www.carrefour.es/supermercado", "carr_category.html"),
+}
+MIB = 1024 * 1024
+
+
+def build_fixture_archive(path: str, retailer: str, pages: int) -> None:
+    extractor_cls, data_source_url, fixture = FIXTURE_SOURCES[retailer]
+    with open(os.path.join(FIXTURES_DIR, fixture), encoding="utf-8") as f:
+        html = f.read()
+    category_pages = (
+        (f"Categoria {i // 10} > Sub {i % 10}", f"{data_source_url}/c?offset={i * 24}", html) for i in range(pages)
+    )
+    write_page_archive(path, extractor_cls(data_source_url, "bench"), category_pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded pages through the ingestion pipeline")
+    parser.add_argument("archive", nargs="?", help="Recorded page archive (.jsonl.gz); built from fixtures if omitted")
+    parser.add_argument("--retailer", choices=sorted(FIXTURE_SOURCES), default="merc", help="Fixture to build from")
+    parser.add_argument("--pages", type=int, default=200, help="Pages in the archive built from fixtures")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per record batch")
+    parser.add_argument("--repeat", type=int, default=3, help="Replays to run")
+    parser.add_argument("--trace-memory", action="store_true", help="Report the peak of Python allocations (slower)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = args.archive
+        if archive is None:
+            archive = os.path.join(tmp_dir, f"{args.retailer}.jsonl.gz")
+            build_fixture_archive(archive, args.retailer, args.pages)
+        print(f"archive: {archive} ({os.path.getsize(archive) / MIB:.1f} MiB compressed)\n")
+
+        print(f"{'run':>3} {'pages':>7} {'rows':>9} {'s':>7} {'pages/s':>9} {'rows/s':>10} {'MiB/s':>7} {'out MiB':>8}")
+        for run in range(1, args.repeat + 1):
+            if args.trace_memory:
+                tracemalloc.start()
+            result = replay_archive(archive, os.path.join(tmp_dir, "out.parquet"), args.batch_rows)
+            traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+            if args.trace_memory:
+                tracemalloc.stop()
+            print(
+                f"{run:>3} {result.pages:>7} {result.rows:>9} {result.seconds:>7.2f} "
+                f"{result.pages / result.seconds:>9.1f} {result.rows / result.seconds:>10.0f} "
+                f"{result.page_bytes / MIB / result.seconds:>7.1f} {result.output_bytes / MIB:>8.2f}"
+                + (f"  python peak {traced_peak / MIB:.1f} MiB" if traced_peak is not None else "")
+            )
+
+    # ru_maxrss is in KiB on Linux
+    print(f"\npeak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark of the StorageStreamUploader buffer against the previous immutable-bytes buffer, without network I/O.
+
+Every transmit reads one chunk from the uploader like ResumableUpload does, so only buffering costs are measured.
+Linear behaviour shows up as a constant MB/s whatever the stream size; the previous buffer re-copies the pending
+bytes on every append and on every chunk taken, which degrades with large writes and with many small ones.
+
+Run from the ingestor directory:
+
+    PYTHONPATH=app python benchmarks/bench_stream_uploader.py --sizes 64 256 512
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Callable
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.storage import Client
+from writer import CHUNK_SIZE
+from writer import PARQUET_CHUNK_SIZE
+from writer import StorageStreamUploader
+
+MIB = 1024 * 1024
+
+
+class NullResumableRequest:
+    """Stands in for ResumableUpload: consumes the stream chunk by chunk and discards it."""
+
+    def __init__(self, stream, chunk_size: int):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self.finished = False
+
+    @property
+    def bytes_uploaded(self) -> int:
+        return self._stream.tell()
+
+    def transmit_next_chunk(self, transport):
+        if len(self._stream.read(self._chunk_size)) < self._chunk_size:
+            self.finished = True
+
+
+class LegacyBytesBuffer:
+    """The buffer StorageStreamUploader used before: immutable bytes, re-sliced on every read."""
+
+    def __init__(self, chunk_size: int):
+        self._buffer = b""
+        self._buffer_size = 0
+        self._chunk_size = chunk_size
+        self._read = 0
+        self._request = NullResumableRequest(self, chunk_size)
+
+    def write(self, data: bytes) -> int:
+        self._buffer_size += len(data)
+        self._buffer += data
+        while self._buffer_size >= self._chunk_size:
+            self._request.transmit_next_chunk(None)
+        return len(data)
+
+    def read(self, chunk_size: int) -> bytes:
+        to_read = min(chunk_size, self._buffer_size)
+        memview = memoryview(self._buffer)
+        self._buffer = memview[to_read:].tobytes()
+        self._read += to_read
+        self._buffer_size -= to_read
+        return memview[:to_read].tobytes()
+
+    def tell(self) -> int:
+        return self._read
+
+    def stop(self):
+        while not self._request.finished:
+            self._request.transmit_next_chunk(None)
+
+
+def make_uploader(chunk_size: int) -> StorageStreamUploader:
+    client = Client(project="bench", credentials=AnonymousCredentials())
+    uploader = StorageStreamUploader(client, "bench", "bench.bin", chunk_size=chunk_size)
+    uploader._request = NullResumableRequest(uploader, chunk_size)
+    return uploader
+
+
+def run(make: Callable[[int], object], chunk_size: int, total_bytes: int, write_size: int) -> float:
+    uploader = make(chunk_size)
+    block = b"x" * write_size
+    start = time.perf_counter()
+    for _ in range(total_bytes // write_size):
+        uploader.write(block)
+    uploader.stop()
+    elapsed = time.perf_counter() - start
+    assert uploader.tell() == total_bytes // write_size * write_size
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark StorageStreamUploader buffering")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 512], help="Stream sizes in MiB")
+    parser.add_argument("--chunk-size", type=int, default=PARQUET_CHUNK_SIZE, help="Upload chunk size in bytes")
+    args = parser.parse_args()
+
+    patterns = [
+        ("4 KiB writes", lambda total: 4 * 1024),
+        ("1 MiB writes", lambda total: MIB),
+        ("single write", lambda total: total),
+    ]
+    print(f"chunk size: {args.chunk_size // 1024} KiB (multiple of {CHUNK_SIZE // 1024} KiB)\n")
+    print(f"{'pattern':<14} {'MiB':>6} {'legacy s':>10} {'legacy MiB/s':>13} {'new s':>8} {'new MiB/s':>10}")
+    for label, write_size in patterns:
+        for size in args.sizes:
+            total = size * MIB
+            legacy = run(LegacyBytesBuffer, args.chunk_size, total, write_size(total))
+            new = run(make_uploader, args.chunk_size, total, write_size(total))
+            print(f"{label:<14} {size:>6} {legacy:>10.2f} {size / legacy:>13.0f} {new:>8.2f} {size / new:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""A minimal in-process fake of the GCS resumable upload endpoint.
+
+Only the requests StorageStreamUploader makes are supported: initiating a resumable session, uploading chunks with a
+Content-Range header and querying the upload status for recovery. Faults can be queued to exercise the retry and
+recover paths.
+"""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict
+from typing import List
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+CONTENT_RANGE_RE = re.compile(r"bytes (?:(?P<start>\d+)-(?P<end>\d+)|\*)/(?P<total>\d+|\*)")
+UPLOAD_PATH_RE = re.compile(r"^/upload/storage/v1/b/(?P<bucket>[^/]+)/o$")
+
+# Fault kinds
+FAIL = "fail"  # reject the chunk with a 400 without storing it
+PARTIAL = "partial"  # store only half of the chunk and report it with a 308
+
+
+class FakeGCSServer:
+    def __init__(self):
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.content_types: Dict[Tuple[str, str], str] = {}
+        self.chunk_sizes: List[int] = []
+        self.faults: List[str] = []
+        self._sessions: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def open_sessions(self) -> int:
+        return sum(1 for session in self._sessions.values() if not session["finished"])
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_):
+                pass
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def _reply(self, status: int, headers: Dict[str, str] = None, body: bytes = b""):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                parsed = urlparse(self.path)
+                match = UPLOAD_PATH_RE.match(parsed.path)
+                if not match or parse_qs(parsed.query).get("uploadType") != ["resumable"]:
+                    return self._reply(404)
+                metadata = json.loads(self._body() or b"{}")
+                with fake._lock:
+                    upload_id = str(len(fake._sessions) + 1)
+                    fake._sessions[upload_id] = {
+                        "bucket": match.group("bucket"),
+                        "name": metadata["name"],
+                        "content_type": self.headers.get("X-Upload-Content-Type"),
+                        "data": bytearray(),
+                        "finished": False,
+                    }
+                location = f"{fake.url}{parsed.path}?uploadType=resumable&upload_id={upload_id}"
+                self._reply(200, {"Location": location})
+
+            def do_PUT(self):
+                upload_id = parse_qs(urlparse(self.path).query).get("upload_id", [None])[0]
+                session = fake._sessions.get(upload_id)
+                body = self._body()
+                match = CONTENT_RANGE_RE.match(self.headers.get("Content-Range", ""))
+                if session is None or match is None:
+                    return self._reply(404)
+
+                with fake._lock:
+                    if body and fake.faults:
+                        fault = fake.faults.pop(0)
+                        if fault == FAIL:
+                            return self._reply(400, body=b"simulated failure")
+                        if fault == PARTIAL:
+                            body = body[: len(body) // 2]
+                            match = None
+
+                    data = session["data"]
+                    if body:
+                        start = int(CONTENT_RANGE_RE.match(self.headers["Content-Range"]).group("start"))
+                        if start != len(data):
+                            return self._reply(400, body=b"unexpected offset")
+                        data.extend(body)
+                        fake.chunk_sizes.append(len(body))
+
+                    total = match.group("total") if match else "*"
+                    if total != "*" and int(total) == len(data):
+                        session["finished"] = True
+                        key = (session["bucket"], session["name"])
+                        fake.objects[key] = bytes(data)
+                        fake.content_types[key] = session["content_type"]
+                        payload = {"bucket": session["bucket"], "name": session["name"], "size": str(len(data))}
+                        return self._reply(200, {"Content-Type": "application/json"}, json.dumps(payload).encode())
+
+                headers = {"Range": f"bytes=0-{len(data) - 1}"} if data else {}
+                self._reply(308, headers)
+
+        return Handler
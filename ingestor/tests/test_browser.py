@@ -0,0 +1,414 @@
+import os
+import re
+import time
+from fnmatch import fnmatchcase
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import call
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from extractor.browser import ADAPTIVE_WAITS
+from extractor.browser import AdaptiveWaiter
+from extractor.browser import block_urls
+from extractor.browser import COMMON_BLOCKED_URL_PATTERNS
+from extractor.browser import FIXED_WAITS
+from extractor.browser import get_blocked_url_patterns
+from extractor.browser import get_browser_session
+from extractor.browser import get_wait_strategy
+from extractor.browser import NavigationStats
+from extractor.browser import percentile
+from extractor.browser import WAIT_PRESENT
+from extractor.browser import WAIT_SETTLED
+from extractor.browser import WAIT_TIMED_OUT
+from extractor.carr_extractor import CarrExtractor
+from extractor.merc_extractor import MercExtractor
+from selenium.common.exceptions import JavascriptException
+from tests.test_extractor import load_html_fixture
+
+
+def is_blocked(url, patterns):
+    # Same whole-URL wildcard semantics as Network.setBlockedURLs
+    return any(fnmatchcase(url, pattern) for pattern in patterns)
+
+
+class TestResourceBlocking(TestCase):
+    def test_common_patterns_block_heavy_resources_only(self):
+        blocked = [
+            "https://static.example.com/fonts/Roboto.woff2",
+            "https://static.carrefour.es/hd_350x_/img_pim_food/000001_00_1.jpg?fit=crop&h=300",
+            "https://www.googletagmanager.com/gtm.js?id=GTM-XXXX",
+            "https://www.google-analytics.com/g/collect?v=2",
+            "https://connect.facebook.net/en_US/fbevents.js",
+        ]
+        allowed = [
+            "https://www.carrefour.es/supermercado/frescos/cat20002/c?offset=24",
+            "https://www.carrefour.es/static/app.bundle.js",
+            "https://tienda.mercadona.es/api/categories/",
+            "https://cdn.cookielaw.org/scripttemplates/otSDKStub.js",
+        ]
+
+        for url in blocked:
+            self.assertTrue(is_blocked(url, COMMON_BLOCKED_URL_PATTERNS), url)
+        for url in allowed:
+            self.assertFalse(is_blocked(url, COMMON_BLOCKED_URL_PATTERNS), url)
+
+    def test_retailer_patterns_block_product_images(self):
+        merc_images = re.findall(r'src="(https://[^"]+)"', load_html_fixture("merc_category.html"))
+        self.assertTrue(merc_images)
+        for url in merc_images:
+            self.assertTrue(is_blocked(url.replace("&amp;", "&"), MercExtractor.BLOCKED_URL_PATTERNS), url)
+        self.assertTrue(
+            is_blocked(
+                "https://static.carrefour.es/hd_350x_/img_pim_food/000001_00_1", CarrExtractor.BLOCKED_URL_PATTERNS
+            )
+        )
+
+    def test_get_blocked_url_patterns(self):
+        with patch.dict(os.environ, {"EXTRA_BLOCKED_URLS": " *://ads.example.com/* ,,*.woff"}, clear=True):
+            patterns = get_blocked_url_patterns(("*://cdn.example.com/*",))
+
+        self.assertEqual(patterns[: len(COMMON_BLOCKED_URL_PATTERNS)], list(COMMON_BLOCKED_URL_PATTERNS))
+        self.assertEqual(
+            patterns[len(COMMON_BLOCKED_URL_PATTERNS) :], ["*://cdn.example.com/*", "*://ads.example.com/*"]
+        )
+
+    def test_blocking_can_be_disabled(self):
+        with patch.dict(os.environ, {"BLOCK_RESOURCES": "off"}):
+            self.assertEqual(get_blocked_url_patterns(("*://cdn.example.com/*",)), [])
+        with patch.dict(os.environ, {"BLOCK_RESOURCES": "maybe"}):
+            with self.assertRaises(ValueError):
+                get_blocked_url_patterns()
+
+    def test_block_urls_sends_the_patterns_over_cdp(self):
+        driver = MagicMock()
+
+        block_urls(driver, ["*.woff"])
+
+        driver.execute_cdp_cmd.assert_has_calls(
+            [call("Network.enable", {}), call("Network.setBlockedURLs", {"urls": ["*.woff"]})]
+        )
+
+    def test_block_urls_without_patterns_does_nothing(self):
+        driver = MagicMock()
+
+        block_urls(driver, [])
+
+        driver.execute_cdp_cmd.assert_not_called()
+
+    def test_each_driver_gets_its_own_debugging_port_and_profile(self):
+        with patch.dict(os.environ, {}, clear=True), patch("extractor.webdriver.Chrome") as mock_chrome, patch(
+            "extractor.Service"
+        ):
+            extractors = [CarrExtractor("https://www.carrefour.es/supermercado", "bucket") for _ in range(2)]
+            drivers = [extractor.start_driver() for extractor in extractors]
+            arguments = [call.kwargs["options"].arguments for call in mock_chrome.call_args_list]
+            profile_dirs = [extractor.profile_dir for extractor in extractors]
+            self.assertTrue(all(os.path.isdir(profile_dir) for profile_dir in profile_dirs))
+            for extractor, driver in zip(extractors, drivers):
+                extractor.quit_driver(driver)
+
+        self.assertNotEqual(profile_dirs[0], profile_dirs[1])
+        for profile_dir, driver_arguments in zip(profile_dirs, arguments):
+            # Port 0 lets Chrome pick a free port instead of every process claiming the same one
+            self.assertIn("--remote-debugging-port=0", driver_arguments)
+            self.assertIn(f"--user-data-dir={profile_dir}", driver_arguments)
+            self.assertFalse(os.path.exists(profile_dir))
+        drivers[0].quit.assert_called()
+
+    def test_start_driver_uses_the_retailer_patterns(self):
+        extractor = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+
+        with patch.dict(os.environ, {}, clear=True), patch.object(CarrExtractor, "initialize_driver") as mock_init:
+            extractor.start_driver()
+
+        patterns = mock_init.call_args.args[0]
+        self.assertIn("*://static.carrefour.es/hd_*", patterns)
+        self.assertIn("*.woff2", patterns)
+
+
+class TestNavigationStats(TestCase):
+    def test_percentile(self):
+        self.assertEqual(percentile([3.0], 0.95), 3.0)
+        self.assertEqual(percentile([float(i) for i in range(1, 101)], 0.95), 95.0)
+        self.assertEqual(percentile([5.0, 1.0, 2.0], 0.5), 2.0)
+
+    def test_summary_per_phase(self):
+        stats = NavigationStats()
+        for seconds in (1.0, 2.0, 3.0):
+            stats.record("load", seconds)
+        stats.record("ready", 0.5)
+
+        summary = stats.summary()
+
+        self.assertEqual(summary["load"]["navigations"], 3)
+        self.assertEqual(summary["load"]["total_seconds"], 6.0)
+        self.assertEqual(summary["load"]["mean_seconds"], 2.0)
+        self.assertEqual(summary["load"]["p95_seconds"], 3.0)
+        self.assertEqual(summary["ready"]["max_seconds"], 0.5)
+
+    def test_timed_records_even_when_the_navigation_fails(self):
+        stats = NavigationStats()
+
+        with self.assertRaises(TimeoutError):
+            with stats.timed("ready"):
+                raise TimeoutError()
+
+        self.assertEqual(len(stats.samples["ready"]), 1)
+
+    def test_navigate_times_driver_get(self):
+        extractor = MercExtractor("https://tienda.mercadona.es", "bucket")
+        driver = MagicMock()
+
+        extractor.navigate(driver, "https://tienda.mercadona.es/categories")
+
+        driver.get.assert_called_once_with("https://tienda.mercadona.es/categories")
+        self.assertEqual(extractor.navigation_stats.summary()["load"]["navigations"], 1)
+
+
+class FakeRenderingDriver:
+    """Element appears after appear_after seconds (never if None); the DOM settles after settle_after seconds."""
+
+    def __init__(self, appear_after=None, settle_after=0.0):
+        self.start = time.monotonic()
+        self.appear_after = appear_after
+        self.settle_after = settle_after
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def find_elements(self, by, selector):
+        return ["element"] if self.appear_after is not None and self.elapsed() >= self.appear_after else []
+
+    def execute_script(self, script):
+        # Milliseconds the DOM has been quiet for
+        return max(0.0, self.elapsed() - self.settle_after) * 1000
+
+
+class TestAdaptiveWaiter(TestCase):
+    def make_waiter(self, strategy=ADAPTIVE_WAITS, **kwargs):
+        return AdaptiveWaiter(NavigationStats(), strategy, quiet_seconds=0.05, poll_frequency=0.01, **kwargs)
+
+    def test_returns_as_soon_as_the_element_is_present(self):
+        waiter = self.make_waiter()
+
+        self.assertTrue(waiter.wait_for_optional(FakeRenderingDriver(appear_after=0.0), ".pagination", "p", 2))
+        self.assertEqual(waiter.outcomes["p"], {WAIT_PRESENT: 1})
+
+    def test_settled_page_without_the_element_short_circuits(self):
+        waiter = self.make_waiter()
+        start = time.monotonic()
+
+        present = waiter.wait_for_optional(FakeRenderingDriver(settle_after=0.1), ".pagination", "p", 2)
+
+        self.assertFalse(present)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(waiter.outcomes["p"], {WAIT_SETTLED: 1})
+        self.assertEqual(len(waiter.stats.samples["wait p"]), 1)
+
+    def test_element_appearing_while_the_dom_changes_is_found(self):
+        waiter = self.make_waiter()
+
+        self.assertTrue(
+            waiter.wait_for_optional(FakeRenderingDriver(appear_after=0.2, settle_after=10), ".pagination", "p", 2)
+        )
+
+    def test_settle_delay_is_learned_from_appearances(self):
+        waiter = self.make_waiter(min_samples=3, min_timeout=0.1, margin=2.0)
+        self.assertEqual(waiter.settle_after("p", 2), 0.1)
+
+        waiter.appear_seconds["p"].extend([0.1, 0.2, 0.3])
+
+        self.assertAlmostEqual(waiter.settle_after("p", 2), 0.6)
+        self.assertEqual(waiter.settle_after("p", 0.4), 0.4)
+        waiter.appear_seconds["p"][:] = [0.01, 0.01, 0.01]
+        self.assertEqual(waiter.settle_after("p", 2), 0.1)
+
+    def test_element_appearing_after_the_learned_delay_on_a_busy_page_is_found(self):
+        waiter = self.make_waiter(min_samples=5, min_timeout=0.1)
+        waiter.appear_seconds["p"].extend([0.02, 0.03, 0.03, 0.04, 0.05])
+        self.assertEqual(waiter.settle_after("p", 2), 0.1)
+
+        # A slow page: the DOM keeps changing until the pagination renders, well after the learned delay
+        present = waiter.wait_for_optional(
+            FakeRenderingDriver(appear_after=0.4, settle_after=0.4), ".pagination", "p", 2
+        )
+
+        self.assertTrue(present)
+        self.assertEqual(waiter.outcomes["p"], {WAIT_PRESENT: 1})
+
+    def test_a_never_settling_page_waits_the_whole_ceiling(self):
+        waiter = self.make_waiter(min_samples=1, min_timeout=0.1)
+        waiter.appear_seconds["p"].append(0.05)
+        start = time.monotonic()
+
+        present = waiter.wait_for_optional(FakeRenderingDriver(settle_after=10), ".pagination", "p", 0.3)
+
+        self.assertFalse(present)
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        self.assertEqual(waiter.outcomes["p"], {WAIT_TIMED_OUT: 1})
+
+    def test_settling_does_not_end_a_wait_before_the_fastest_appearance(self):
+        waiter = self.make_waiter(min_timeout=0.05)
+        waiter.appear_seconds["p"].append(0.4)
+        start = time.monotonic()
+
+        present = waiter.wait_for_optional(FakeRenderingDriver(settle_after=0.0), ".pagination", "p", 2)
+
+        self.assertFalse(present)
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        self.assertEqual(waiter.outcomes["p"], {WAIT_SETTLED: 1})
+
+    def test_learned_settle_delay_is_not_shorter_than_the_fastest_appearance(self):
+        waiter = self.make_waiter(min_samples=3, min_timeout=0.1, margin=0.5)
+        waiter.appear_seconds["p"].extend([0.4, 0.5, 0.6])
+
+        self.assertEqual(waiter.settle_after("p", 2), 0.4)
+
+    def test_browser_errors_fall_back_to_a_fixed_wait(self):
+        class BrokenScriptDriver(FakeRenderingDriver):
+            def execute_script(self, script):
+                raise JavascriptException("javascript error: performance is not defined")
+
+        waiter = self.make_waiter(min_timeout=0.0)
+
+        self.assertTrue(waiter.wait_for_optional(BrokenScriptDriver(appear_after=0.2), ".pagination", "p", 2))
+        self.assertFalse(waiter.wait_for_optional(BrokenScriptDriver(), ".pagination", "q", 0.2))
+        self.assertEqual(waiter.outcomes["p"], {WAIT_PRESENT: 1})
+        self.assertEqual(waiter.outcomes["q"], {WAIT_TIMED_OUT: 1})
+
+    def test_fixed_strategy_waits_the_whole_timeout(self):
+        waiter = self.make_waiter(FIXED_WAITS, min_samples=1)
+        waiter.appear_seconds["p"].append(0.01)
+        start = time.monotonic()
+
+        self.assertFalse(waiter.wait_for_optional(FakeRenderingDriver(), ".pagination", "p", 0.3))
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        self.assertEqual(waiter.outcomes["p"], {WAIT_TIMED_OUT: 1})
+
+    def test_get_wait_strategy(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(get_wait_strategy(), ADAPTIVE_WAITS)
+        with patch.dict(os.environ, {"WAIT_STRATEGY": "Fixed"}):
+            self.assertEqual(get_wait_strategy(), FIXED_WAITS)
+        with patch.dict(os.environ, {"WAIT_STRATEGY": "psychic"}):
+            with self.assertRaises(ValueError):
+                get_wait_strategy()
+
+
+class FakeSessionDriver:
+    """Keeps cookies and localStorage like a browser tab on a single site."""
+
+    def __init__(self, current_url="https://www.carrefour.es/supermercado", domain=".carrefour.es"):
+        self.current_url = current_url
+        self.domain = domain
+        self.cookies = {}
+        self.local_storage = {}
+        self.refreshed = 0
+
+    def add_cookie(self, cookie):
+        if not cookie.get("domain", self.domain).endswith(self.domain):
+            raise ValueError("invalid cookie domain")
+        self.cookies[cookie["name"]] = dict(cookie)
+
+    def get_cookies(self):
+        return list(self.cookies.values())
+
+    def get_cookie(self, name):
+        return self.cookies.get(name)
+
+    def delete_all_cookies(self):
+        self.cookies = {}
+
+    def execute_script(self, script, *args):
+        if script.startswith("return"):
+            return dict(self.local_storage)
+        if script == "localStorage.clear();":
+            self.local_storage = {}
+            return
+        self.local_storage.update(args[0])
+
+    def refresh(self):
+        self.refreshed += 1
+
+
+class TestBrowserSession(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.session_dir = tmp_dir.name
+        env_patch = patch.dict(os.environ, {"BROWSER_SESSION_DIR": self.session_dir})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+
+    def onboarded_driver(self):
+        driver = FakeSessionDriver()
+        driver.cookies = {
+            "OptanonAlertBoxClosed": {"name": "OptanonAlertBoxClosed", "value": "2026", "domain": ".carrefour.es"},
+            "tracker": {"name": "tracker", "value": "1", "domain": ".tracker.example", "sameSite": "None"},
+        }
+        driver.local_storage = {"postalCode": "28050"}
+        return driver
+
+    def test_disabled_without_session_dir(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(get_browser_session("carr"))
+
+    def test_save_and_restore_round_trip(self):
+        get_browser_session("carr").save(self.onboarded_driver())
+        fresh = FakeSessionDriver()
+
+        self.assertTrue(get_browser_session("carr").restore(fresh))
+
+        # Third-party cookies cannot be set from the retailer's page and are skipped
+        self.assertEqual(list(fresh.cookies), ["OptanonAlertBoxClosed"])
+        self.assertEqual(fresh.local_storage, {"postalCode": "28050"})
+        self.assertTrue(os.path.exists(os.path.join(self.session_dir, "carr.json")))
+
+    def test_missing_or_stale_session_is_not_restored(self):
+        self.assertFalse(get_browser_session("carr").restore(FakeSessionDriver()))
+
+        get_browser_session("carr").save(self.onboarded_driver())
+        with patch.dict(os.environ, {"BROWSER_SESSION_MAX_AGE_HOURS": "0"}):
+            self.assertFalse(get_browser_session("carr").restore(FakeSessionDriver()))
+
+    def test_unreadable_session_is_ignored(self):
+        with open(os.path.join(self.session_dir, "carr.json"), "w") as f:
+            f.write("{")
+
+        self.assertFalse(get_browser_session("carr").restore(FakeSessionDriver()))
+
+    def test_extractor_skips_onboarding_with_a_valid_session(self):
+        get_browser_session("carr").save(self.onboarded_driver())
+        extractor = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        driver = FakeSessionDriver()
+
+        self.assertTrue(extractor.restore_session(driver))
+        self.assertEqual(driver.refreshed, 1)
+
+    def test_extractor_discards_a_session_that_is_no_longer_valid(self):
+        driver = self.onboarded_driver()
+        del driver.cookies["OptanonAlertBoxClosed"]
+        driver.cookies["session_id"] = {"name": "session_id", "value": "expired", "domain": ".carrefour.es"}
+        get_browser_session("carr").save(driver)
+        extractor = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        fresh = FakeSessionDriver()
+
+        self.assertFalse(extractor.restore_session(fresh))
+
+        self.assertFalse(os.path.exists(os.path.join(self.session_dir, "carr.json")))
+        # Onboarding starts over from a clean, reloaded page rather than from the stale state
+        self.assertEqual(fresh.cookies, {})
+        self.assertEqual(fresh.local_storage, {})
+        self.assertEqual(fresh.refreshed, 2)
+
+    def test_extractor_without_session_dir_onboards(self):
+        extractor = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        driver = self.onboarded_driver()
+
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertFalse(extractor.restore_session(driver))
+            extractor.save_session(driver)
+
+        self.assertEqual(os.listdir(self.session_dir), [])
@@ -2,8 +2,11 @@ from datetime import datetime
 from unittest.mock import patch
 
 import pandas as pd
+import pyarrow as pa
 from data_builder import build_data_gen
-from data_builder import build_df
+from data_builder import RecordBatchBuilder
+from extractor.carr_extractor import CarrExtractor
+from extractor.merc_extractor import MercExtractor
 from tests.conf_test import BasicTestCase
 
 TEST_MODULE = "data_builder"
@@ -36,45 +39,69 @@ class TestDataBuilder(BasicTestCase):
         datetime_patch = patch(f"{TEST_MODULE}.datetime")
         self.addCleanup(datetime_patch.stop)
         self.mock_datetime = datetime_patch.start()
-
-    def test_build_df(self):
-        test_product_gen = mock_gen("test_category")
         self.mock_datetime.now.return_value = datetime(2024, 12, 23)
 
-        expected_cols = ["name", "original_price", "discount_price", "size", "category", "date"]
+        self.schema = MercExtractor.OUTPUT_SCHEMA
+
+    def test_build_data_gen(self):
+        expected_cols = ["name", "original_price", "discount_price", "size", "category", "image_url", "date"]
         expected_data = [
-            ("Sample Product 1", "1,58 €", "1,53 €", "Paquete 1 kg", "test_category", "2024-12-23"),
-            ("Sample Product 2", "1,58 €", "1,53 €", "Paquete 2 kg", "test_category", "2024-12-23"),
+            ("Sample Product 1", "1,58 €", "1,53 €", "Paquete 1 kg", "test_category_1", None, "2024-12-23"),
+            ("Sample Product 2", "1,58 €", "1,53 €", "Paquete 2 kg", "test_category_1", None, "2024-12-23"),
+            ("Sample Product 1", "1,58 €", "1,53 €", "Paquete 1 kg", "test_category_2", None, "2024-12-23"),
+            ("Sample Product 2", "1,58 €", "1,53 €", "Paquete 2 kg", "test_category_2", None, "2024-12-23"),
         ]
         expected_df = pd.DataFrame(expected_data, columns=expected_cols)
 
-        actual_df = build_df(test_product_gen)
-        self.assert_pandas_dataframes_equal(expected_df, actual_df)
+        actual = list(build_data_gen(mock_product_gen_list(), self.schema))
 
-    def test_build_data_gen(self):
-        test_product_gen_list = [mock_gen("test_category_1"), mock_gen("test_category_2")]
-        self.mock_datetime.now.return_value = datetime(2024, 12, 23)
+        self.assertEqual(len(actual), 1)
+        self.assertIsInstance(actual[0], pa.RecordBatch)
+        self.assertEqual(actual[0].schema, self.schema)
+        self.assert_pandas_dataframes_equal(expected_df, actual[0].to_pandas())
 
-        expected_cols = ["name", "original_price", "discount_price", "size", "category", "date"]
-        expected_data_1 = [
-            ("Sample Product 1", "1,58 €", "1,53 €", "Paquete 1 kg", "test_category_1", "2024-12-23"),
-            ("Sample Product 2", "1,58 €", "1,53 €", "Paquete 2 kg", "test_category_1", "2024-12-23"),
-        ]
-        expected_df_1 = pd.DataFrame(expected_data_1, columns=expected_cols)
-
-        expected_data_2 = [
-            ("Sample Product 1", "1,58 €", "1,53 €", "Paquete 1 kg", "test_category_2", "2024-12-23"),
-            ("Sample Product 2", "1,58 €", "1,53 €", "Paquete 2 kg", "test_category_2", "2024-12-23"),
-        ]
-        expected_df_2 = pd.DataFrame(expected_data_2, columns=expected_cols)
+    def test_build_data_gen_batches_span_categories(self):
+        product_gen_list = [mock_gen("test_category_1", 3), mock_gen("test_category_2", 4), mock_gen("empty", 0)]
 
-        actual = build_data_gen(test_product_gen_list)
+        actual = list(build_data_gen(product_gen_list, self.schema, batch_rows=2))
 
-        self.assert_pandas_dataframes_equal(expected_df_1, next(actual))
-        self.assert_pandas_dataframes_equal(expected_df_2, next(actual))
+        self.assertEqual([batch.num_rows for batch in actual], [2, 2, 2, 1])
+        self.assertEqual(actual[1].column("category").to_pylist(), ["test_category_1", "test_category_2"])
+        self.assertTrue(all(batch.schema == self.schema for batch in actual))
 
     def test_build_data_gen_empty_sources(self):
         test_product_gen_list = []
         expected = []
-        actual = build_data_gen(test_product_gen_list)
+        actual = build_data_gen(test_product_gen_list, self.schema)
         self.assertEqual(expected, list(actual))
+
+    def test_build_data_gen_uses_declared_schema_when_columns_are_all_null(self):
+        rows = [{"name": "Product A", "original_price": "2,00 €", "discount_price": None, "product_url": None}]
+
+        batch = next(build_data_gen([iter(rows)], CarrExtractor.OUTPUT_SCHEMA))
+
+        self.assertEqual(batch.schema, CarrExtractor.OUTPUT_SCHEMA)
+        self.assertEqual(batch.column("discount_price").type, pa.string())
+        self.assertEqual(batch.column("price_per_unit").to_pylist(), [None])
+
+    def test_record_batch_builder_drops_unknown_fields(self):
+        builder = RecordBatchBuilder(self.schema, "2024-12-23")
+
+        builder.append({"name": "Product A", "unexpected": "x"})
+        builder.append({"name": "Product B", "unexpected": "y"})
+        batch = builder.flush()
+
+        self.assertEqual(batch.schema.names, self.schema.names)
+        self.assertEqual(batch.column("date").to_pylist(), ["2024-12-23", "2024-12-23"])
+        self.mock_logger.warning.assert_called_once()
+        self.assertEqual(len(builder), 0)
+
+    def test_record_batch_builder_signals_full_batches(self):
+        builder = RecordBatchBuilder(self.schema, "2024-12-23", batch_rows=2)
+
+        self.assertFalse(builder.append({"name": "Product A"}))
+        self.assertTrue(builder.append({"name": "Product B"}))
+
+    def test_record_batch_builder_rejects_invalid_batch_size(self):
+        with self.assertRaises(ValueError):
+            RecordBatchBuilder(self.schema, "2024-12-23", batch_rows=0)
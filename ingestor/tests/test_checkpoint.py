@@ -0,0 +1,245 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pyarrow.parquet as pq
+from checkpoint import BucketCheckpointStore
+from checkpoint import category_slug
+from checkpoint import get_checkpoint_mode
+from checkpoint import ingest_with_checkpoints
+from checkpoint import LocalCheckpointStore
+from checkpoint import Manifest
+from extractor import Extractor
+from extractor.merc_extractor import MercExtractor
+from google.api_core.exceptions import NotFound
+from pipeline import CapturedPage
+
+RUN_DATE = "2026-10-17"
+
+
+def make_rows(category: str, n_rows: int):
+    return [
+        {"name": f"{category} product {i}", "original_price": "1,00 €", "category": category} for i in range(n_rows)
+    ]
+
+
+CATALOG = {
+    "Frescos": {"Frutas": make_rows("Frescos > Frutas", 3), "Verduras": make_rows("Frescos > Verduras", 2)},
+    "Bebidas": {"Agua": make_rows("Bebidas > Agua", 4)},
+    "Limpieza": {"Hogar": make_rows("Limpieza > Hogar", 1)},
+}
+
+
+class FakeCatalogExtractor(Extractor):
+    RETAILER = MercExtractor.RETAILER
+    OUTPUT_SCHEMA = MercExtractor.OUTPUT_SCHEMA
+
+    def __init__(self, catalog, fail_at=None, skip_at=None):
+        super().__init__("https://example.com", "bucket")
+        self.catalog = catalog
+        self.fail_at = fail_at
+        # A subcategory that fails to load, logged and skipped like the extractors do
+        self.skip_at = skip_at
+        self.captured = []
+
+    def capture_pages(self, emit):
+        for category_name, subcategories in self.catalog.items():
+            if self.is_category_completed(category_name):
+                continue
+            completed = True
+            for subcategory_name, rows in subcategories.items():
+                label = f"{category_name} > {subcategory_name}"
+                if label == self.fail_at:
+                    raise RuntimeError("browser crashed")
+                if label == self.skip_at:
+                    completed = False
+                    continue
+                self.captured.append(label)
+                emit(CapturedPage(label, f"https://example.com/{subcategory_name}", rows))
+            self.end_category(emit, category_name, completed)
+
+    def parse_page(self, page):
+        return list(page.source)
+
+
+class TestCheckpointHelpers(TestCase):
+    def test_category_slug(self):
+        self.assertEqual(category_slug("Aceite, especias y salsas"), "aceite-especias-y-salsas")
+        self.assertEqual(category_slug("Congelados & Helados"), "congelados-helados")
+        self.assertEqual(category_slug("Perfumería e higiene"), "perfumeria-e-higiene")
+        self.assertEqual(category_slug("¿?"), "unnamed")
+
+    def test_captured_page_group_is_the_top_level_category(self):
+        self.assertEqual(CapturedPage("Frescos > Frutas", "", "").group, "Frescos")
+        self.assertEqual(CapturedPage("Frescos", "", "").group, "Frescos")
+
+    def test_get_checkpoint_mode(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(get_checkpoint_mode(), "off")
+        with patch.dict(os.environ, {"CHECKPOINT_MODE": " Resume "}):
+            self.assertEqual(get_checkpoint_mode(), "resume")
+        with patch.dict(os.environ, {"CHECKPOINT_MODE": "sometimes"}):
+            with self.assertRaises(ValueError):
+                get_checkpoint_mode()
+
+    def test_manifest_round_trip(self):
+        manifest = Manifest(RUN_DATE)
+        manifest.mark_completed("Perfumería", "part-perfumeria.parquet", 7)
+
+        actual = Manifest.from_json(manifest.to_json())
+
+        self.assertEqual(actual.categories["Perfumería"]["rows"], 7)
+        self.assertEqual(actual.total_rows, 7)
+        self.assertFalse(actual.complete)
+
+
+class TestIngestWithCheckpoints(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.run_dir = os.path.join(tmp_dir.name, "merc", RUN_DATE)
+        self.store = LocalCheckpointStore(self.run_dir)
+
+    def read_manifest(self):
+        with open(os.path.join(self.run_dir, "_manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_part(self, part_name):
+        return pq.read_table(os.path.join(self.run_dir, part_name))
+
+    def test_writes_one_part_per_category_and_a_manifest(self):
+        manifest = ingest_with_checkpoints(FakeCatalogExtractor(CATALOG), self.store, RUN_DATE, batch_rows=2)
+
+        self.assertTrue(manifest.complete)
+        self.assertEqual(
+            sorted(os.listdir(self.run_dir)),
+            ["_manifest.json", "part-bebidas.parquet", "part-frescos.parquet", "part-limpieza.parquet"],
+        )
+        frescos = self.read_part("part-frescos.parquet")
+        self.assertEqual(frescos.num_rows, 5)
+        self.assertEqual(frescos.schema, MercExtractor.OUTPUT_SCHEMA)
+        saved = self.read_manifest()
+        self.assertTrue(saved["complete"])
+        self.assertEqual(saved["categories"]["Bebidas"]["rows"], 4)
+        self.assertEqual(saved["categories"]["Bebidas"]["part"], "part-bebidas.parquet")
+
+    def test_failed_run_keeps_completed_categories_only(self):
+        extractor = FakeCatalogExtractor(CATALOG, fail_at="Limpieza > Hogar")
+
+        with self.assertRaisesRegex(RuntimeError, "browser crashed"):
+            ingest_with_checkpoints(extractor, self.store, RUN_DATE, batch_rows=100)
+
+        saved = self.read_manifest()
+        self.assertFalse(saved["complete"])
+        self.assertEqual(list(saved["categories"]), ["Frescos", "Bebidas"])
+        self.assertEqual(
+            sorted(os.listdir(self.run_dir)), ["_manifest.json", "part-bebidas.parquet", "part-frescos.parquet"]
+        )
+
+    def test_category_that_lost_pages_is_not_completed_and_resume_retries_it(self):
+        extractor = FakeCatalogExtractor(CATALOG, skip_at="Frescos > Frutas")
+
+        manifest = ingest_with_checkpoints(extractor, self.store, RUN_DATE, batch_rows=100)
+
+        self.assertTrue(manifest.complete)
+        saved = self.read_manifest()
+        self.assertEqual(list(saved["categories"]), ["Bebidas", "Limpieza"])
+        self.assertEqual(saved["failed"]["Frescos"]["rows"], 2)
+        self.assertEqual(self.read_part("part-frescos.parquet").num_rows, 2)
+
+        retry = FakeCatalogExtractor(CATALOG)
+        manifest = ingest_with_checkpoints(retry, self.store, RUN_DATE, batch_rows=100, resume=True)
+
+        self.assertEqual(retry.captured, ["Frescos > Frutas", "Frescos > Verduras"])
+        self.assertEqual(manifest.failed, {})
+        self.assertEqual(manifest.categories["Frescos"]["rows"], 5)
+        self.assertEqual(self.read_part("part-frescos.parquet").num_rows, 5)
+        self.assertEqual(manifest.total_rows, 10)
+
+    def test_run_without_resume_deletes_the_parts_of_failed_categories(self):
+        ingest_with_checkpoints(
+            FakeCatalogExtractor(CATALOG, skip_at="Frescos > Frutas"), self.store, RUN_DATE, batch_rows=100
+        )
+
+        ingest_with_checkpoints(FakeCatalogExtractor({"Bebidas": CATALOG["Bebidas"]}), self.store, RUN_DATE, 100)
+
+        self.assertEqual(sorted(os.listdir(self.run_dir)), ["_manifest.json", "part-bebidas.parquet"])
+
+    def test_pages_without_an_end_marker_do_not_complete_their_category(self):
+        class UnmarkedExtractor(FakeCatalogExtractor):
+            def end_category(self, emit, category_name, completed):
+                pass
+
+        manifest = ingest_with_checkpoints(UnmarkedExtractor(CATALOG), self.store, RUN_DATE, batch_rows=100)
+
+        self.assertEqual(manifest.categories, {})
+        self.assertEqual(list(manifest.failed), ["Frescos", "Bebidas", "Limpieza"])
+        self.assertEqual(manifest.total_rows, 10)
+
+    def test_resume_only_crawls_missing_categories(self):
+        with self.assertRaises(RuntimeError):
+            ingest_with_checkpoints(
+                FakeCatalogExtractor(CATALOG, fail_at="Limpieza > Hogar"), self.store, RUN_DATE, batch_rows=100
+            )
+        retry = FakeCatalogExtractor(CATALOG)
+
+        manifest = ingest_with_checkpoints(retry, self.store, RUN_DATE, batch_rows=100, resume=True)
+
+        # Bebidas ended before the crash, so only the category in progress is crawled again
+        self.assertEqual(retry.captured, ["Limpieza > Hogar"])
+        self.assertTrue(manifest.complete)
+        self.assertEqual(manifest.total_rows, 10)
+        self.assertEqual(self.read_part("part-frescos.parquet").num_rows, 5)
+
+    def test_run_without_resume_discards_previous_parts(self):
+        ingest_with_checkpoints(FakeCatalogExtractor(CATALOG), self.store, RUN_DATE, batch_rows=100)
+        smaller_catalog = {"Bebidas": CATALOG["Bebidas"]}
+
+        ingest_with_checkpoints(FakeCatalogExtractor(smaller_catalog), self.store, RUN_DATE, batch_rows=100)
+
+        self.assertEqual(sorted(os.listdir(self.run_dir)), ["_manifest.json", "part-bebidas.parquet"])
+        self.assertEqual(list(self.read_manifest()["categories"]), ["Bebidas"])
+
+    def test_categories_without_products_are_recorded_without_part(self):
+        catalog = {"Vacía": {"Nada": []}, "Bebidas": CATALOG["Bebidas"]}
+
+        manifest = ingest_with_checkpoints(FakeCatalogExtractor(catalog), self.store, RUN_DATE, batch_rows=100)
+
+        self.assertEqual(manifest.categories["Vacía"]["rows"], 0)
+        self.assertIsNone(manifest.categories["Vacía"]["part"])
+        self.assertNotIn("part-vacia.parquet", os.listdir(self.run_dir))
+
+    def test_raises_when_no_products_were_extracted(self):
+        with self.assertRaisesRegex(RuntimeError, "No data to write"):
+            ingest_with_checkpoints(FakeCatalogExtractor({"Vacía": {"Nada": []}}), self.store, RUN_DATE, 100)
+
+
+class TestBucketCheckpointStore(TestCase):
+    def setUp(self):
+        singleton_patch = patch("checkpoint.GCSClientSingleton")
+        self.addCleanup(singleton_patch.stop)
+        self.mock_blob = MagicMock()
+        client = singleton_patch.start().get_client.return_value
+        self.mock_bucket = client.bucket.return_value
+        self.mock_bucket.blob.return_value = self.mock_blob
+        self.store = BucketCheckpointStore("test-bucket", f"carr/{RUN_DATE}")
+
+    def test_read_manifest_returns_none_when_missing(self):
+        self.mock_blob.download_as_text.side_effect = NotFound("missing")
+
+        self.assertIsNone(self.store.read_manifest())
+        self.mock_bucket.blob.assert_called_once_with(f"carr/{RUN_DATE}/_manifest.json")
+
+    def test_write_part_streams_to_the_run_prefix(self):
+        with patch("checkpoint.write_chunks_to_blob_as_parquet", return_value=3) as mock_write:
+            self.assertEqual(self.store.write_part("part-frescos.parquet", []), 3)
+
+        mock_write.assert_called_once_with([], "test-bucket", f"carr/{RUN_DATE}/part-frescos.parquet")
+
+    def test_delete_part_ignores_missing_blobs(self):
+        self.mock_blob.delete.side_effect = NotFound("missing")
+
+        self.store.delete_part("part-frescos.parquet")
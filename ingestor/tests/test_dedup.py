@@ -0,0 +1,103 @@
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from dedup import get_row_deduplicator
+from dedup import product_key
+from dedup import row_digest
+from dedup import RowDeduplicator
+from extractor.carr_extractor import CarrExtractor
+from extractor.carr_extractor import extract_carr_product_data
+from pipeline import CapturedPage
+from tests.test_extractor import load_html_fixture
+
+CARR_URL = "https://www.carrefour.es/supermercado"
+COLUMNS = ["name", "price", "size", "category"]
+
+
+class OverlappingCarrExtractor(CarrExtractor):
+    """Captures the same category page at two offsets, like pagination shifting while it is walked."""
+
+    def capture_pages(self, emit):
+        html = load_html_fixture("carr_category.html")
+        emit(CapturedPage("Frescos", f"{CARR_URL}/c?offset=0", html))
+        emit(CapturedPage("Frescos", f"{CARR_URL}/c?offset=24", html))
+        emit(CapturedPage("Despensa", f"{CARR_URL}/d?offset=0", html))
+
+
+class TestRowDigest(TestCase):
+    def test_product_key_prefers_url(self):
+        self.assertEqual(product_key({"product_url": "https://x/p/1", "name": "Leche"}), "https://x/p/1")
+        self.assertEqual(product_key({"product_url": None, "name": "Leche", "size": "1 l"}), "Leche\x1f1 l")
+
+    def test_digest_is_stable_and_field_aligned(self):
+        row = {"name": "Leche", "price": "1,05 €", "size": "1 l", "category": "Frescos"}
+
+        self.assertEqual(row_digest("merc", row, COLUMNS), row_digest("merc", dict(row), COLUMNS))
+        self.assertEqual(len(row_digest("merc", row, COLUMNS)), 16)
+        self.assertNotEqual(row_digest("merc", row, COLUMNS), row_digest("carr", row, COLUMNS))
+        # Missing values and empty strings are different values
+        self.assertNotEqual(
+            row_digest("merc", {**row, "size": None}, COLUMNS), row_digest("merc", {**row, "size": ""}, COLUMNS)
+        )
+
+
+class TestRowDeduplicator(TestCase):
+    def test_only_exact_duplicates_are_dropped(self):
+        row = {"name": "Leche", "price": "1,05 €", "size": "1 l", "category": "Frescos"}
+        deduplicator = RowDeduplicator("merc", COLUMNS)
+
+        first = deduplicator.filter([row, dict(row), {**row, "price": "0,99 €"}])
+        second = deduplicator.filter([dict(row), {**row, "category": "Ofertas"}])
+
+        self.assertEqual([r["price"] for r in first], ["1,05 €", "0,99 €"])
+        self.assertEqual([r["category"] for r in second], ["Ofertas"])
+        self.assertEqual((deduplicator.duplicates, len(deduplicator.seen)), (2, 3))
+
+    def test_ignored_columns_are_not_compared(self):
+        deduplicator = get_row_deduplicator("carr", ["name", "source_page"], ignored_columns=("source_page",))
+
+        rows = deduplicator.filter([{"name": "Leche", "source_page": "a"}, {"name": "Leche", "source_page": "b"}])
+
+        self.assertEqual(rows, [{"name": "Leche", "source_page": "a"}])
+
+    def test_can_be_disabled(self):
+        with patch.dict(os.environ, {"DEDUP_ROWS": "off"}):
+            self.assertIsNone(get_row_deduplicator("merc", COLUMNS))
+        with patch.dict(os.environ, {"DEDUP_ROWS": "maybe"}):
+            with self.assertRaisesRegex(ValueError, "Unsupported DEDUP_ROWS value"):
+                get_row_deduplicator("merc", COLUMNS)
+
+
+class TestExtractorDedup(TestCase):
+    def setUp(self):
+        self.page_rows = len(list(extract_carr_product_data(load_html_fixture("carr_category.html"), "Frescos")))
+
+    def test_repeated_rows_are_dropped_across_pages(self):
+        extractor = OverlappingCarrExtractor(CARR_URL, "bucket")
+
+        with patch.dict(os.environ, {}, clear=True):
+            pages = list(extractor.get_page_sources())
+
+        self.assertEqual([len(rows) for rows in pages], [self.page_rows, 0, self.page_rows])
+        self.assertEqual(extractor.metrics.summary()["duplicate_rows"], self.page_rows)
+
+    def test_grouped_pages_are_deduplicated(self):
+        extractor = OverlappingCarrExtractor(CARR_URL, "bucket")
+
+        with patch.dict(os.environ, {}, clear=True):
+            pages = list(extractor.get_grouped_page_sources())
+
+        self.assertEqual(
+            [(group, len(rows)) for group, rows in pages],
+            [("Frescos", self.page_rows), ("Frescos", 0), ("Despensa", self.page_rows)],
+        )
+
+    def test_rows_are_kept_when_disabled(self):
+        extractor = OverlappingCarrExtractor(CARR_URL, "bucket")
+
+        with patch.dict(os.environ, {"DEDUP_ROWS": "off"}, clear=True):
+            rows = [row for page in extractor.get_page_sources() for row in page]
+
+        self.assertEqual(len(rows), 3 * self.page_rows)
+        self.assertEqual(extractor.metrics.summary()["duplicate_rows"], 0)
@@ -1,15 +1,40 @@
+import json
+import os
 from unittest import TestCase
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 from bs4 import BeautifulSoup
 from extractor import Extractor
+from extractor.carr_extractor import CarrExtractor
 from extractor.carr_extractor import extract_carr_product_data
 from extractor.carr_extractor import get_carr_image_url
+from extractor.html_parser import BS4_BACKEND
+from extractor.html_parser import get_parser_backend
+from extractor.html_parser import LXML_BACKEND
+from extractor.html_parser import parse_html
+from extractor.merc_api_extractor import extract_api_product_data
+from extractor.merc_api_extractor import format_api_price
+from extractor.merc_api_extractor import MercApiExtractor
 from extractor.merc_extractor import extract_product_data
 from extractor.merc_extractor import get_image_url
+from extractor.merc_extractor import MercExtractor
+from main import get_extractor
 from tests.conf_test import BasicTestCase
 
+MERC_API_FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "merc_api")
+HTML_FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "html")
+
+
+def load_merc_api_fixture(name: str) -> dict:
+    with open(os.path.join(MERC_API_FIXTURES_DIR, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_html_fixture(name: str) -> str:
+    with open(os.path.join(HTML_FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
 
 def get_test_html():
     return """
@@ -186,7 +211,10 @@ class DummyExtractor(Extractor):
     def __init__(self, data_source_url="url", bucket_name="bucket", break_early=False, is_test_mode=False):
         super().__init__(data_source_url, bucket_name, break_early, is_test_mode)
 
-    def get_page_sources(self):
+    def capture_pages(self, emit):
+        return None
+
+    def parse_page(self, page):
         return []
 
 
@@ -400,3 +428,175 @@ class TestGetCarrImageUrl(TestCase):
         soup = BeautifulSoup(html, "html.parser")
         result = get_carr_image_url(soup)
         self.assertIsNone(result)
+
+
+class FakeMercApiResponse:
+    def __init__(self, payload=None, headers=None, url=""):
+        self.payload = payload
+        self.headers = headers or {}
+        self.url = url
+        self.text = json.dumps(payload)
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return self.payload
+
+
+class FakeMercApiSession:
+    """Serves the recorded Mercadona API responses in tests/fixtures/merc_api."""
+
+    def __init__(self, warehouse="mad1"):
+        self.headers = {}
+        self.warehouse = warehouse
+        self.requested_params = []
+
+    def put(self, url, json=None, timeout=None):
+        return FakeMercApiResponse(headers={"x-customer-wh": self.warehouse})
+
+    def get(self, url, params=None, timeout=None):
+        self.requested_params.append(params)
+        path = url.split("/api", 1)[1]
+        if path == "/categories/":
+            return FakeMercApiResponse(load_merc_api_fixture("categories.json"), url=url)
+        category_id = path.strip("/").split("/")[-1]
+        return FakeMercApiResponse(load_merc_api_fixture(f"category_{category_id}.json"), url=url)
+
+    def close(self):
+        return None
+
+
+class TestMercApiExtractor(TestCase):
+    def setUp(self):
+        self.session = FakeMercApiSession(warehouse="mad2")
+        session_patch = patch.object(MercApiExtractor, "build_session", return_value=self.session)
+        self.addCleanup(session_patch.stop)
+        session_patch.start()
+
+    def test_extract_api_product_data_matches_html_schema(self):
+        payload = load_merc_api_fixture("category_112.json")
+
+        actual = list(extract_api_product_data(payload, "Aceite, especias y salsas > Aceite, vinagre y sal"))
+
+        self.assertEqual(len(actual), 3)
+        self.assertEqual(
+            actual[0],
+            {
+                "name": "Aceite de oliva 0,4º Hacendado",
+                "original_price": "19,50 €",
+                "discount_price": None,
+                "size": "Garrafa 5 L",
+                "category": "Aceite, especias y salsas > Aceite, vinagre y sal",
+                "image_url": "https://prod-mercadona.imgix.net/images/c1788076223b499bd260c6a03d89b087.jpg",
+            },
+        )
+        self.assertEqual(
+            list(actual[0].keys()), ["name", "original_price", "discount_price", "size", "category", "image_url"]
+        )
+
+    def test_extract_api_product_data_with_discount(self):
+        payload = load_merc_api_fixture("category_112.json")
+
+        actual = list(extract_api_product_data(payload, "test_category"))
+
+        self.assertEqual(actual[1]["original_price"], "6,45 €")
+        self.assertEqual(actual[1]["discount_price"], "5,95 €")
+
+    def test_extract_api_product_data_without_image_and_pack_sizes(self):
+        actual = list(extract_api_product_data(load_merc_api_fixture("category_112.json"), "test_category"))
+        pack = next(extract_api_product_data(load_merc_api_fixture("category_156.json"), "test_category"))
+
+        self.assertIsNone(actual[2]["image_url"])
+        self.assertEqual(actual[2]["size"], "Paquete 1 kg")
+        self.assertEqual(pack["size"], "Pack 6 botellas x 1,5 L")
+
+    def test_format_api_price(self):
+        self.assertEqual(format_api_price("1.53"), "1,53 €")
+        self.assertEqual(format_api_price(" 6.45"), "6,45 €")
+        self.assertIsNone(format_api_price(None))
+        self.assertIsNone(format_api_price(""))
+
+    def test_get_page_sources_uses_postal_code_warehouse(self):
+        extractor = MercApiExtractor("https://tienda.mercadona.es", "bucket")
+
+        product_gen_list = list(extractor.get_page_sources())
+        products = [product for product_gen in product_gen_list for product in product_gen]
+
+        self.assertEqual(len(product_gen_list), 3)
+        self.assertEqual(len(products), 5)
+        self.assertEqual(products[3]["category"], "Aceite, especias y salsas > Especias")
+        self.assertEqual(products[4]["category"], "Agua y refrescos > Agua")
+        self.assertTrue(all(params == {"lang": "es", "wh": "mad2"} for params in self.session.requested_params))
+
+    def test_get_page_sources_break_early(self):
+        extractor = MercApiExtractor("https://tienda.mercadona.es", "bucket", break_early=True)
+
+        product_gen_list = list(extractor.get_page_sources())
+
+        self.assertEqual(len(product_gen_list), 2)
+
+
+class TestGetExtractor(TestCase):
+    def test_get_extractor_defaults_to_browser_extractors(self):
+        self.assertIsInstance(get_extractor("https://tienda.mercadona.es", "bucket"), MercExtractor)
+        self.assertIsInstance(get_extractor("https://www.carrefour.es/supermercado", "bucket"), CarrExtractor)
+
+    def test_get_extractor_returns_api_extractor_for_mercadona(self):
+        extractor = get_extractor("https://tienda.mercadona.es", "bucket", extractor_type="api")
+        self.assertIsInstance(extractor, MercApiExtractor)
+
+    def test_get_extractor_rejects_api_extractor_for_carrefour(self):
+        with self.assertRaises(ValueError):
+            get_extractor("https://www.carrefour.es/supermercado", "bucket", extractor_type="api")
+
+    def test_get_extractor_rejects_unknown_extractor_type(self):
+        with self.assertRaises(ValueError):
+            get_extractor("https://tienda.mercadona.es", "bucket", extractor_type="unknown")
+
+
+class TestHtmlParserBackends(TestCase):
+    def test_merc_backends_produce_identical_output(self):
+        html = load_html_fixture("merc_category.html")
+
+        expected = list(extract_product_data(parse_html(html, BS4_BACKEND), "Aceite > Aceite de oliva"))
+        actual = list(extract_product_data(parse_html(html, LXML_BACKEND), "Aceite > Aceite de oliva"))
+
+        self.assertEqual(len(expected), 72)
+        self.assertEqual(actual, expected)
+
+    def test_carr_backends_produce_identical_output(self):
+        html = load_html_fixture("carr_category.html")
+        args = ("Frescos", "https://www.carrefour.es", "https://www.carrefour.es/supermercado/frescos/cat20002/c")
+
+        expected = list(extract_carr_product_data(parse_html(html, BS4_BACKEND), *args))
+        actual = list(extract_carr_product_data(parse_html(html, LXML_BACKEND), *args))
+
+        self.assertEqual(len(expected), 23)
+        self.assertEqual(actual, expected)
+
+    def test_next_page_url_is_found_from_the_shared_document(self):
+        extractor = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        html = load_html_fixture("carr_category.html")
+        expected = "https://www.carrefour.es/supermercado/frescos/cat20002/c?offset=24"
+
+        for backend in (BS4_BACKEND, LXML_BACKEND):
+            page = parse_html(html, backend)
+            list(extract_carr_product_data(page, "Frescos"))
+            self.assertEqual(extractor._find_next_page_url_from_html(page), expected)
+
+    def test_next_page_url_is_none_on_last_page(self):
+        extractor = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        html = '<div class="pagination"><span class="pagination__next">Siguiente</span></div>'
+
+        for backend in (BS4_BACKEND, LXML_BACKEND):
+            self.assertIsNone(extractor._find_next_page_url_from_html(parse_html(html, backend)))
+
+    def test_parser_backend_defaults_to_lxml(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertEqual(get_parser_backend(), LXML_BACKEND)
+
+    def test_parser_backend_rejects_unknown_backend(self):
+        with patch.dict(os.environ, {"HTML_PARSER_BACKEND": "regex"}):
+            with self.assertRaises(ValueError):
+                get_parser_backend()
@@ -0,0 +1,270 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from extractor.carr_extractor import CarrExtractor
+from extractor.html_parser import parse_html
+from extractor.http_cache import content_hash_of
+from extractor.http_cache import get_http_cache
+from extractor.http_cache import HttpPageCache
+from tests.test_extractor import load_html_fixture
+
+PAGE_URL = "https://www.carrefour.es/supermercado/frescos/cat20002/c?offset=24"
+LAST_PAGE_URL = "https://www.carrefour.es/supermercado/frescos/cat20002/c?offset=48"
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """Serves fixed pages, answering 304 when the If-None-Match header matches the page's ETag."""
+
+    def __init__(self, pages, honour_etags=True):
+        self.pages = dict(pages)
+        self.honour_etags = honour_etags
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        headers = headers or {}
+        self.requests.append((url, headers))
+        text = self.pages[url]
+        etag = f'"{len(text)}-{hash(text)}"'
+        if self.honour_etags and headers.get("If-None-Match") == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, text, {"ETag": etag} if self.honour_etags else {})
+
+
+class TestHttpPageCache(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = tmp_dir.name
+        self.cache = HttpPageCache(self.cache_dir)
+
+    def test_disabled_without_cache_dir(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(get_http_cache())
+        with patch.dict(os.environ, {"HTTP_CACHE_DIR": self.cache_dir}):
+            self.assertEqual(get_http_cache().cache_dir, self.cache_dir)
+
+    def test_first_fetch_is_unconditional(self):
+        session = FakeSession({PAGE_URL: "<html>1</html>"})
+
+        fetched = self.cache.fetch(session, PAGE_URL, timeout=15)
+
+        self.assertEqual(fetched.text, "<html>1</html>")
+        self.assertFalse(fetched.unchanged)
+        self.assertEqual(session.requests, [(PAGE_URL, {})])
+
+    def test_not_modified_serves_the_cached_body(self):
+        session = FakeSession({PAGE_URL: "<html>1</html>"})
+        first = self.cache.fetch(session, PAGE_URL, timeout=15)
+
+        second = HttpPageCache(self.cache_dir).fetch(session, PAGE_URL, timeout=15)
+
+        self.assertEqual(session.requests[1][1], {"If-None-Match": first.entry["etag"]})
+        self.assertEqual(second.text, "<html>1</html>")
+        self.assertTrue(second.unchanged)
+        self.assertEqual(second.content_hash, first.content_hash)
+
+    def test_identical_body_without_validators_is_unchanged(self):
+        session = FakeSession({PAGE_URL: "<html>1</html>"}, honour_etags=False)
+        self.cache.fetch(session, PAGE_URL, timeout=15)
+
+        fetched = self.cache.fetch(session, PAGE_URL, timeout=15)
+
+        self.assertTrue(fetched.unchanged)
+        self.assertEqual(self.cache.stats["unchanged"], 1)
+
+    def test_changed_body_is_not_unchanged_and_forgets_the_next_url(self):
+        session = FakeSession({PAGE_URL: "<html>1</html>"})
+        first = self.cache.fetch(session, PAGE_URL, timeout=15)
+        self.cache.remember_next_url(first, LAST_PAGE_URL)
+        session.pages[PAGE_URL] = "<html>2</html>"
+
+        fetched = self.cache.fetch(session, PAGE_URL, timeout=15)
+
+        self.assertFalse(fetched.unchanged)
+        self.assertEqual(fetched.text, "<html>2</html>")
+        self.assertNotIn("next_url", fetched.entry)
+
+    def test_missing_body_is_fetched_again(self):
+        session = FakeSession({PAGE_URL: "<html>1</html>"})
+        self.cache.fetch(session, PAGE_URL, timeout=15)
+        for name in os.listdir(os.path.join(self.cache_dir, "bodies")):
+            os.remove(os.path.join(self.cache_dir, "bodies", name))
+
+        fetched = self.cache.fetch(session, PAGE_URL, timeout=15)
+
+        self.assertEqual(fetched.text, "<html>1</html>")
+        self.assertEqual(len(session.requests), 3)
+        self.assertEqual(session.requests[2], (PAGE_URL, {}))
+
+    def test_rows_round_trip_per_content_and_category(self):
+        fetched = self.cache.fetch(FakeSession({PAGE_URL: "<html>1</html>"}), PAGE_URL, timeout=15)
+        rows = [{"name": "Plátano", "original_price": "1,99 €"}]
+
+        self.cache.store_rows(self.cache.rows_key(fetched, "Frescos > Frutas"), rows)
+
+        self.assertEqual(self.cache.load_rows(self.cache.rows_key(fetched, "Frescos > Frutas")), rows)
+        self.assertIsNone(self.cache.load_rows(self.cache.rows_key(fetched, "Frescos > Verduras")))
+        self.assertEqual(self.cache.stats["rows_reused"], 1)
+
+    def cached_files(self, sub_dir):
+        return sorted(os.listdir(os.path.join(self.cache_dir, sub_dir)))
+
+    def run_once(self, session, rows):
+        """A run as the extractor does it: fetch, store the parsed rows, then evict what is no longer used."""
+        fetched = self.cache.fetch(session, PAGE_URL, timeout=15)
+        self.cache.store_rows(self.cache.rows_key(fetched, "Frescos > Frutas"), rows)
+        self.cache.evict()
+        return fetched
+
+    def test_eviction_deletes_replaced_content(self):
+        session = FakeSession({PAGE_URL: "<html>1</html>"})
+        first = self.run_once(session, [{"name": "Plátano", "original_price": "1,99 €"}])
+        session.pages[PAGE_URL] = "<html>2</html>"
+
+        second = self.run_once(session, [{"name": "Plátano", "original_price": "2,09 €"}])
+
+        self.assertEqual(self.cached_files("bodies"), [f"{second.content_hash}.html.gz"])
+        self.assertEqual(len(self.cached_files("rows")), 1)
+        self.assertTrue(self.cached_files("rows")[0].startswith(second.content_hash))
+        self.assertIsNone(self.cache.load_rows(self.cache.rows_key(first, "Frescos > Frutas")))
+        self.assertEqual(self.cache.stats["evicted_bodies"], 1)
+
+        # Unchanged content survives the next run, which reuses its rows
+        third = self.run_once(session, [{"name": "Plátano", "original_price": "2,09 €"}])
+        self.assertTrue(third.unchanged)
+        self.assertEqual(self.cached_files("bodies"), [f"{second.content_hash}.html.gz"])
+
+    def test_eviction_expires_entries_not_fetched_for_a_while(self):
+        session = FakeSession({PAGE_URL: "<html>1</html>", LAST_PAGE_URL: "<html>2</html>"})
+        self.cache.fetch(session, PAGE_URL, timeout=15)
+        self.cache.fetch(session, LAST_PAGE_URL, timeout=15)
+        stale_entry = self.cache._entry_path(LAST_PAGE_URL)
+        os.utime(stale_entry, (time.time() - 8 * 24 * 3600,) * 2)
+        # A 304 keeps an entry fresh although it is not rewritten
+        os.utime(self.cache._entry_path(PAGE_URL), (time.time() - 8 * 24 * 3600,) * 2)
+        self.assertTrue(self.cache.fetch(session, PAGE_URL, timeout=15).unchanged)
+
+        self.cache.evict()
+
+        self.assertFalse(os.path.exists(stale_entry))
+        self.assertTrue(os.path.exists(self.cache._entry_path(PAGE_URL)))
+        self.assertEqual(self.cached_files("bodies"), [f"{content_hash_of('<html>1</html>')}.html.gz"])
+
+    def test_unreadable_entry_is_ignored(self):
+        session = FakeSession({PAGE_URL: "<html>1</html>"})
+        self.cache.fetch(session, PAGE_URL, timeout=15)
+        entries_dir = os.path.join(self.cache_dir, "entries")
+        for name in os.listdir(entries_dir):
+            with open(os.path.join(entries_dir, name), "w") as f:
+                f.write("{truncated")
+
+        fetched = self.cache.fetch(session, PAGE_URL, timeout=15)
+
+        self.assertFalse(fetched.unchanged)
+        self.assertEqual(session.requests[1], (PAGE_URL, {}))
+
+
+class TestCarrExtractorHttpCache(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        env_patch = patch.dict(os.environ, {"HTTP_CACHE_DIR": tmp_dir.name})
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+
+        html = load_html_fixture("carr_category.html")
+        self.first_page_html = html
+        self.session = FakeSession(
+            {
+                PAGE_URL: html.replace("c?offset=24", "c?offset=48"),
+                # No next-page button on the last page
+                LAST_PAGE_URL: html.replace("pagination__next", "pagination__end"),
+            }
+        )
+        self.driver = MagicMock(current_url="https://www.carrefour.es/supermercado/frescos/cat20002/c")
+        self.driver.page_source = html
+
+    def capture(self, extractor):
+        pages = []
+        with patch.object(CarrExtractor, "_find_next_page_url", return_value=PAGE_URL), patch.object(
+            CarrExtractor, "_build_requests_session", return_value=self.session
+        ):
+            extractor.capture_category_pages(self.driver, "Frescos", pages.append)
+        return pages
+
+    def test_unchanged_pages_are_not_reparsed(self):
+        first_run = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        first_pages = self.capture(first_run)
+        first_rows = [first_run.parse_page(page) for page in first_pages]
+
+        second_run = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        with patch("extractor.carr_extractor.parse_html", wraps=parse_html) as mock_parse:
+            second_pages = self.capture(second_run)
+            second_rows = [second_run.parse_page(page) for page in second_pages]
+
+        self.assertEqual([page.url for page in first_pages], [page.url for page in second_pages])
+        self.assertEqual(len(first_pages), 3)
+        self.assertEqual(second_rows, first_rows)
+        self.assertEqual(len(second_rows[1]), 23)
+        # Only the Selenium-captured first page is parsed again
+        self.assertIsNone(second_pages[1].source)
+        self.assertIsNone(second_pages[2].source)
+        self.assertEqual(mock_parse.call_count, 1)
+        self.assertEqual(second_run.http_cache.stats["not_modified"], 2)
+        self.assertEqual(second_run.http_cache.stats["rows_reused"], 2)
+
+    def test_page_sizes_are_in_bytes(self):
+        for http_cache_dir in (os.environ["HTTP_CACHE_DIR"], ""):
+            with patch.dict(os.environ, {"HTTP_CACHE_DIR": http_cache_dir}):
+                pages = self.capture(CarrExtractor("https://www.carrefour.es/supermercado", "bucket"))
+
+            # The "€" and accented names take more bytes than characters
+            self.assertEqual(pages[2].size, len(self.session.pages[LAST_PAGE_URL].encode("utf-8")))
+            self.assertGreater(pages[2].size, len(self.session.pages[LAST_PAGE_URL]))
+
+    def test_changed_page_is_parsed_again(self):
+        first_run = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        for page in self.capture(first_run):
+            first_run.parse_page(page)
+        self.session.pages[LAST_PAGE_URL] = self.session.pages[LAST_PAGE_URL].replace("Carrefour", "Carrefur")
+
+        second_run = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        pages = self.capture(second_run)
+
+        self.assertIsNone(pages[1].source)
+        self.assertIsNotNone(pages[2].source)
+        self.assertEqual(len(second_run.parse_page(pages[2])), 23)
+
+    def test_failed_page_fetch_reports_the_category_incomplete(self):
+        extractor = CarrExtractor("https://www.carrefour.es/supermercado", "bucket")
+        del self.session.pages[LAST_PAGE_URL]
+        pages = []
+
+        with patch.object(CarrExtractor, "_find_next_page_url", return_value=PAGE_URL), patch.object(
+            CarrExtractor, "_build_requests_session", return_value=self.session
+        ):
+            completed = extractor.capture_category_pages(self.driver, "Frescos", pages.append)
+
+        self.assertFalse(completed)
+        self.assertEqual(len(pages), 2)
+        self.session.pages[LAST_PAGE_URL] = self.first_page_html.replace("pagination__next", "pagination__end")
+        with patch.object(CarrExtractor, "_find_next_page_url", return_value=PAGE_URL), patch.object(
+            CarrExtractor, "_build_requests_session", return_value=self.session
+        ):
+            self.assertTrue(extractor.capture_category_pages(self.driver, "Frescos", pages.append))
@@ -0,0 +1,71 @@
+import json
+import logging
+import time
+from unittest import TestCase
+
+import pyarrow as pa
+from main import _JsonFormatter
+from metrics import IngestionMetrics
+from metrics import page_size
+from pipeline import CapturedPage
+from tests.test_checkpoint import CATALOG
+from tests.test_checkpoint import FakeCatalogExtractor
+
+
+class TestIngestionMetrics(TestCase):
+    def test_page_size(self):
+        self.assertEqual(page_size(CapturedPage("Frescos", "", "<p>ñ</p>")), 9)
+        self.assertEqual(page_size(CapturedPage("Frescos", "", object(), size=1024)), 1024)
+        self.assertEqual(page_size(CapturedPage("Frescos", "", None, rows=[])), 0)
+
+    def test_pages_and_rows_are_counted_per_category(self):
+        extractor = FakeCatalogExtractor(CATALOG)
+
+        rows = [row for page in extractor.get_page_sources() for row in page]
+
+        summary = extractor.metrics.summary()
+        self.assertEqual(summary["pages"], 4)
+        self.assertEqual(summary["rows"], len(rows))
+        self.assertEqual(summary["categories"], 4)
+        frutas = extractor.metrics.categories["Frescos > Frutas"]
+        self.assertEqual((frutas.pages, frutas.rows), (1, 3))
+
+    def test_grouped_pages_are_counted(self):
+        extractor = FakeCatalogExtractor(CATALOG)
+
+        list(extractor.get_grouped_page_sources())
+
+        self.assertEqual(extractor.metrics.summary()["rows"], 10)
+
+    def test_track_batches_splits_waiting_from_writing(self):
+        metrics = IngestionMetrics()
+        batch = pa.RecordBatch.from_pydict({"name": ["a", "b"]})
+
+        def slow_batches():
+            for _ in range(2):
+                time.sleep(0.05)
+                yield batch
+
+        for _ in metrics.track_batches(slow_batches()):
+            time.sleep(0.02)
+
+        self.assertEqual((metrics.batches, metrics.batch_rows), (2, 4))
+        self.assertEqual(metrics.batch_bytes, 2 * batch.nbytes)
+        self.assertGreaterEqual(metrics.wait_seconds, 0.1)
+        self.assertGreaterEqual(metrics.write_seconds, 0.04)
+        self.assertLess(metrics.write_seconds, metrics.wait_seconds)
+
+    def test_summary_is_emitted_as_json_fields(self):
+        metrics = IngestionMetrics()
+        metrics.record_capture(CapturedPage("Frescos", "", "<p></p>"), 0.5)
+        metrics.record_parse(CapturedPage("Frescos", "", "<p></p>"), 0.1, 24)
+
+        with self.assertLogs("metrics", level="INFO") as logs:
+            metrics.log_summary()
+
+        entries = [json.loads(_JsonFormatter().format(record)) for record in logs.records]
+        self.assertEqual(entries[0]["metrics"]["category"], "Frescos")
+        self.assertEqual(entries[0]["metrics"]["rows"], 24)
+        self.assertEqual(entries[-1]["metrics"]["pages"], 1)
+        self.assertEqual(entries[-1]["metrics"]["html_bytes"], 7)
+        self.assertEqual(logs.records[-1].levelno, logging.INFO)
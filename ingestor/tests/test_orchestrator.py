@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import pyarrow as pa
+from main import RunOptions
+from orchestrator import batch_from_ipc
+from orchestrator import batch_to_ipc
+from orchestrator import get_retailer_concurrency
+from orchestrator import ingest_sources
+from orchestrator import IngestionSource
+from orchestrator import parse_sources
+from orchestrator import source_state_env
+from tests.test_checkpoint import CATALOG
+from tests.test_checkpoint import FakeCatalogExtractor
+
+OPTIONS = RunOptions(
+    is_test_mode=True, break_early=False, extractor_type="browser", batch_rows=4, checkpoint_mode="off"
+)
+CATALOG_ROWS = 10
+
+
+def fake_extractor(source, options):
+    """Runs in the extraction process, so it must be importable from there."""
+    if "broken" in source.data_source_url:
+        raise RuntimeError("retailer is down")
+    return FakeCatalogExtractor(CATALOG)
+
+
+def state_reporting_extractor(source, options):
+    """Fails with the state directories the extraction process sees, for the test to read them from the error."""
+    raise RuntimeError(f"{os.environ.get('HTTP_CACHE_DIR')}|{os.environ.get('BROWSER_SESSION_DIR')}")
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.tables = {}
+        self.intervals = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, data_gen, bucket_name, bucket_prefix, test_mode):
+        start = time.monotonic()
+        batches = list(data_gen)
+        with self._lock:
+            self.tables[bucket_prefix] = pa.Table.from_batches(batches)
+            self.intervals[bucket_prefix] = (start, time.monotonic())
+
+
+class TestOrchestratorConfig(TestCase):
+    def test_parse_sources(self):
+        sources = parse_sources(
+            ["https://tienda.mercadona.es", "gs://b/merc", "https://www.carrefour.es/supermercado", "gs://b/carr"],
+            "browser",
+        )
+
+        self.assertEqual(
+            [(s.bucket_uri, s.retailer) for s in sources], [("gs://b/merc", "merc"), ("gs://b/carr", "carr")]
+        )
+        with self.assertRaisesRegex(ValueError, "pairs"):
+            parse_sources(["https://tienda.mercadona.es"], "browser")
+
+    def test_retailer_concurrency(self):
+        with patch.dict(os.environ, {"RETAILER_CONCURRENCY": "merc=2, carr=1"}):
+            self.assertEqual(get_retailer_concurrency(), {"merc": 2, "carr": 1})
+        with patch.dict(os.environ, {"RETAILER_CONCURRENCY": "merc=0"}):
+            with self.assertRaisesRegex(ValueError, "Unsupported RETAILER_CONCURRENCY"):
+                get_retailer_concurrency()
+
+    def test_source_state_env(self):
+        first = IngestionSource("https://tienda.mercadona.es", "gs://bucket/first", "merc")
+        second = IngestionSource("https://tienda.mercadona.es", "gs://bucket/second", "merc")
+
+        with patch.dict(os.environ, {"HTTP_CACHE_DIR": "/cache", "BROWSER_SESSION_DIR": ""}):
+            first_env, second_env = source_state_env(first), source_state_env(second)
+
+            self.assertEqual(list(first_env), ["HTTP_CACHE_DIR"])
+            self.assertTrue(first_env["HTTP_CACHE_DIR"].startswith("/cache/merc-"))
+            self.assertNotEqual(first_env, second_env)
+            self.assertEqual(source_state_env(first), first_env)
+
+    def test_ipc_round_trip(self):
+        batch = pa.RecordBatch.from_pydict({"name": ["Leche", None], "price": ["1,05 €", "2 €"]})
+
+        self.assertTrue(batch_from_ipc(batch_to_ipc(batch)).equals(batch))
+
+
+class TestIngestSources(TestCase):
+    def test_sources_are_written_by_the_shared_writers(self):
+        writer = RecordingWriter()
+        sources = [
+            IngestionSource("https://tienda.mercadona.es", "gs://bucket/merc", "merc"),
+            IngestionSource("https://www.carrefour.es/supermercado", "gs://bucket/carr", "carr"),
+        ]
+
+        results = ingest_sources(sources, OPTIONS, extractor_factory=fake_extractor, write=writer)
+
+        self.assertEqual([result.rows for result in results], [CATALOG_ROWS, CATALOG_ROWS])
+        self.assertEqual({prefix: table.num_rows for prefix, table in writer.tables.items()}, {"merc": 10, "carr": 10})
+        self.assertEqual(writer.tables["merc"].schema, FakeCatalogExtractor.OUTPUT_SCHEMA)
+
+    def test_retailer_concurrency_is_enforced(self):
+        sources = [
+            IngestionSource("https://tienda.mercadona.es", "gs://bucket/first", "merc"),
+            IngestionSource("https://tienda.mercadona.es", "gs://bucket/second", "merc"),
+        ]
+
+        serial = RecordingWriter()
+        ingest_sources(sources, OPTIONS, {"merc": 1}, extractor_factory=fake_extractor, write=serial)
+        concurrent = RecordingWriter()
+        ingest_sources(sources, OPTIONS, {"merc": 2}, extractor_factory=fake_extractor, write=concurrent)
+
+        self.assertGreaterEqual(serial.intervals["second"][0], serial.intervals["first"][1])
+        self.assertLess(concurrent.intervals["second"][0], concurrent.intervals["first"][1])
+
+    def test_concurrent_sources_of_a_retailer_get_their_own_state(self):
+        sources = [
+            IngestionSource("https://tienda.mercadona.es", "gs://bucket/first", "merc"),
+            IngestionSource("https://tienda.mercadona.es", "gs://bucket/second", "merc"),
+            IngestionSource("https://www.carrefour.es/supermercado", "gs://bucket/carr", "carr"),
+        ]
+        state_dirs = {"HTTP_CACHE_DIR": "/cache", "BROWSER_SESSION_DIR": "/sessions"}
+
+        def reported_state(retailer_concurrency):
+            with patch.dict(os.environ, state_dirs), self.assertRaises(RuntimeError) as raised:
+                ingest_sources(sources, OPTIONS, retailer_concurrency, extractor_factory=state_reporting_extractor)
+            return [error.rsplit("RuntimeError: ", 1)[1] for error in str(raised.exception).split("; ")]
+
+        with patch.dict(os.environ, state_dirs):
+            isolated = [source_state_env(source) for source in sources[:2]]
+
+        self.assertEqual(
+            reported_state({"merc": 2}),
+            [f"{env['HTTP_CACHE_DIR']}|{env['BROWSER_SESSION_DIR']}" for env in isolated] + ["/cache|/sessions"],
+        )
+        # One crawl of the retailer at a time shares the state, as a single run would
+        self.assertEqual(reported_state({"merc": 1}), ["/cache|/sessions"] * 3)
+
+    def test_failed_source_does_not_stop_the_others(self):
+        writer = RecordingWriter()
+        sources = [
+            IngestionSource("https://broken.mercadona.es", "gs://bucket/merc", "merc"),
+            IngestionSource("https://www.carrefour.es/supermercado", "gs://bucket/carr", "carr"),
+        ]
+
+        with self.assertRaisesRegex(RuntimeError, "1 of 2 sources failed: .*retailer is down"):
+            ingest_sources(sources, OPTIONS, extractor_factory=fake_extractor, write=writer)
+
+        self.assertEqual(list(writer.tables), ["carr"])
@@ -0,0 +1,138 @@
+import threading
+import time
+from unittest import TestCase
+
+from pipeline import CapturedPage
+from pipeline import CategoryEnd
+from pipeline import PagePipeline
+
+
+def make_pages(n_pages: int):
+    return [CapturedPage(f"category_{i}", f"https://example.com/{i}", str(i)) for i in range(n_pages)]
+
+
+def capture_from(pages):
+    def capture(emit):
+        for page in pages:
+            emit(page)
+
+    return capture
+
+
+def parse_with_delay(page: CapturedPage):
+    # Later pages finish first so the test fails if results are yielded in completion order
+    time.sleep(0.01 * (5 - int(page.source) % 5))
+    return [{"category": page.category, "value": page.source}]
+
+
+class TestPagePipeline(TestCase):
+    def test_results_keep_capture_order_with_several_workers(self):
+        pages = make_pages(10)
+        pipeline = PagePipeline(parse_with_delay, workers=4, max_pending=4)
+
+        actual = list(pipeline.run(capture_from(pages)))
+
+        self.assertEqual([rows[0]["value"] for rows in actual], [page.source for page in pages])
+        self.assertEqual(actual[3], [{"category": "category_3", "value": "3"}])
+
+    def test_category_end_markers_pass_through_in_order_without_parsing(self):
+        pages = make_pages(4)
+        marker = CategoryEnd("category_1", completed=False)
+        pipeline = PagePipeline(parse_with_delay, workers=4, max_pending=2)
+
+        actual = list(pipeline.run(capture_from([*pages[:2], marker, *pages[2:]])))
+
+        self.assertIs(actual[2], marker)
+        self.assertEqual([rows[0]["value"] for rows in actual[:2] + actual[3:]], ["0", "1", "2", "3"])
+
+    def test_empty_capture_yields_nothing(self):
+        pipeline = PagePipeline(parse_with_delay)
+
+        self.assertEqual(list(pipeline.run(lambda emit: None)), [])
+
+    def test_capture_error_is_raised_after_emitted_pages(self):
+        def capture(emit):
+            emit(make_pages(1)[0])
+            raise RuntimeError("navigation failed")
+
+        results = PagePipeline(parse_with_delay).run(capture)
+
+        self.assertEqual(next(results), [{"category": "category_0", "value": "0"}])
+        with self.assertRaisesRegex(RuntimeError, "navigation failed"):
+            next(results)
+
+    def test_parse_error_is_raised_to_the_consumer(self):
+        def parse(page):
+            raise ValueError(f"bad page {page.url}")
+
+        results = PagePipeline(parse).run(capture_from(make_pages(3)))
+
+        with self.assertRaisesRegex(ValueError, "bad page https://example.com/0"):
+            list(results)
+
+    def test_pending_pages_are_bounded(self):
+        max_pending = 2
+        emitted = []
+        release = threading.Event()
+
+        def capture(emit):
+            for page in make_pages(10):
+                emit(page)
+                emitted.append(page)
+
+        def parse(page):
+            release.wait(5)
+            return [page.source]
+
+        results = PagePipeline(parse, workers=1, max_pending=max_pending).run(capture)
+        consumer = threading.Thread(target=lambda: next(results))
+        consumer.start()
+        time.sleep(0.2)
+
+        self.assertLessEqual(len(emitted), max_pending + 1)
+        release.set()
+        consumer.join(5)
+        results.close()
+
+    def test_closing_the_consumer_stops_the_capture(self):
+        capture_finished = threading.Event()
+        stopped_early = threading.Event()
+
+        def capture(emit):
+            try:
+                for page in make_pages(100):
+                    emit(page)
+                capture_finished.set()
+            except BaseException:
+                stopped_early.set()
+                raise
+
+        results = PagePipeline(lambda page: [page.source], workers=1, max_pending=1).run(capture)
+        self.assertEqual(next(results), ["0"])
+        results.close()
+
+        self.assertTrue(stopped_early.wait(5))
+        self.assertFalse(capture_finished.is_set())
+
+    def test_capture_swallowing_exceptions_still_stops(self):
+        attempts = []
+
+        def capture(emit):
+            for page in make_pages(100):
+                try:
+                    emit(page)
+                except Exception:
+                    continue
+                attempts.append(page)
+
+        results = PagePipeline(lambda page: [page.source], workers=1, max_pending=1).run(capture)
+        next(results)
+        results.close()
+
+        self.assertLess(len(attempts), 100)
+
+    def test_invalid_arguments_raise(self):
+        with self.assertRaises(ValueError):
+            PagePipeline(parse_with_delay, workers=0)
+        with self.assertRaises(ValueError):
+            PagePipeline(parse_with_delay, max_pending=0)
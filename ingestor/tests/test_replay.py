@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import pyarrow.parquet as pq
+from extractor.carr_extractor import CarrExtractor
+from extractor.carr_extractor import extract_carr_product_data
+from extractor.html_parser import parse_html
+from extractor.merc_extractor import extract_product_data
+from extractor.merc_extractor import MercExtractor
+from extractor.page_archive import PageRecorder
+from extractor.page_archive import read_page_archive
+from pipeline import CapturedPage
+from replay import extractor_for_archive
+from replay import replay_archive
+from replay import write_page_archive
+from tests.test_extractor import load_html_fixture
+
+CARR_URL = "https://www.carrefour.es/supermercado"
+MERC_URL = "https://tienda.mercadona.es"
+
+
+class RecordedMercExtractor(MercExtractor):
+    """Captures the saved category page twice, like a browser run would."""
+
+    def capture_pages(self, emit):
+        html = load_html_fixture("merc_category.html")
+        emit(CapturedPage("Aceite > Aceite de oliva", f"{MERC_URL}/categories/112", html))
+        emit(CapturedPage("Aceite > Vinagre", f"{MERC_URL}/categories/115", html))
+
+
+class TestPageArchive(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def test_round_trip(self):
+        path = os.path.join(self.tmp_dir, "carr.jsonl.gz")
+        html = load_html_fixture("carr_category.html")
+        recorder = PageRecorder(path, "CarrExtractor", CARR_URL)
+        recorder.record(CapturedPage("Frescos", f"{CARR_URL}/c", html))
+        # Pages already parsed during capture are stored as HTML, cached pages have nothing to store
+        recorder.record(CapturedPage("Frescos", f"{CARR_URL}/c?offset=24", parse_html(html)))
+        recorder.record(CapturedPage("Frescos", f"{CARR_URL}/c?offset=48", None, rows=[]))
+        recorder.close()
+
+        header, pages = read_page_archive(path)
+        pages = list(pages)
+
+        self.assertEqual((header["extractor"], header["data_source_url"]), ("CarrExtractor", CARR_URL))
+        self.assertEqual([page.url for page in pages], [f"{CARR_URL}/c", f"{CARR_URL}/c?offset=24"])
+        expected = list(extract_carr_product_data(html, "Frescos", "https://www.carrefour.es"))
+        for page in pages:
+            self.assertEqual(
+                list(extract_carr_product_data(page.source, "Frescos", "https://www.carrefour.es")), expected
+            )
+
+    def test_unknown_format_is_rejected(self):
+        path = os.path.join(self.tmp_dir, "old.jsonl.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"format": 99}) + "\n")
+
+        with self.assertRaisesRegex(ValueError, "Unsupported page archive format"):
+            read_page_archive(path)
+
+    def test_capture_is_recorded_when_enabled(self):
+        with patch.dict(os.environ, {"RECORD_PAGES_DIR": self.tmp_dir}):
+            rows = [row for page in RecordedMercExtractor(MERC_URL, "bucket").get_page_sources() for row in page]
+
+        (archive_name,) = os.listdir(self.tmp_dir)
+        self.assertTrue(archive_name.startswith("merc-"))
+        header, pages = read_page_archive(os.path.join(self.tmp_dir, archive_name))
+        self.assertEqual(header["extractor"], "RecordedMercExtractor")
+        self.assertEqual(len(list(pages)), 2)
+        self.assertEqual(len(rows), 144)
+
+    def test_capture_is_not_recorded_by_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            list(RecordedMercExtractor(MERC_URL, "bucket").get_page_sources())
+
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+
+class TestReplayArchive(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def test_replay_writes_the_parsed_rows(self):
+        archive = os.path.join(self.tmp_dir, "merc.jsonl.gz")
+        html = load_html_fixture("merc_category.html")
+        pages = [(f"Aceite > Sub {i}", f"{MERC_URL}/categories/{i}", html) for i in range(3)]
+        write_page_archive(archive, MercExtractor(MERC_URL, "bucket"), pages)
+        output = os.path.join(self.tmp_dir, "out.parquet")
+
+        result = replay_archive(archive, output, batch_rows=50)
+
+        expected_rows = 3 * len(list(extract_product_data(html, "Aceite")))
+        self.assertEqual((result.pages, result.rows), (3, expected_rows))
+        self.assertEqual(result.page_bytes, 3 * len(html.encode("utf-8")))
+        self.assertEqual(result.output_bytes, os.path.getsize(output))
+        table = pq.read_table(output)
+        self.assertEqual(table.num_rows, expected_rows)
+        self.assertEqual(table.column("category").to_pylist()[-1], "Aceite > Sub 2")
+
+    def test_extractor_for_archive(self):
+        self.assertIsInstance(
+            extractor_for_archive({"extractor": "CarrExtractor", "data_source_url": CARR_URL}), CarrExtractor
+        )
+        with self.assertRaisesRegex(ValueError, "Cannot replay"):
+            extractor_for_archive({"extractor": "RecordedMercExtractor", "data_source_url": MERC_URL})
@@ -1,9 +1,20 @@
+import hashlib
 from io import BytesIO
-from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.storage import Client
+from google.resumable_media.common import InvalidResponse
+from tests.fake_gcs import FAIL
+from tests.fake_gcs import FakeGCSServer
+from tests.fake_gcs import PARTIAL
+from writer import CHUNK_SIZE
+from writer import PARQUET_CONTENT_TYPE
+from writer import StorageStreamUploader
 from writer import write_data
 from writer import write_pandas_to_bucket_as_parquet
 from writer import write_pandas_to_local_csv
@@ -19,14 +30,13 @@ def sample_data_gen():
 
 
 @pytest.fixture
-def mock_gcs_client():
-    with patch("writer.GCSClientSingleton") as mock_singleton:
-        mock_client = MagicMock()
-        mock_singleton.get_client.return_value = mock_client
-        mock_bucket = MagicMock()
-        mock_bucket.name = "test-bucket"
-        mock_client.get_bucket.return_value = mock_bucket
-        yield mock_client, mock_bucket
+def fake_gcs(monkeypatch):
+    with FakeGCSServer() as server:
+        monkeypatch.setenv("STORAGE_EMULATOR_HOST", server.url)
+        client = Client(project="test-project", credentials=AnonymousCredentials())
+        with patch("writer.GCSClientSingleton") as mock_singleton:
+            mock_singleton.get_client.return_value = client
+            yield server
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -53,42 +63,34 @@ def test_write_data_routes_to_parquet_in_prod_mode(mock_parquet, sample_data_gen
 # ----------------------------------------------------------------------------------------------------------------------
 
 
+def read_uploaded_parquet(fake_gcs, blob_name="merc/2024-01-15.parquet") -> pd.DataFrame:
+    return pd.read_parquet(BytesIO(fake_gcs.objects[("test-bucket", blob_name)]))
+
+
 @patch("writer.datetime")
-def test_write_parquet_uploads_single_file(mock_datetime, mock_gcs_client, sample_data_gen):
+def test_write_parquet_uploads_single_file(mock_datetime, fake_gcs, sample_data_gen):
     mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
-    mock_client, mock_bucket = mock_gcs_client
 
     write_pandas_to_bucket_as_parquet(sample_data_gen(), "test-bucket", "merc")
 
-    mock_bucket.blob.assert_called_once_with("merc/2024-01-15.parquet")
-    mock_bucket.blob.return_value.upload_from_file.assert_called_once()
+    assert list(fake_gcs.objects) == [("test-bucket", "merc/2024-01-15.parquet")]
+    assert fake_gcs.content_types[("test-bucket", "merc/2024-01-15.parquet")] == "application/octet-stream"
 
 
 @patch("writer.datetime")
-def test_write_parquet_uploads_valid_parquet_content(mock_datetime, mock_gcs_client, sample_data_gen):
+def test_write_parquet_uploads_valid_parquet_content(mock_datetime, fake_gcs, sample_data_gen):
     mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
-    mock_client, mock_bucket = mock_gcs_client
-
-    uploaded_buffers = []
-    blob_mock = mock_bucket.blob.return_value
-
-    def capture_upload(buffer, content_type=None):
-        uploaded_buffers.append(BytesIO(buffer.read()))
-
-    blob_mock.upload_from_file.side_effect = capture_upload
 
     write_pandas_to_bucket_as_parquet(sample_data_gen(), "test-bucket", "merc")
 
-    assert len(uploaded_buffers) == 1
-    df = pd.read_parquet(uploaded_buffers[0])
+    df = read_uploaded_parquet(fake_gcs)
     expected = pd.DataFrame({"col1": ["a", "b", "c"], "col2": [1, 2, 3]})
     pd.testing.assert_frame_equal(df, expected)
 
 
 @patch("writer.datetime")
-def test_write_parquet_skips_empty_chunks(mock_datetime, mock_gcs_client):
+def test_write_parquet_skips_empty_chunks(mock_datetime, fake_gcs):
     mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
-    mock_client, mock_bucket = mock_gcs_client
 
     def gen_with_empty():
         yield pd.DataFrame({"col1": ["a"]})
@@ -97,13 +99,12 @@ def test_write_parquet_skips_empty_chunks(mock_datetime, mock_gcs_client):
 
     write_pandas_to_bucket_as_parquet(gen_with_empty(), "test-bucket", "merc")
 
-    mock_bucket.blob.assert_called_once_with("merc/2024-01-15.parquet")
+    assert list(read_uploaded_parquet(fake_gcs)["col1"]) == ["a", "b"]
 
 
 @patch("writer.datetime")
-def test_write_parquet_handles_all_empty_chunks(mock_datetime, mock_gcs_client):
+def test_write_parquet_handles_all_empty_chunks(mock_datetime, fake_gcs):
     mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
-    mock_client, mock_bucket = mock_gcs_client
 
     def gen_all_empty():
         yield pd.DataFrame()
@@ -111,12 +112,12 @@ def test_write_parquet_handles_all_empty_chunks(mock_datetime, mock_gcs_client):
 
     with pytest.raises(RuntimeError, match="No data to write"):
         write_pandas_to_bucket_as_parquet(gen_all_empty(), "test-bucket", "merc")
+    assert fake_gcs.objects == {}
 
 
 @patch("writer.datetime")
-def test_write_parquet_handles_empty_generator(mock_datetime, mock_gcs_client):
+def test_write_parquet_handles_empty_generator(mock_datetime, fake_gcs):
     mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
-    mock_client, mock_bucket = mock_gcs_client
 
     def empty_gen():
         return
@@ -127,16 +128,8 @@ def test_write_parquet_handles_empty_generator(mock_datetime, mock_gcs_client):
 
 
 @patch("writer.datetime")
-def test_write_parquet_handles_null_typed_column_in_subsequent_chunk(mock_datetime, mock_gcs_client):
+def test_write_parquet_handles_null_typed_column_in_subsequent_chunk(mock_datetime, fake_gcs):
     mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
-    mock_client, mock_bucket = mock_gcs_client
-    uploaded_buffers = []
-    blob_mock = mock_bucket.blob.return_value
-
-    def capture_upload(buffer, content_type=None):
-        uploaded_buffers.append(BytesIO(buffer.read()))
-
-    blob_mock.upload_from_file.side_effect = capture_upload
 
     def gen_with_null_chunk():
         yield pd.DataFrame({"name": ["Product A"], "discount_price": ["1,53 €"]})
@@ -144,24 +137,15 @@ def test_write_parquet_handles_null_typed_column_in_subsequent_chunk(mock_dateti
 
     write_pandas_to_bucket_as_parquet(gen_with_null_chunk(), "test-bucket", "merc")
 
-    assert len(uploaded_buffers) == 1
-    df = pd.read_parquet(uploaded_buffers[0])
+    df = read_uploaded_parquet(fake_gcs)
     assert list(df["name"]) == ["Product A", "Product B"]
     assert df["discount_price"][0] == "1,53 €"
     assert pd.isna(df["discount_price"][1])
 
 
 @patch("writer.datetime")
-def test_write_parquet_handles_null_typed_column_in_first_chunk(mock_datetime, mock_gcs_client):
+def test_write_parquet_handles_null_typed_column_in_first_chunk(mock_datetime, fake_gcs):
     mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
-    mock_client, mock_bucket = mock_gcs_client
-    uploaded_buffers = []
-    blob_mock = mock_bucket.blob.return_value
-
-    def capture_upload(buffer, content_type=None):
-        uploaded_buffers.append(BytesIO(buffer.read()))
-
-    blob_mock.upload_from_file.side_effect = capture_upload
 
     def gen_with_null_first_chunk():
         yield pd.DataFrame({"name": ["Product A"], "discount_price": [None]})
@@ -169,13 +153,66 @@ def test_write_parquet_handles_null_typed_column_in_first_chunk(mock_datetime, m
 
     write_pandas_to_bucket_as_parquet(gen_with_null_first_chunk(), "test-bucket", "merc")
 
-    assert len(uploaded_buffers) == 1
-    df = pd.read_parquet(uploaded_buffers[0])
+    df = read_uploaded_parquet(fake_gcs)
     assert list(df["name"]) == ["Product A", "Product B"]
     assert pd.isna(df["discount_price"][0])
     assert df["discount_price"][1] == "1,53 €"
 
 
+def make_large_batch(n_rows: int, seed: int = 0) -> pa.RecordBatch:
+    # Hash digests so snappy cannot shrink the row group below a few upload chunks
+    names = [hashlib.sha512(f"{seed}-{i}".encode()).hexdigest() for i in range(n_rows)]
+    return pa.RecordBatch.from_pydict({"name": names}, schema=pa.schema([("name", pa.string())]))
+
+
+@patch("writer.PARQUET_CHUNK_SIZE", CHUNK_SIZE)
+@patch("writer.datetime")
+def test_write_parquet_streams_chunks_while_data_is_produced(mock_datetime, fake_gcs):
+    mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
+    uploaded_before_last_batch = []
+
+    def batch_gen():
+        for seed in range(3):
+            yield make_large_batch(5_000, seed)
+            uploaded_before_last_batch.append(sum(fake_gcs.chunk_sizes))
+
+    write_pandas_to_bucket_as_parquet(batch_gen(), "test-bucket", "merc")
+
+    assert uploaded_before_last_batch[0] > 0
+    assert all(size == CHUNK_SIZE for size in fake_gcs.chunk_sizes[:-1])
+    assert len(read_uploaded_parquet(fake_gcs)) == 15_000
+
+
+@patch("writer.time.sleep")
+@patch("writer.PARQUET_CHUNK_SIZE", CHUNK_SIZE)
+@patch("writer.datetime")
+def test_write_parquet_recovers_from_failed_and_partial_chunks(mock_datetime, mock_sleep, fake_gcs):
+    mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
+    fake_gcs.faults.extend([FAIL, PARTIAL, FAIL])
+    batches = [make_large_batch(5_000, seed) for seed in range(2)]
+
+    write_pandas_to_bucket_as_parquet(iter(batches), "test-bucket", "merc")
+
+    expected = pa.Table.from_batches(batches).to_pandas()
+    pd.testing.assert_frame_equal(read_uploaded_parquet(fake_gcs), expected)
+    assert fake_gcs.faults == []
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [1.0, 1.0]
+
+
+@patch("writer.datetime")
+def test_write_parquet_does_not_publish_partial_file_on_failure(mock_datetime, fake_gcs):
+    mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
+
+    def failing_gen():
+        yield make_large_batch(10)
+        raise RuntimeError("extraction failed")
+
+    with pytest.raises(RuntimeError, match="extraction failed"):
+        write_pandas_to_bucket_as_parquet(failing_gen(), "test-bucket", "merc")
+    assert fake_gcs.objects == {}
+    assert fake_gcs.open_sessions == 1
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Test: write_pandas_to_local_csv
 # ----------------------------------------------------------------------------------------------------------------------
@@ -203,3 +240,92 @@ def test_write_local_csv_raises_on_all_empty_chunks(mock_datetime):
 
     with pytest.raises(RuntimeError, match="No data to write"):
         write_pandas_to_local_csv(gen_all_empty())
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Test: Arrow record batch chunks
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def make_record_batch(names):
+    schema = pa.schema([("name", pa.string()), ("discount_price", pa.string())])
+    return pa.RecordBatch.from_pydict({"name": names, "discount_price": [None] * len(names)}, schema=schema)
+
+
+@patch("writer.datetime")
+def test_write_parquet_writes_one_row_group_per_record_batch(mock_datetime, fake_gcs):
+    mock_datetime.now.return_value.date.return_value.isoformat.return_value = "2024-01-15"
+
+    def batch_gen():
+        yield make_record_batch(["Product A", "Product B"])
+        yield make_record_batch([])
+        yield make_record_batch(["Product C"])
+
+    write_pandas_to_bucket_as_parquet(batch_gen(), "test-bucket", "merc")
+
+    parquet_file = pq.ParquetFile(BytesIO(fake_gcs.objects[("test-bucket", "merc/2024-01-15.parquet")]))
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.schema_arrow.field("discount_price").type == pa.string()
+    assert parquet_file.read().column("name").to_pylist() == ["Product A", "Product B", "Product C"]
+
+
+@patch("writer.datetime")
+def test_write_local_csv_accepts_record_batches(mock_datetime, tmp_path, monkeypatch):
+    mock_datetime.now.return_value.isoformat.return_value = "2024-01-15T00:00"
+    monkeypatch.chdir(tmp_path)
+
+    write_pandas_to_local_csv(iter([make_record_batch(["Product A"]), make_record_batch(["Product B"])]), "merc")
+
+    df = pd.read_csv(tmp_path / "data" / "merc_2024-01-15T00:00.csv")
+    assert list(df["name"]) == ["Product A", "Product B"]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Test: StorageStreamUploader
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def make_uploader(chunk_size=CHUNK_SIZE, **kwargs) -> StorageStreamUploader:
+    client = Client(project="test-project", credentials=AnonymousCredentials())
+    return StorageStreamUploader(client, "test-bucket", "merc/data.bin", chunk_size=chunk_size, **kwargs)
+
+
+@pytest.mark.parametrize("chunk_size", [0, 1000, CHUNK_SIZE + 1, -CHUNK_SIZE])
+def test_uploader_rejects_chunk_size_not_multiple_of_256_kib(chunk_size):
+    with pytest.raises(ValueError, match="multiple of 262144"):
+        make_uploader(chunk_size)
+
+
+def test_uploader_streams_large_writes_in_fixed_chunks(fake_gcs):
+    payload = hashlib.sha512(b"seed").digest() * (5 * CHUNK_SIZE // 64 + 7)
+
+    with make_uploader(2 * CHUNK_SIZE, content_type=PARQUET_CONTENT_TYPE) as uploader:
+        uploader.write(payload[:100])
+        uploader.write(memoryview(payload)[100:])
+
+    assert fake_gcs.objects[("test-bucket", "merc/data.bin")] == payload
+    assert fake_gcs.chunk_sizes == [2 * CHUNK_SIZE, 2 * CHUNK_SIZE, len(payload) - 4 * CHUNK_SIZE]
+
+
+@patch("writer.time.sleep")
+def test_uploader_backs_off_exponentially_and_gives_up(mock_sleep, fake_gcs):
+    fake_gcs.faults.extend([FAIL] * 4)
+    uploader = make_uploader(max_recover_attempts=4, initial_backoff=0.5, max_backoff=1.5)
+    uploader.start()
+
+    with pytest.raises(InvalidResponse):
+        uploader.write(b"x" * CHUNK_SIZE)
+
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [0.5, 1.0, 1.5]
+    assert fake_gcs.objects == {}
+
+
+def test_uploader_seek_only_rewinds_into_the_last_chunk():
+    uploader = make_uploader()
+    uploader.write(b"abcdef")
+    uploader.read(4)
+
+    assert uploader.seek(2) == 2
+    assert uploader.read(10) == b"cdef"
+    with pytest.raises(ValueError, match="Cannot seek"):
+        uploader.seek(1)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import logging
+from abc import ABC
+from abc import abstractmethod
+from typing import Optional
+
+import pandas as pd
+from sqlmodel import col
+from sqlmodel import create_engine
+from sqlmodel import delete
+from sqlmodel import Field
+from sqlmodel import select
+from sqlmodel import Session
+from sqlmodel import SQLModel
+from transformers import CATEGORY_LOOKUP_COLUMNS
+from txn_rec import validate_sqlite_db
+
+logger = logging.getLogger(__name__)
+
+
+class LookupRecorder(ABC):
+    """Keeps the cross-date lookup of a transformer between runs, so incremental runs need not read the history."""
+
+    @abstractmethod
+    def load(self) -> pd.DataFrame:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def add(self, entries: pd.DataFrame) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def replace(self, entries: pd.DataFrame) -> None:
+        raise NotImplementedError()
+
+
+class CategoryMapping(SQLModel, table=True):
+    __tablename__ = "category_mappings"
+    __table_args__ = {"extend_existing": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    product: str = Field(index=True)
+    data_source: str
+    name: Optional[str] = None
+    size: Optional[str] = None
+    category: Optional[str] = None
+    subcategory: Optional[str] = None
+
+
+class CategoryLookupSQLite(LookupRecorder):
+    """The category lookup of map_old_categories, one row per (name, size, category, subcategory) entry."""
+
+    def __init__(self, db_path: str, product: str, data_source: str):
+        logger.info(
+            f"Initializing CategoryLookupSQLite with db_path: {db_path}, product: {product}, data_source: {data_source}"
+        )
+        self.db_path = db_path
+        self.product = product
+        self.data_source = data_source
+        validate_sqlite_db(db_path)
+        self.engine = create_engine(f"sqlite:///{db_path}")
+        SQLModel.metadata.create_all(self.engine)
+
+    def load(self) -> pd.DataFrame:
+        with Session(self.engine) as session:
+            statement = (
+                select(
+                    CategoryMapping.name, CategoryMapping.size, CategoryMapping.category, CategoryMapping.subcategory
+                )
+                .where(CategoryMapping.product == self.product)
+                .where(CategoryMapping.data_source == self.data_source)
+                .order_by(col(CategoryMapping.id))
+            )
+            rows = session.exec(statement).all()
+        logger.info(f"Loaded {len(rows)} category lookup entries")
+        lookup = pd.DataFrame(rows, columns=CATEGORY_LOOKUP_COLUMNS, dtype=object)
+        return lookup.astype({"category": "string", "subcategory": "string"})
+
+    def add(self, entries: pd.DataFrame) -> None:
+        logger.info(f"Recording {len(entries)} category lookup entries")
+        with Session(self.engine) as session:
+            session.add_all(self.to_mappings(entries))
+            session.commit()
+
+    def replace(self, entries: pd.DataFrame) -> None:
+        logger.info(f"Replacing the category lookup with {len(entries)} entries")
+        with Session(self.engine) as session:
+            session.exec(
+                delete(CategoryMapping)
+                .where(CategoryMapping.product == self.product)
+                .where(CategoryMapping.data_source == self.data_source)
+            )
+            session.add_all(self.to_mappings(entries))
+            session.commit()
+
+    def to_mappings(self, entries: pd.DataFrame) -> list[CategoryMapping]:
+        entries = entries[CATEGORY_LOOKUP_COLUMNS].astype(object)
+        entries = entries.where(entries.notna(), None)
+        return [
+            CategoryMapping(product=self.product, data_source=self.data_source, **entry)
+            for entry in entries.to_dict(orient="records")
+        ]
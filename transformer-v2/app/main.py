@@ -1,13 +1,20 @@
 from __future__ import annotations
 
 import argparse
+import json
 import logging
+from typing import Optional
+from typing import Tuple
 
+import pandas as pd
 from google.cloud.bigquery import SchemaUpdateOption
 from google.cloud.bigquery import TimePartitioning
 from google.cloud.bigquery import TimePartitioningType
+from lookup_rec import CategoryLookupSQLite
+from lookup_rec import LookupRecorder
 from schemas import BQ_SCHEMA
 from sinks import BigQuery
+from sinks import DEFAULT_READ_WORKERS
 from sinks import Sink
 from sinks import Storage
 from transformers import CarrTransformer
@@ -17,7 +24,32 @@ from txn_rec import TransactionRecorder
 from txn_rec import TxnRecSQLite
 from utils import get_min_max_dates
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+# Chunked reprocessing records its progress as transactions of this pseudo destination, apart from the real ones
+REPROCESS_PROGRESS_SUFFIX = "#reprocess"
+TXN_DB_PATH = "/mnt/sqlite/infass-transformer-sqlite.db"
+# Chunk size of the one-off read of the history when an incremental run finds no recorded lookup
+LOOKUP_BUILD_CHUNK_DAYS = 30
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class _MetricsFormatter(logging.Formatter):
+    """LOG_FORMAT, followed by the metrics a record carries in its extra (e.g. the transform profile) as JSON."""
+
+    def format(self, record):
+        message = super().format(record)
+        metrics = getattr(record, "metrics", None)
+        if metrics is None:
+            return message
+        return f"{message} - metrics: {json.dumps(metrics, default=str)}"
+
+
+def _setup_logging():
+    handler = logging.StreamHandler()
+    handler.setFormatter(_MetricsFormatter(LOG_FORMAT))
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
+
+
+_setup_logging()
 
 
 # Cases to handle:
@@ -55,6 +87,7 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(level
 PIPELINE_DEFAULT_CONFIG = {
     "merc": {
         "transformer": MercTransformer,
+        "lookup_recorder": CategoryLookupSQLite,
         "write_config": {
             "create_disposition": "CREATE_IF_NEEDED",
             "write_disposition": "WRITE_APPEND",
@@ -113,7 +146,42 @@ def parse_args():
         default=False,
         help="Force full reprocessing: fetch all files and overwrite the BQ table",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--read-workers",
+        type=int,
+        default=DEFAULT_READ_WORKERS,
+        help="Storage objects downloaded and parsed concurrently",
+    )
+    parser.add_argument(
+        "--chunk-days",
+        type=int,
+        default=None,
+        help="With --reprocess, transform the history this many days at a time, replacing each date's partition",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="With --chunk-days, continue an interrupted reprocess after its last completed chunk",
+    )
+    parser.add_argument(
+        "--memory-optimized",
+        action="store_true",
+        default=False,
+        help="Read repetitive string columns dictionary-encoded and keep strings in Arrow, logging memory per step",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        default=False,
+        help="Profile the peak Python allocations of every transformation step with tracemalloc, slowing them down",
+    )
+    args = parser.parse_args()
+    if args.chunk_days is not None and (not args.reprocess or args.chunk_days < 1):
+        parser.error("--chunk-days must be a positive number of days and requires --reprocess")
+    if args.resume and args.chunk_days is None:
+        parser.error("--resume requires --chunk-days")
+    return args
 
 
 def main():
@@ -128,24 +196,59 @@ def main():
         write_config.pop("schema_update_options", None)
 
     logging.info(f"Parsed args: {vars(args)}")
-    run_transformer(
-        data_source=Storage(
-            bucket_name=args.gcs_source_bucket,
-            prefix=args.product,
-        ),
-        transformer=product_config["transformer"](),
-        destination=BigQuery(
-            table_ref=args.bq_destination_table,
-            write_config=write_config,
-        ),
-        txn_recorder=TxnRecSQLite(
-            db_path="/mnt/sqlite/infass-transformer-sqlite.db",
+    transformer = product_config["transformer"](memory_optimized=args.memory_optimized, trace_memory=args.trace_memory)
+    data_source = Storage(
+        bucket_name=args.gcs_source_bucket,
+        prefix=args.product,
+        read_workers=args.read_workers,
+        columns=transformer.INPUT_COLUMNS,
+        dictionary_columns=transformer.DICTIONARY_COLUMNS if args.memory_optimized else None,
+    )
+    destination = BigQuery(
+        table_ref=args.bq_destination_table,
+        write_config=write_config,
+    )
+    txn_recorder = TxnRecSQLite(
+        db_path=TXN_DB_PATH,
+        product=args.product,
+        data_source=args.gcs_source_bucket,
+        destination=args.bq_destination_table,
+    )
+    lookup_recorder = None
+    if "lookup_recorder" in product_config:
+        lookup_recorder = product_config["lookup_recorder"](
+            db_path=TXN_DB_PATH,
             product=args.product,
             data_source=args.gcs_source_bucket,
-            destination=args.bq_destination_table,
-        ),
-        reprocess=args.reprocess,
-    )
+        )
+    try:
+        if args.chunk_days is not None:
+            run_transformer_in_chunks(
+                data_source=data_source,
+                transformer=transformer,
+                destination=destination,
+                txn_recorder=txn_recorder,
+                progress_recorder=TxnRecSQLite(
+                    db_path=TXN_DB_PATH,
+                    product=args.product,
+                    data_source=args.gcs_source_bucket,
+                    destination=f"{args.bq_destination_table}{REPROCESS_PROGRESS_SUFFIX}",
+                ),
+                chunk_days=args.chunk_days,
+                resume=args.resume,
+                lookup_recorder=lookup_recorder,
+            )
+        else:
+            run_transformer(
+                data_source=data_source,
+                transformer=transformer,
+                destination=destination,
+                txn_recorder=txn_recorder,
+                reprocess=args.reprocess,
+                lookup_recorder=lookup_recorder,
+            )
+    finally:
+        transformer.profiler.log_summary()
     logging.info("Pipeline completed successfully.")
 
 
@@ -155,7 +258,13 @@ def run_transformer(
     destination: Sink,
     txn_recorder: TransactionRecorder,
     reprocess: bool,
+    lookup_recorder: Optional[LookupRecorder] = None,
 ) -> None:
+    """Transform the data newer than the last transaction, or all of it when reprocessing.
+
+    With a lookup_recorder, the cross-date lookup of transformer is kept between runs: incremental runs transform with
+    the recorded lookup plus the new data's entries, as a full reprocess would, without reading the history.
+    """
     logging.info(
         "Running transformer with "
         f"data_source: {data_source.__class__.__name__}, "
@@ -169,14 +278,115 @@ def run_transformer(
         logging.warning("No input data found. Skipping transform/write/record.")
         return
 
-    transformed_data = transformer.transform(data)
+    if lookup_recorder is None:
+        transformed_data = transformer.transform(data)
+    elif reprocess:
+        lookup = new_lookup_entries = transformer.build_lookup(lookup_input(data, transformer))
+        transformed_data = transformer.transform(data, lookup)
+    else:
+        lookup, new_lookup_entries = build_incremental_lookup(data_source, transformer, lookup_recorder, data)
+        transformed_data = transformer.transform(data, lookup)
     if transformed_data.empty:
         logging.warning("No rows left after transformation. Skipping write/record.")
         return
 
     destination.write_data(transformed_data)
+    # The lookup first: a run that fails in between is redone in full, and adding its entries again adds nothing
+    if lookup_recorder is not None:
+        if reprocess:
+            lookup_recorder.replace(lookup)
+        else:
+            lookup_recorder.add(new_lookup_entries)
     txn_recorder.record(*get_min_max_dates(transformed_data))
 
 
+def lookup_input(data: pd.DataFrame, transformer: Transformer) -> pd.DataFrame:
+    """The LOOKUP_COLUMNS of data as a new frame, so building the lookup leaves the data to transform untouched."""
+    return data.reindex(columns=transformer.LOOKUP_COLUMNS)
+
+
+def build_incremental_lookup(
+    data_source: Storage, transformer: Transformer, lookup_recorder: LookupRecorder, data: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Return the lookup of the whole history for an incremental run of data, and its entries not recorded yet.
+
+    Lookup entries are only ever added, so the recorded lookup plus the entries of the new data is the lookup of the
+    whole history. When nothing is recorded yet, the history is read once (its LOOKUP_COLUMNS only) to start it.
+    """
+    recorded = lookup_recorder.load()
+    parts = [recorded, transformer.build_lookup(lookup_input(data, transformer))]
+    if recorded.empty:
+        logging.info("No recorded lookup yet, building it from the history")
+        parts.append(build_transform_lookup(data_source, transformer, LOOKUP_BUILD_CHUNK_DAYS))
+    lookup = pd.concat(parts, ignore_index=True).drop_duplicates(ignore_index=True)
+    logging.info(f"Transform lookup of {len(lookup)} rows, {len(lookup) - len(recorded)} of them new")
+    return lookup, lookup.iloc[len(recorded) :]
+
+
+def run_transformer_in_chunks(
+    data_source: Storage,
+    transformer: Transformer,
+    destination: BigQuery,
+    txn_recorder: TransactionRecorder,
+    progress_recorder: TransactionRecorder,
+    chunk_days: int,
+    resume: bool = False,
+    lookup_recorder: Optional[LookupRecorder] = None,
+) -> None:
+    """Reprocess the history chunk_days at a time, so memory depends on the chunk size rather than the history length.
+
+    Each chunk replaces the partitions of its dates and is recorded in progress_recorder, which resume continues
+    after. A finished reprocess records a progress entry without dates, so resuming after it starts over instead of
+    finding nothing left to do. Partitions of dates no longer in the source are not deleted, unlike a full
+    WRITE_TRUNCATE reprocess. The lookup built from the history replaces the one in lookup_recorder.
+    """
+    logging.info(f"Reprocessing {transformer.__class__.__name__} history in chunks of {chunk_days} days")
+    lookup = build_transform_lookup(data_source, transformer, chunk_days)
+
+    last_chunk = progress_recorder.get_last_txn_if_exists() if resume else None
+    if last_chunk and last_chunk.max_date is None:
+        logging.info("The last reprocess finished, nothing to resume: starting over")
+        last_chunk = None
+    if last_chunk:
+        logging.info(f"Resuming reprocess after {last_chunk.max_date}")
+    min_date: Optional[str] = None
+    max_date: Optional[str] = None
+    chunks = data_source.fetch_chunks(chunk_days, last_txn_date=last_chunk.max_date if last_chunk else None)
+    for chunks_done, (first_date, last_date, data) in enumerate(chunks, start=1):
+        transformed_data = transformer.transform(data, lookup) if not data.empty else data
+        del data
+        if transformed_data.empty:
+            logging.warning(f"No rows from {first_date} to {last_date} after transformation")
+        else:
+            destination.write_partitions(transformed_data)
+        progress_recorder.record(first_date.isoformat(), last_date.isoformat())
+        min_date = min_date or first_date.isoformat()
+        max_date = last_date.isoformat()
+        logging.info(f"Reprocessed chunk {chunks_done}: {first_date} to {last_date}, {len(transformed_data)} rows")
+
+    if max_date is None:
+        logging.warning("No input data found. Skipping record.")
+        return
+    if lookup_recorder is not None and lookup is not None:
+        lookup_recorder.replace(lookup)
+    txn_recorder.record(min_date, max_date)
+    progress_recorder.record(None, None)
+
+
+def build_transform_lookup(data_source: Storage, transformer: Transformer, chunk_days: int) -> Optional[pd.DataFrame]:
+    """Gather the cross-date lookup of transformer from its LOOKUP_COLUMNS of the history, a chunk at a time."""
+    if transformer.LOOKUP_COLUMNS is None:
+        return None
+    lookup = None
+    lookup_source = data_source.with_columns(transformer.LOOKUP_COLUMNS)
+    for chunk in lookup_source.fetch_chunks(chunk_days, last_txn_date=transformer.LOOKUP_AFTER):
+        part = transformer.build_lookup(chunk.data)
+        lookup = part if lookup is None else pd.concat([lookup, part], ignore_index=True).drop_duplicates()
+    if lookup is None:
+        lookup = transformer.build_lookup(pd.DataFrame(columns=transformer.LOOKUP_COLUMNS))
+    logging.info(f"Built transform lookup of {len(lookup)} rows")
+    return lookup
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+import tracemalloc
+from functools import partial
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+Step = Callable[[pd.DataFrame], pd.DataFrame]
+
+
+def step_name(step: Step) -> str:
+    return step.func.__name__ if isinstance(step, partial) else step.__name__
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def megabytes(value: Optional[int]) -> Optional[float]:
+    return None if value is None else round(value / 1024 / 1024, 2)
+
+
+class StepProfile:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.rss_delta_bytes: Optional[int] = None
+        # Largest over the calls: the frame after the step, and Python allocations above their level before it
+        self.frame_bytes: Optional[int] = None
+        self.traced_peak_bytes: Optional[int] = None
+
+    def record(
+        self,
+        seconds: float,
+        rows_in: int,
+        rows_out: int,
+        rss_delta_bytes: Optional[int],
+        frame_bytes: Optional[int],
+        traced_peak_bytes: Optional[int],
+    ) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        self.rows_in += rows_in
+        self.rows_out += rows_out
+        if rss_delta_bytes is not None:
+            self.rss_delta_bytes = (self.rss_delta_bytes or 0) + rss_delta_bytes
+        if frame_bytes is not None:
+            self.frame_bytes = max(self.frame_bytes or 0, frame_bytes)
+        if traced_peak_bytes is not None:
+            self.traced_peak_bytes = max(self.traced_peak_bytes or 0, traced_peak_bytes)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 3),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rss_delta_mb": megabytes(self.rss_delta_bytes),
+            "frame_mb": megabytes(self.frame_bytes),
+            "traced_peak_mb": megabytes(self.traced_peak_bytes),
+        }
+
+
+class TransformProfiler:
+    """Wall time, rows and memory of each transformation step, summed over the transform calls of a run.
+
+    Every step gets its time, rows in and out and the change in process RSS. frame_memory adds the deep
+    memory_usage of the frame after each step, which is cheap only for categorical and Arrow-backed columns.
+    trace_memory adds the peak of the Python allocations during each step, tracemalloc slowing the steps down.
+    """
+
+    def __init__(self, frame_memory: bool = False, trace_memory: bool = False):
+        self.frame_memory = frame_memory
+        self.trace_memory = trace_memory
+        self.steps: Dict[str, StepProfile] = {}
+        self.runs = 0
+
+    def run(self, df: pd.DataFrame, steps: List[Step]) -> pd.DataFrame:
+        self.runs += 1
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        try:
+            for step in steps:
+                df = self.run_step(df, step)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+        return df
+
+    def run_step(self, df: pd.DataFrame, step: Step) -> pd.DataFrame:
+        name = step_name(step)
+        rows_in = len(df)
+        rss_before = current_rss_bytes()
+        if self.trace_memory:
+            traced_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        df = step(df)
+        seconds = time.perf_counter() - start
+        traced_peak = tracemalloc.get_traced_memory()[1] - traced_before if self.trace_memory else None
+        rss_after = current_rss_bytes()
+        self.steps.setdefault(name, StepProfile()).record(
+            seconds=seconds,
+            rows_in=rows_in,
+            rows_out=len(df),
+            rss_delta_bytes=rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            frame_bytes=int(df.memory_usage(deep=True).sum()) if self.frame_memory else None,
+            traced_peak_bytes=traced_peak,
+        )
+        return df
+
+    def summary(self) -> Dict[str, Any]:
+        steps = {name: profile.as_dict() for name, profile in self.steps.items()}
+        seconds = sum(profile.seconds for profile in self.steps.values())
+        profiles = list(self.steps.values())
+        return {
+            "runs": self.runs,
+            "seconds": round(seconds, 3),
+            "rows_in": profiles[0].rows_in if profiles else 0,
+            "rows_out": profiles[-1].rows_out if profiles else 0,
+            "slowest_step": max(steps, key=lambda name: steps[name]["seconds"], default=None),
+            "steps": steps,
+        }
+
+    def log_summary(self) -> None:
+        if not self.runs:
+            return
+        summary = self.summary()
+        for name, step in summary["steps"].items():
+            share = step["seconds"] / summary["seconds"] if summary["seconds"] else 0.0
+            memory = [f"RSS {step['rss_delta_mb']:+} MB" if step["rss_delta_mb"] is not None else "RSS n/a"]
+            if step["frame_mb"] is not None:
+                memory.append(f"frame {step['frame_mb']} MB")
+            if step["traced_peak_mb"] is not None:
+                memory.append(f"traced peak {step['traced_peak_mb']} MB")
+            logger.info(
+                f"Step {name}: {step['seconds']}s ({share:.0%}), {step['rows_in']} -> {step['rows_out']} rows, "
+                f"{', '.join(memory)}",
+                extra={"metrics": {"step": name, **step}},
+            )
+        logger.info(
+            f"Transform summary: {summary['runs']} runs, {summary['rows_in']} -> {summary['rows_out']} rows in "
+            f"{summary['seconds']}s, slowest step {summary['slowest_step']}",
+            extra={"metrics": summary},
+        )
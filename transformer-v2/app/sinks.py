@@ -1,24 +1,51 @@
+import copy
+import json
 import logging
+import posixpath
 import re
+import time
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from datetime import datetime
-from io import BytesIO
-from io import StringIO
+from itertools import groupby
 from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
 from typing import Optional
+from typing import Sequence
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from google.api_core.exceptions import InternalServerError
+from google.api_core.exceptions import ServiceUnavailable
+from google.api_core.exceptions import TooManyRequests
 from google.cloud.bigquery import Client as BigQueryClient
 from google.cloud.bigquery import LoadJobConfig
 from google.cloud.storage import Blob as StorageBlob
 from google.cloud.storage import Client as StorageClient
+from requests.exceptions import ConnectionError as HttpConnectionError
 
 DATE_PATTERN_FILE_NAME = re.compile(r"\d{4}-\d{2}-\d{2}")
+CHECKPOINT_MANIFEST_NAME = "_manifest.json"
+# The storage client's HTTP connection pool holds 10 connections: more readers would wait for one anyway
+DEFAULT_READ_WORKERS = 8
+MAX_READ_ATTEMPTS = 3
+INITIAL_READ_BACKOFF_SECONDS = 1.0
+TRANSIENT_READ_ERRORS = (InternalServerError, ServiceUnavailable, TooManyRequests, HttpConnectionError)
 
 logger = logging.getLogger(__name__)
 
 
+class HistoryChunk(NamedTuple):
+    first_date: date
+    last_date: date
+    data: pd.DataFrame
+
+
 class Sink(ABC):
     def fetch_data(self, last_txn_date: Optional[str] = None) -> pd.DataFrame:
         raise NotImplementedError()
@@ -28,10 +55,28 @@ class Sink(ABC):
 
 
 class Storage(Sink):
-    def __init__(self, bucket_name: str, prefix: str):
+    def __init__(
+        self,
+        bucket_name: str,
+        prefix: str,
+        read_workers: int = DEFAULT_READ_WORKERS,
+        max_read_attempts: int = MAX_READ_ATTEMPTS,
+        initial_read_backoff: float = INITIAL_READ_BACKOFF_SECONDS,
+        columns: Optional[Sequence[str]] = None,
+        dictionary_columns: Optional[Sequence[str]] = None,
+    ):
         logger.info(f"Initializing Storage Sink for bucket: {bucket_name} with prefix: {prefix}")
+        if read_workers < 1:
+            raise ValueError(f"read_workers must be at least 1, got {read_workers}")
         self.bucket_name = bucket_name
         self.prefix = prefix
+        self.read_workers = read_workers
+        self.max_read_attempts = max_read_attempts
+        self.initial_read_backoff = initial_read_backoff
+        # Only these columns are read when given, e.g. without the product_url and source_page nobody uses
+        self.columns = list(columns) if columns is not None else None
+        # Memory-optimized reads when given: these repetitive columns become categoricals, other strings Arrow-backed
+        self.dictionary_columns = list(dictionary_columns) if dictionary_columns is not None else None
         self.client = StorageClient()
 
     def fetch_data(self, last_txn_date: Optional[str] = None) -> pd.DataFrame:
@@ -41,34 +86,149 @@ class Storage(Sink):
             blobs_iter = self.filter_by_date(blobs_iter, last_txn_date)
         return self.build_dataframe(blobs_iter)
 
+    def fetch_chunks(self, chunk_days: int, last_txn_date: Optional[str] = None) -> Iterator[HistoryChunk]:
+        """Yield the history chunk_days calendar days at a time, oldest first, reading each chunk only when reached.
+
+        Every object of a date lands in the same chunk, so per-date steps see whole days. Objects without a date in
+        their name cannot be placed and are skipped.
+        """
+        blobs = self.client.list_blobs(self.bucket_name, prefix=self.prefix)
+        if last_txn_date:
+            blobs = self.filter_by_date(blobs, last_txn_date)
+        dated_names = []
+        for name in self.data_blob_names(blobs):
+            blob_date = self.extract_date(name)
+            if blob_date is None:
+                logger.warning(f"Skipping {name}: no date in its name to place it in a chunk")
+                continue
+            dated_names.append((blob_date, name))
+        dated_names.sort()
+        if not dated_names:
+            return
+
+        first_date = dated_names[0][0]
+        for _, chunk in groupby(dated_names, key=lambda dated: (dated[0] - first_date).days // chunk_days):
+            chunk = list(chunk)
+            logger.info(f"Reading chunk {chunk[0][0]} to {chunk[-1][0]} ({len(chunk)} objects)")
+            data = self.to_dataframe(self.read_blobs([name for _, name in chunk]))
+            yield HistoryChunk(chunk[0][0], chunk[-1][0], data)
+
+    def with_columns(self, columns: Sequence[str]) -> "Storage":
+        """A view of the same objects reading only the given columns."""
+        projected = copy.copy(self)
+        projected.columns = list(columns)
+        return projected
+
     def build_dataframe(self, blobs: Iterable[StorageBlob]) -> pd.DataFrame:
-        df_list = []
-        for b in blobs:
-            df_list.append(self.read_blob(b.name))
+        return self.to_dataframe(self.read_blobs(self.data_blob_names(blobs)))
 
-        logger.info(f"Read {len(df_list)} objects")
-        if not df_list:
+    def data_blob_names(self, blobs: Iterable[StorageBlob]) -> List[str]:
+        blob_names = []
+        for b in self.exclude_incomplete_runs(blobs):
+            if not self.is_data_blob(b.name):
+                logger.info(f"Skipping metadata object {b.name}")
+                continue
+            blob_names.append(b.name)
+        return blob_names
+
+    def to_dataframe(self, tables: List[pa.Table]) -> pd.DataFrame:
+        logger.info(f"Read {len(tables)} objects")
+        if not tables:
             logger.info("No matching blobs found. Returning empty DataFrame.")
             return pd.DataFrame()
 
-        df = pd.concat(df_list, ignore_index=True)
+        # Concatenating Arrow tables only references their buffers; the one copy is the conversion to pandas, which
+        # frees every column once converted as nothing else holds the tables
+        table = pa.concat_tables(tables, promote_options="permissive")
+        tables.clear()
+        logger.info(f"Arrow table size: {table.nbytes / 1024 / 1024:.2f} MB")
+        types_mapper = None
+        if self.dictionary_columns is not None:
+            types_mapper = {pa.string(): pd.StringDtype("pyarrow"), pa.large_string(): pd.StringDtype("pyarrow")}.get
+        df = table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=types_mapper)
+        del table
         logger.info(f"DataFrame size: {df.memory_usage(deep=True).sum() / 1024 / 1024:.2f} MB")
         return df
 
-    def read_blob(self, blob_name: str) -> pd.DataFrame:
+    def read_blobs(self, blob_names: List[str]) -> List[pa.Table]:
+        """Download and parse blobs on up to read_workers threads, returning the tables in the order of blob_names.
+
+        Each read is a whole-object download followed by a parse that mostly releases the GIL, so a full reprocess is
+        bound by bandwidth rather than by the latency of hundreds of sequential requests.
+        """
+        workers = min(self.read_workers, len(blob_names))
+        if workers <= 1:
+            return [self.read_blob_with_retries(name) for name in blob_names]
+        logger.info(f"Reading {len(blob_names)} objects with {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="read") as pool:
+            return list(pool.map(self.read_blob_with_retries, blob_names))
+
+    def read_blob_with_retries(self, blob_name: str) -> pa.Table:
+        for attempt in range(1, self.max_read_attempts + 1):
+            try:
+                return self.read_blob(blob_name)
+            except TRANSIENT_READ_ERRORS as e:
+                if attempt == self.max_read_attempts:
+                    raise
+                backoff = self.initial_read_backoff * 2 ** (attempt - 1)
+                logger.warning(f"Reading {blob_name} failed (attempt {attempt}), retrying in {backoff}s: {e}")
+                time.sleep(backoff)
+
+    def read_blob(self, blob_name: str) -> pa.Table:
         logger.info(f"Reading {blob_name}")
         bucket = self.client.bucket(self.bucket_name)
         blob = bucket.blob(blob_name)
+        with blob.open("rb") as f:
+            data = pa.py_buffer(f.read())
         if blob_name.endswith(".parquet"):
-            with blob.open("rb") as f:
-                return pd.read_parquet(BytesIO(f.read()))
-        with blob.open("r") as f:
-            return pd.read_csv(StringIO(f.read()))
+            parquet_file = pq.ParquetFile(pa.BufferReader(data))
+            available = parquet_file.schema_arrow.names
+            if self.dictionary_columns:
+                # Reading a column as dictionary keeps the Parquet dictionary pages instead of decoding every value
+                read_dictionary = [column for column in self.dictionary_columns if column in available]
+                parquet_file = pq.ParquetFile(pa.BufferReader(data), read_dictionary=read_dictionary)
+            return parquet_file.read(columns=self.present_columns(available))
+        # Landing CSVs are text throughout: reading projected columns as strings keeps their types in line with the
+        # Parquet parts, with empty fields as nulls like pandas' NaN
+        column_types = {column: pa.string() for column in self.columns or ()}
+        column_types.update(
+            {column: pa.dictionary(pa.int32(), pa.string()) for column in self.dictionary_columns or ()}
+        )
+        table = pa_csv.read_csv(
+            pa.BufferReader(data),
+            convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+        )
+        return table.select(self.present_columns(table.column_names))
+
+    def present_columns(self, available: List[str]) -> List[str]:
+        if self.columns is None:
+            return available
+        return [column for column in self.columns if column in available]
 
     def filter_by_date(self, files: Iterable[StorageBlob], given_date: str):
         given_dt = datetime.strptime(given_date, "%Y-%m-%d").date()
         return filter(lambda f: (d := self.extract_date(f.name)) and d > given_dt, files)
 
+    def exclude_incomplete_runs(self, blobs: Iterable[StorageBlob]) -> Iterable[StorageBlob]:
+        """Drop the parts of checkpointed ingestor runs whose manifest is not marked complete yet."""
+        blobs = list(blobs)
+        incomplete_dirs = set()
+        for b in blobs:
+            if posixpath.basename(b.name) != CHECKPOINT_MANIFEST_NAME:
+                continue
+            manifest = json.loads(self.client.bucket(self.bucket_name).blob(b.name).download_as_text())
+            if not manifest.get("complete"):
+                logger.info(f"Skipping incomplete checkpointed run {posixpath.dirname(b.name)}")
+                incomplete_dirs.add(posixpath.dirname(b.name))
+        if not incomplete_dirs:
+            return blobs
+        return [b for b in blobs if posixpath.dirname(b.name) not in incomplete_dirs]
+
+    @staticmethod
+    def is_data_blob(blob_name: str) -> bool:
+        # Run metadata such as the ingestor checkpoint "_manifest.json" sits next to the data parts
+        return not posixpath.basename(blob_name).startswith("_")
+
     @staticmethod
     def extract_date(filename: str) -> Optional[date]:
         match = DATE_PATTERN_FILE_NAME.search(filename)
@@ -88,11 +248,23 @@ class BigQuery(Sink):
         self.write_config = write_config
 
     def write_data(self, df: pd.DataFrame) -> None:
+        self.load(df, self.table_ref)
+
+    def write_partitions(self, df: pd.DataFrame) -> None:
+        """Load every date of df into its own day partition ("table$YYYYMMDD").
+
+        The write disposition applies to the partition: with WRITE_TRUNCATE each date present in df is replaced and
+        every other partition of the table is left as it is.
+        """
+        for day, day_df in df.groupby(df["date"].dt.date, sort=True):
+            self.load(day_df, f"{self.table_ref}${day:%Y%m%d}")
+
+    def load(self, df: pd.DataFrame, destination: str) -> None:
         job_config = LoadJobConfig(**self.write_config, autodetect=False)
         try:
-            job = self.client.load_table_from_dataframe(df, self.table_ref, job_config=job_config)
+            job = self.client.load_table_from_dataframe(df, destination, job_config=job_config)
             job.result()  # Waits for the job to complete
-            logger.info(f"Data successfully written to {self.table_ref}.")
+            logger.info(f"Data successfully written to {destination}.")
         except Exception as e:
             logger.error(f"Error writing to BigQuery: {e}")
             raise
@@ -3,9 +3,20 @@ import re
 import unicodedata
 from abc import ABC
 from abc import abstractmethod
+from contextlib import nullcontext
+from functools import partial
+from typing import Callable
+from typing import ContextManager
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from profiling import TransformProfiler
 
 OUTPUT_SCHEMA = {
     "date": "datetime64[ns]",
@@ -21,82 +32,196 @@ OUTPUT_SCHEMA = {
     "price_per_unit": "float32",
     "unit": "string",
 }
+# Landing zone columns read by the transformations; others, like Carrefour's product_url and source_page, are not
+INPUT_COLUMNS = [
+    "date",
+    "name",
+    "size",
+    "category",
+    "image_url",
+    "original_price",
+    "discount_price",
+    "price_per_unit",
+    "unit",
+]
+# Repetitive landing columns kept as categoricals in memory-optimized runs, from the read on
+DICTIONARY_COLUMNS = [
+    "date",
+    "name",
+    "size",
+    "category",
+    "image_url",
+    "original_price",
+    "discount_price",
+    "price_per_unit",
+]
+# Products are mapped to the categories they have been listed under since the 2024-11-05 catalog reorganization
+CATEGORY_MAPPING_AFTER = "2024-11-05"
+CATEGORY_KEY_COLUMNS = ["name", "size"]
+CATEGORY_LOOKUP_COLUMNS = [*CATEGORY_KEY_COLUMNS, "category", "subcategory"]
+# Accented characters stripped with one vectorized pass each; beyond that, one translate() call per cell is cheaper
+MAX_ACCENT_REPLACEMENT_PASSES = 32
+# "12,50 €/kg": the unit a price is per. Splitting on it leaves the number, with the units at the odd positions
+PRICE_UNIT_PATTERN = re.compile(r"€/(\w+)", re.IGNORECASE)
+PRICE_NUMBER_TRANSLATION = str.maketrans({"€": None, " ": None, ",": "."})
 
 
 logger = logging.getLogger(__name__)
 
+SeriesOrFrame = TypeVar("SeriesOrFrame", pd.Series, pd.DataFrame)
+
 
 class Transformer(ABC):
+    INPUT_COLUMNS = INPUT_COLUMNS
+    DICTIONARY_COLUMNS = DICTIONARY_COLUMNS
+    # History a transformation needs besides the rows it transforms, when transforming the history in chunks: the
+    # columns to read and the date after which to read them. None when every date transforms on its own.
+    LOOKUP_COLUMNS: Optional[List[str]] = None
+    LOOKUP_AFTER: Optional[str] = None
+
+    def __init__(self, memory_optimized: bool = False, trace_memory: bool = False):
+        self.memory_optimized = memory_optimized
+        # Steps of every transform call, logged once at the end of the run
+        self.profiler = TransformProfiler(frame_memory=memory_optimized, trace_memory=trace_memory)
+
     @abstractmethod
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+    def transform(self, df: pd.DataFrame, lookup: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         raise NotImplementedError()
 
+    def build_lookup(self, history: pd.DataFrame) -> Optional[pd.DataFrame]:
+        """Lookup rows found in a chunk of LOOKUP_COLUMNS history; the parts of all chunks are deduplicated together."""
+        return None
+
 
 class MercTransformer(Transformer):
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+    LOOKUP_COLUMNS = ["date", "name", "size", "category"]
+    LOOKUP_AFTER = CATEGORY_MAPPING_AFTER
+
+    def transform(self, df: pd.DataFrame, lookup: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         logger.info("Executing MercTransformer")
-        return transform_merc(df)
+        return transform_merc(
+            df, category_lookup=lookup, memory_optimized=self.memory_optimized, profiler=self.profiler
+        )
+
+    def build_lookup(self, history: pd.DataFrame) -> pd.DataFrame:
+        history = ensure_columns(history, {"size": np.nan})
+        history = cats_date_column(history)
+        history = split_category_subcategory(history)
+        return build_category_lookup(history)
 
 
 class CarrTransformer(Transformer):
-    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+    def transform(self, df: pd.DataFrame, lookup: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         logger.info("Executing CarrTransformer")
-        return transform_carr(df)
+        return transform_carr(df, memory_optimized=self.memory_optimized, profiler=self.profiler)
 
 
-def transform_merc(df: pd.DataFrame) -> pd.DataFrame:
+def transform_merc(
+    df: pd.DataFrame,
+    category_lookup: Optional[pd.DataFrame] = None,
+    memory_optimized: bool = False,
+    profiler: Optional[TransformProfiler] = None,
+) -> pd.DataFrame:
     if df.empty:
         logger.info("Input dataframe is empty, returning empty transformed dataframe")
         return build_empty_transformed_df()
 
     logger.info(f"Starting data transformation with df shape {df.shape}")
-    df = ensure_columns(df, {"size": np.nan, "price_per_unit": np.nan, "unit": np.nan})
-    df = cats_date_column(df)
-    df = cast_price_columns_as_float32(df)
-    df = split_category_subcategory(df)
-    df = map_old_categories(df)
-    df = standardize_string_columns(df)
-    df = deduplicate_products_with_diff_prices_per_date(df)
-    df = add_price_column(df)
-    df = round_price_columns(df)
+    steps = [
+        partial(ensure_columns, default_values={"size": np.nan, "price_per_unit": np.nan, "unit": np.nan}),
+        cats_date_column,
+        cast_price_columns_as_float32,
+        split_category_subcategory,
+        partial(map_old_categories, category_lookup=category_lookup),
+        standardize_string_columns,
+        deduplicate_products_with_diff_prices_per_date,
+        add_price_column,
+        round_price_columns,
+    ]
+    with string_storage(memory_optimized):
+        df = (profiler or TransformProfiler()).run(df, steps)
     return df[list(OUTPUT_SCHEMA.keys())]
 
 
-def transform_carr(df: pd.DataFrame) -> pd.DataFrame:
+def transform_carr(
+    df: pd.DataFrame, memory_optimized: bool = False, profiler: Optional[TransformProfiler] = None
+) -> pd.DataFrame:
     if df.empty:
         logger.info("Input dataframe is empty, returning empty transformed dataframe")
         return build_empty_transformed_df()
 
     logger.info(f"Starting Carrefour data transformation with df shape {df.shape}")
-    df = ensure_columns(df, {"size": np.nan, "image_url": np.nan, "discount_price": np.nan, "price_per_unit": np.nan})
-    df = parse_price_per_unit(df)
-    df = cats_date_column(df)
-    df = cast_price_columns_as_float32(df)
-    df = split_category_subcategory(df)
-    df = standardize_string_columns(df)
-    df = deduplicate_products_with_diff_prices_per_date(df)
-    df = add_price_column(df)
-    df = round_price_columns(df)
+    steps = [
+        partial(
+            ensure_columns,
+            default_values={"size": np.nan, "image_url": np.nan, "discount_price": np.nan, "price_per_unit": np.nan},
+        ),
+        parse_price_per_unit,
+        cats_date_column,
+        cast_price_columns_as_float32,
+        split_category_subcategory,
+        standardize_string_columns,
+        deduplicate_products_with_diff_prices_per_date,
+        add_price_column,
+        round_price_columns,
+    ]
+    with string_storage(memory_optimized):
+        df = (profiler or TransformProfiler()).run(df, steps)
     return df[list(OUTPUT_SCHEMA.keys())]
 
 
+def string_storage(memory_optimized: bool) -> ContextManager:
+    """Memory-optimized transformations hold the "string" columns they create in Arrow rather than Python objects."""
+    return pd.option_context("mode.string_storage", "pyarrow") if memory_optimized else nullcontext()
+
+
+def apply_to_unique_values(values: pd.Series, transform: Callable[[pd.Series], SeriesOrFrame]) -> SeriesOrFrame:
+    """Evaluate a column-wise transform on the distinct values only and expand its result back to every row.
+
+    Landing columns repeat the same categories, sizes, units and prices day after day, so this makes the cost of
+    transform scale with the cardinality of the column instead of its length. transform gets the distinct values
+    (missing ones included, once) as a Series and must return a Series or DataFrame aligned with it.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    transformed = transform(pd.Series(uniques))
+    # Categoricals stay categoricals: their text results are rebuilt from the codes instead of copied to every row
+    keep_categorical = isinstance(values.dtype, pd.CategoricalDtype)
+    if isinstance(transformed, pd.DataFrame):
+        return pd.DataFrame(
+            {
+                column: expand_values(transformed[column], codes, values.index, keep_categorical)
+                for column in transformed
+            }
+        )
+    return expand_values(transformed, codes, values.index, keep_categorical)
+
+
+def expand_values(transformed: pd.Series, codes: np.ndarray, index: pd.Index, as_categorical: bool) -> pd.Series:
+    if as_categorical and pd.api.types.is_string_dtype(transformed.dtype):
+        transformed_codes, categories = pd.factorize(transformed)
+        return pd.Series(pd.Categorical.from_codes(transformed_codes.take(codes), categories=categories), index=index)
+    result = transformed.take(codes)
+    result.index = index
+    return result
+
+
 def parse_price_per_unit(df: pd.DataFrame) -> pd.DataFrame:
     logger.info("Parsing price_per_unit column")
-    col = df["price_per_unit"].astype("string")
-    df["unit"] = col.str.extract(r"€/(\w+)", flags=re.IGNORECASE)[0]
-    df["price_per_unit"] = (
-        col.str.replace(r"€/\w+", "", regex=True)
-        .str.replace("€", "", regex=False)
-        .str.replace(",", ".", regex=False)
-        .str.replace(" ", "", regex=False)
-    )
-    df["price_per_unit"] = pd.to_numeric(df["price_per_unit"], errors="coerce").astype("float32")
+    parsed = apply_to_unique_values(df["price_per_unit"], parse_prices)
+    df["unit"] = parsed["unit"]
+    df["price_per_unit"] = parsed["price"]
     return df
 
 
 def cats_date_column(df: pd.DataFrame) -> pd.DataFrame:
     logger.info("Casting date column")
-    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d")
+    dates = df["date"]
+    if isinstance(dates.dtype, pd.CategoricalDtype):
+        # Parse the distinct dates only; pd.to_datetime would also keep the result categorical for few of them
+        categories = pd.to_datetime(dates.cat.categories, format="%Y-%m-%d")
+        df["date"] = dates.cat.rename_categories(categories).astype("datetime64[ns]")
+        return df
+    df["date"] = pd.to_datetime(dates, format="%Y-%m-%d")
     return df
 
 
@@ -107,34 +232,83 @@ def cast_price_columns_as_float32(df: pd.DataFrame) -> pd.DataFrame:
         if col not in df.columns:
             df[col] = pd.Series(np.nan, index=df.index, dtype="float32")
             continue
-        df[col] = (
-            df[col]
-            .astype("string")
-            .str.replace("€", "", regex=False)
-            .str.replace(",", ".", regex=False)
-            .str.replace(" ", "", regex=False)
-        )
-        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+        # A price "per unit" in these columns is not a price, and stays NaN as any other malformed value
+        df[col] = apply_to_unique_values(df[col], partial(parse_prices, split_units=False))["price"]
     return df
 
 
+def parse_prices(values: pd.Series, split_units: bool = True) -> pd.DataFrame:
+    """Parse landing prices such as "1,23 €" or "12,50 €/kg" into a float32 "price" and the "unit" it is per.
+
+    Each value is split once on PRICE_UNIT_PATTERN, giving the first unit and the number, which is cleaned with one
+    translate and converted with a single pd.to_numeric. Prices that are not numbers once cleaned become NaN, which
+    without split_units includes every price per unit.
+    """
+    numbers, units = [], []
+    for value in values.astype("string").tolist():
+        if value is pd.NA:
+            numbers.append(None)
+            units.append(None)
+            continue
+        parts = PRICE_UNIT_PATTERN.split(value) if split_units else [value]
+        numbers.append("".join(parts[::2]).translate(PRICE_NUMBER_TRANSLATION))
+        units.append(parts[1] if len(parts) > 1 else None)
+    price = pd.to_numeric(pd.Series(numbers, index=values.index, dtype="string"), errors="coerce").astype("float32")
+    return pd.DataFrame({"price": price, "unit": pd.Series(units, index=values.index, dtype="string")})
+
+
 def split_category_subcategory(df: pd.DataFrame) -> pd.DataFrame:
     logger.info("Splitting category and subcategory")
     category_subcategory_sep = " > "
     if "category" not in df.columns:
         df["category"] = pd.NA
-    split_categories = df["category"].astype("string").str.split(category_subcategory_sep, n=1)
-    df["category"] = split_categories.str[0]
-    df["subcategory"] = split_categories.str[1].fillna(df["category"])
+
+    def split(values: pd.Series) -> pd.DataFrame:
+        split_categories = values.astype("string").str.split(category_subcategory_sep, n=1)
+        category = split_categories.str[0]
+        return pd.DataFrame({"category": category, "subcategory": split_categories.str[1].fillna(category)})
+
+    split_categories = apply_to_unique_values(df["category"], split)
+    df["category"] = split_categories["category"]
+    df["subcategory"] = split_categories["subcategory"]
     return df
 
 
-def standardize_string_columns(df: pd.DataFrame) -> pd.DataFrame:
-    def strip_accents(string: str) -> str:
-        if pd.isna(string):
-            return string
-        return "".join(char for char in unicodedata.normalize("NFD", string) if unicodedata.category(char) != "Mn")
+def strip_accents_value(string: str) -> str:
+    if pd.isna(string):
+        return string
+    return "".join(char for char in unicodedata.normalize("NFD", string) if unicodedata.category(char) != "Mn")
+
+
+def is_reordered_when_decomposed(char: str) -> bool:
+    """Whether NFD may move a mark of char that strip_accents_value keeps, past the marks of its neighbours."""
+    return any(
+        unicodedata.combining(mark) and unicodedata.category(mark) != "Mn"
+        for mark in unicodedata.normalize("NFD", char)
+    )
+
+
+def strip_accents(values: pd.Series) -> pd.Series:
+    """strip_accents_value over a column, as one vectorized replacement per distinct accented character.
+
+    NFD decomposes character by character and canonical ordering only moves combining marks, which are all removed
+    unless is_reordered_when_decomposed, so stripping each character on its own gives the same strings. Columns
+    holding such characters fall back to strip_accents_value per cell.
+    """
+    arrow_values = pa.array(values, type=pa.string(), from_pandas=True)
+    observed = {char for value in pc.unique(arrow_values).drop_null().to_pylist() for char in value}
+    if any(is_reordered_when_decomposed(char) for char in observed):
+        return values.apply(strip_accents_value)
+    replacements = {char: strip_accents_value(char) for char in observed}
+    replacements = {char: stripped for char, stripped in replacements.items() if stripped != char}
+    if len(replacements) > MAX_ACCENT_REPLACEMENT_PASSES:
+        return values.astype("string").str.translate(str.maketrans(replacements))
+    for char, stripped in replacements.items():
+        arrow_values = pc.replace_substring(arrow_values, char, stripped)
+    return arrow_values.to_pandas().astype("string").set_axis(values.index)
 
+
+def standardize_string_columns(df: pd.DataFrame) -> pd.DataFrame:
     def cast_string_columns(_df: pd.DataFrame) -> pd.DataFrame:
         dtype_map = {
             "name": "string",
@@ -143,25 +317,114 @@ def standardize_string_columns(df: pd.DataFrame) -> pd.DataFrame:
             "subcategory": "category",
             "unit": "string",
         }
-        return _df.astype(dtype_map)
+        # Column by column: astype(dtype_map) would also copy every other column
+        for column, dtype in dtype_map.items():
+            _df[column] = as_string(_df[column]) if dtype == "string" else _df[column].astype(dtype)
+        return _df
+
+    def standardize(values: pd.Series) -> pd.Series:
+        return strip_accents(values.astype("string").str.lower().str.strip())
 
     logger.info("Standardizing string columns")
     string_columns = ["name", "size", "category", "subcategory", "unit"]
     for column in string_columns:
         if column not in df.columns:
             df[column] = pd.NA
-        df[column] = df[column].astype("string").str.lower().str.strip().apply(strip_accents)
+        df[column] = apply_to_unique_values(df[column], standardize)
     return cast_string_columns(df)
 
 
-def map_old_categories(df: pd.DataFrame) -> pd.DataFrame:
+def as_string(values: pd.Series) -> pd.Series:
+    """values.astype("string"), decoding categoricals in Arrow when strings are Arrow-backed, without Python strings."""
+    if isinstance(values.dtype, pd.CategoricalDtype) and pd.get_option("mode.string_storage") == "pyarrow":
+        decoded = pa.array(values, from_pandas=True).dictionary_decode().cast(pa.large_string())
+        return pd.Series(pd.arrays.ArrowStringArray(decoded), index=values.index)
+    return values.astype("string")
+
+
+def build_category_lookup(df: pd.DataFrame) -> pd.DataFrame:
+    recent_entries = df.loc[df["date"] > pd.Timestamp(CATEGORY_MAPPING_AFTER), CATEGORY_LOOKUP_COLUMNS]
+    return recent_entries.drop_duplicates()
+
+
+def map_old_categories(df: pd.DataFrame, category_lookup: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """Replace every product's categories with the ones it has been listed under since CATEGORY_MAPPING_AFTER.
+
+    The lookup comes from df itself unless given, e.g. built once from the whole history to transform it in chunks.
+    """
     logger.info("Mapping old categories")
-    recent_entries = df[df["date"] > pd.Timestamp("2024-11-05")][["name", "size", "category", "subcategory"]]
-    recent_entries = recent_entries.drop_duplicates()
-    merged_df = pd.merge(df, recent_entries, on=["name", "size"], how="left", suffixes=("", "_new"))
-    merged_df["category"] = merged_df["category_new"]
-    merged_df["subcategory"] = merged_df["subcategory_new"]
-    return merged_df.drop(columns=["category_new", "subcategory_new"]).drop_duplicates()
+    recent_entries = build_category_lookup(df) if category_lookup is None else category_lookup
+    rows, entries = match_category_lookup(df, recent_entries)
+    # Without products listed under several categories every row maps to one entry, and df is updated in place
+    mapped_df = df.take(rows) if len(rows) > len(df) else df
+    mapped_df.index = pd.RangeIndex(len(mapped_df))
+    matched = entries >= 0
+    for column in ["category", "subcategory"]:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            entry_categories = pd.Categorical(recent_entries[column])
+            # Rows without an entry stay missing, also when the lookup is empty and there is nothing to take from
+            codes = np.full(len(entries), -1, dtype=entry_categories.codes.dtype)
+            codes[matched] = entry_categories.codes[entries[matched]]
+            mapped_df[column] = pd.Categorical.from_codes(codes, dtype=entry_categories.dtype)
+        else:
+            mapped_df[column] = recent_entries[column].array.take(entries, allow_fill=True)
+    return drop_duplicate_rows(mapped_df, subset=["date", *CATEGORY_KEY_COLUMNS])
+
+
+def match_category_lookup(df: pd.DataFrame, lookup: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Left-join the rows of df to the lookup entries of the same name and size, as positions.
+
+    Returns the df row and the lookup entry of every joined row, in df order and then lookup order like a left
+    pd.merge: a product listed under several categories gets a row per category, and one without entries a single
+    row with entry -1. Missing names and sizes match each other, as in pd.merge.
+    """
+    row_keys = np.zeros(len(df), dtype=np.int64)
+    entry_keys = np.zeros(len(lookup), dtype=np.int64)
+    for column in CATEGORY_KEY_COLUMNS:
+        row_codes, entry_codes, cardinality = shared_codes(df[column], lookup[column])
+        row_keys = row_keys * cardinality + row_codes
+        entry_keys = np.where(entry_codes >= 0, entry_keys * cardinality + entry_codes, -1)
+    # Entries of keys absent from df cannot match; the others are numbered together with the rows
+    matchable = entry_keys >= 0
+    codes, _ = pd.factorize(np.concatenate([row_keys, entry_keys[matchable]]))
+    row_codes, entry_codes = codes[: len(df)], codes[len(df) :]
+
+    # The entries of a key are contiguous once sorted by key: entries_by_key[first_entry[code]:][:entry_count[code]]
+    entries_by_key = np.flatnonzero(matchable)[np.argsort(entry_codes, kind="stable")]
+    entry_count = np.bincount(entry_codes, minlength=codes.max(initial=-1) + 1)
+    first_entry = np.cumsum(entry_count) - entry_count
+
+    row_entry_count = entry_count[row_codes]
+    joined_per_row = np.maximum(row_entry_count, 1)
+    rows = np.repeat(np.arange(len(df)), joined_per_row)
+    nth_entry = np.arange(len(rows)) - np.repeat(np.cumsum(joined_per_row) - joined_per_row, joined_per_row)
+    matched = row_entry_count[rows] > 0
+    entries = np.full(len(rows), -1, dtype=np.intp)
+    entries[matched] = entries_by_key[first_entry[row_codes[rows[matched]]] + nth_entry[matched]]
+    return rows, entries
+
+
+def shared_codes(values: pd.Series, lookup_values: pd.Series) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Number the distinct values, missing ones included, and find the lookup values among them (-1 when absent).
+
+    Only the few lookup values are converted to the type of values, which can be categorical or Arrow-backed.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    uniques = pd.Index(uniques)
+    lookup_codes = uniques.get_indexer(lookup_values.to_numpy(dtype=object, na_value=None))
+    missing = np.flatnonzero(uniques.isna())
+    lookup_codes[lookup_values.isna().to_numpy()] = missing[0] if len(missing) else -1
+    return codes, lookup_codes, len(uniques)
+
+
+def drop_duplicate_rows(df: pd.DataFrame, subset: List[str]) -> pd.DataFrame:
+    """df.drop_duplicates(), comparing every column only among the rows that share the subset columns."""
+    candidates = df.duplicated(subset=subset, keep=False).to_numpy()
+    if not candidates.any():
+        return df
+    duplicates = np.zeros(len(df), dtype=bool)
+    duplicates[candidates] = df[candidates].duplicated().to_numpy()
+    return df[~duplicates]
 
 
 def deduplicate_products_with_diff_prices_per_date(df: pd.DataFrame) -> pd.DataFrame:
@@ -17,6 +17,19 @@ from sqlmodel import SQLModel
 logger = logging.getLogger(__name__)
 
 
+def validate_sqlite_db(db_path: str) -> None:
+    logger.info("Validating SQLite database")
+    if not os.path.exists(db_path):
+        logger.error(f"Database file does not exist: {db_path}")
+        raise Exception(f"Database file does not exist: {db_path}")
+    try:
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    except sqlite3.DatabaseError as e:
+        logger.error(f"Invalid SQLite database: {db_path}")
+        raise Exception(f"Invalid SQLite database: {db_path}") from e
+
+
 class TransactionRecorder(ABC):
     @abstractmethod
     def record(self, min_date: str | None, max_date: str | None) -> None:
@@ -56,16 +69,7 @@ class TxnRecSQLite(TransactionRecorder):
         SQLModel.metadata.create_all(self.engine)
 
     def _validate_db(self) -> None:
-        logger.info("Validating SQLite database")
-        if not os.path.exists(self.db_path):
-            logger.error(f"Database file does not exist: {self.db_path}")
-            raise Exception(f"Database file does not exist: {self.db_path}")
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        except sqlite3.DatabaseError as e:
-            logger.error(f"Invalid SQLite database: {self.db_path}")
-            raise Exception(f"Invalid SQLite database: {self.db_path}") from e
+        validate_sqlite_db(self.db_path)
 
     def create_txn_obj(self, min_date: str | None, max_date: str | None) -> Transaction:
         logger.info(f"Creating transaction for product: {self.product}")
@@ -0,0 +1,78 @@
+"""Benchmark of price parsing on the Carrefour sample price columns, repeated to history size.
+
+Compares the chained .str replacements the price steps used with parse_prices, both on every row and on the unique
+values as cast_price_columns_as_float32 and parse_price_per_unit run it, and checks they produce the same prices and
+units. Run from the transformer-v2 directory:
+
+    PYTHONPATH=app python benchmarks/bench_price_parsing.py --rows 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import time
+from typing import Callable
+
+import pandas as pd
+from transformers import apply_to_unique_values
+from transformers import parse_prices
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "carr_2026-02-21T21:04_sample.csv")
+COLUMNS = ["original_price", "price_per_unit"]
+
+
+def parse_prices_with_str_methods(values: pd.Series) -> pd.DataFrame:
+    col = values.astype("string")
+    unit = col.str.extract(r"€/(\w+)", flags=re.IGNORECASE)[0]
+    price = (
+        col.str.replace(r"€/\w+", "", regex=True)
+        .str.replace("€", "", regex=False)
+        .str.replace(",", ".", regex=False)
+        .str.replace(" ", "", regex=False)
+    )
+    return pd.DataFrame({"price": pd.to_numeric(price, errors="coerce").astype("float32"), "unit": unit})
+
+
+def load_values(rows: int) -> pd.DataFrame:
+    sample = pd.read_csv(FIXTURE, usecols=COLUMNS, dtype="string")
+    return pd.concat([sample] * (rows // len(sample) + 1), ignore_index=True).head(rows)
+
+
+def best_of(fn: Callable[[pd.Series], pd.DataFrame], values: pd.Series, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(values)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark price parsing")
+    parser.add_argument("--rows", type=int, default=500_000, help="Rows per column")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation, the best one is reported")
+    args = parser.parse_args()
+
+    df = load_values(args.rows)
+    implementations = {
+        "str rows": parse_prices_with_str_methods,
+        "str unique": lambda v: apply_to_unique_values(v, parse_prices_with_str_methods),
+        "parse rows": parse_prices,
+        "parse unique": lambda v: apply_to_unique_values(v, parse_prices),
+    }
+    print(f"{'column':<15} {'rows':>9} {'unique':>7} " + " ".join(f"{name + ' s':>14}" for name in implementations))
+    for column in COLUMNS:
+        values = df[column]
+        expected = parse_prices_with_str_methods(values)
+        for name, fn in implementations.items():
+            pd.testing.assert_frame_equal(fn(values), expected, obj=f"{name} on {column}")
+        timings = [best_of(fn, values, args.repeat) for fn in implementations.values()]
+        print(
+            f"{column:<15} {len(values):>9} {values.nunique():>7} " + " ".join(f"{timing:>14.3f}" for timing in timings)
+        )
+
+
+if __name__ == "__main__":
+    main()
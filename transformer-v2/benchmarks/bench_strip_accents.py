@@ -0,0 +1,58 @@
+"""Benchmark of accent stripping in standardize_string_columns on the Carrefour sample, repeated to history size.
+
+Compares the per-cell strip_accents_value (the previous .apply) with the vectorized strip_accents, and checks both
+produce the same strings. Run from the transformer-v2 directory:
+
+    PYTHONPATH=app python benchmarks/bench_strip_accents.py --rows 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Callable
+
+import pandas as pd
+from transformers import strip_accents
+from transformers import strip_accents_value
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "carr_2026-02-21T21:04_sample.csv")
+COLUMNS = ["name", "category"]
+
+
+def load_values(rows: int) -> pd.DataFrame:
+    sample = pd.read_csv(FIXTURE, usecols=COLUMNS)
+    repeated = pd.concat([sample] * (rows // len(sample) + 1), ignore_index=True).head(rows)
+    return pd.DataFrame({column: repeated[column].astype("string").str.lower().str.strip() for column in COLUMNS})
+
+
+def best_of(fn: Callable[[pd.Series], pd.Series], values: pd.Series, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(values)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark accent stripping")
+    parser.add_argument("--rows", type=int, default=500_000, help="Rows per column")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation, the best one is reported")
+    args = parser.parse_args()
+
+    df = load_values(args.rows)
+    print(f"{'column':<10} {'rows':>9} {'apply s':>9} {'vectorized s':>13} {'speedup':>8}")
+    for column in COLUMNS:
+        values = df[column]
+        expected = values.apply(strip_accents_value)
+        if strip_accents(values).tolist() != expected.tolist():
+            raise AssertionError(f"strip_accents differs from strip_accents_value on {column}")
+        per_cell = best_of(lambda v: v.apply(strip_accents_value), values, args.repeat)
+        vectorized = best_of(strip_accents, values, args.repeat)
+        print(f"{column:<10} {len(values):>9} {per_cell:>9.3f} {vectorized:>13.3f} {per_cell / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
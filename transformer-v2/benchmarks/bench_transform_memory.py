@@ -0,0 +1,123 @@
+"""Benchmark of the memory-optimized mode: peak RSS of reading and transforming a history of landing Parquet files.
+
+Writes --days daily files from the Carrefour sample (with --products distinct products per day) to a temporary
+directory, then reads them through Storage and transforms them in a fresh process per mode, so each peak RSS is
+measured on its own. Both modes must produce the same rows. Run from the transformer-v2 directory:
+
+    PYTHONPATH=app python benchmarks/bench_transform_memory.py --retailer merc --days 365
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from datetime import timedelta
+from unittest.mock import patch
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sinks import Storage
+from transformers import CarrTransformer
+from transformers import MercTransformer
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "carr_2026-02-21T21:04_sample.csv")
+TRANSFORMERS = {"merc": MercTransformer, "carr": CarrTransformer}
+
+
+def build_day(retailer: str, products: int) -> pd.DataFrame:
+    sample = pd.read_csv(FIXTURE, dtype="string")
+    if retailer == "merc":
+        # Mercadona lists no price per unit, and its sizes read like Carrefour's prices per unit
+        sample = sample.rename(columns={"price_per_unit": "size"}).drop(columns=["product_url", "source_page"])
+    copies = products // len(sample) + 1
+    day = pd.concat([sample.assign(name=sample["name"] + f" {copy}") for copy in range(copies)], ignore_index=True)
+    return day.head(products)
+
+
+def write_history(directory: str, retailer: str, days: int, products: int) -> None:
+    day = build_day(retailer, products)
+    for offset in range(days):
+        day_date = (date(2024, 6, 1) + timedelta(days=offset)).isoformat()
+        table = pa.Table.from_pandas(day.assign(date=day_date), preserve_index=False)
+        pq.write_table(table, os.path.join(directory, f"{day_date}.parquet"))
+
+
+def peak_rss_mb() -> float:
+    # VmHWM starts over at exec, unlike ru_maxrss which keeps the peak of the parent process
+    with open("/proc/self/status") as status:
+        peak_kb = next(line.split()[1] for line in status if line.startswith("VmHWM:"))
+    return int(peak_kb) / 1024
+
+
+def run(directory: str, retailer: str, memory_optimized: bool) -> None:
+    transformer = TRANSFORMERS[retailer](memory_optimized=memory_optimized)
+    with patch("sinks.StorageClient") as storage_client_cls:
+        bucket = storage_client_cls.return_value.bucket.return_value
+        bucket.blob.side_effect = lambda name: local_blob(os.path.join(directory, os.path.basename(name)))
+        storage = Storage(
+            "bucket",
+            retailer,
+            read_workers=1,
+            columns=transformer.INPUT_COLUMNS,
+            dictionary_columns=transformer.DICTIONARY_COLUMNS if memory_optimized else None,
+        )
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+        blob_names = [f"{retailer}/{file_name}" for file_name in sorted(os.listdir(directory))]
+        df = storage.to_dataframe(storage.read_blobs(blob_names))
+        input_mb = df.memory_usage(deep=True).sum() / 1024 / 1024
+        transformed = transformer.transform(df)
+    print(
+        f"{'optimized' if memory_optimized else 'default':<10} {len(transformed):>9} {input_mb:>9.1f} "
+        f"{peak_rss_mb() - baseline:>12.1f} {time.perf_counter() - start:>7.2f}"
+    )
+    output = transformed.sort_values(["date", "name", "dedup_id"]).astype(str)
+    output.to_parquet(
+        os.path.join(os.path.dirname(directory), f"output_{'optimized' if memory_optimized else 'default'}")
+    )
+
+
+def local_blob(path: str):
+    blob = type("Blob", (), {})()
+    blob.open = lambda mode: io.BytesIO(open(path, "rb").read())
+    return blob
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory-optimized transformation")
+    parser.add_argument("--retailer", choices=sorted(TRANSFORMERS), default="merc")
+    parser.add_argument("--days", type=int, default=180, help="Daily files in the history")
+    parser.add_argument("--products", type=int, default=5000, help="Products per day")
+    parser.add_argument("--mode", choices=["default", "optimized"], help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.directory, args.retailer, args.mode == "optimized")
+        return
+
+    print(f"{args.retailer}: {args.days} days of {args.products} products")
+    print(f"{'mode':<10} {'rows':>9} {'input MB':>9} {'peak RSS MB':>12} {'time s':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        history = os.path.join(directory, "history")
+        os.mkdir(history)
+        write_history(history, args.retailer, args.days, args.products)
+        outputs = []
+        for mode in ["default", "optimized"]:
+            command = [sys.executable, __file__, "--retailer", args.retailer, "--mode", mode, "--directory", history]
+            subprocess.run(command, check=True)
+            outputs.append(pd.read_parquet(os.path.join(directory, f"output_{mode}")))
+    # Missing values print as <NA> from Arrow-backed strings and categoricals, and as None/nan otherwise
+    default, optimized = (output.replace({"<NA>": "nan", "None": "nan"}) for output in outputs)
+    pd.testing.assert_frame_equal(default, optimized)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from lookup_rec import CategoryLookupSQLite
+
+
+@pytest.fixture
+def sqlite_db_path(tmp_path):
+    db_path = tmp_path / "test_db.sqlite"
+    conn = sqlite3.connect(db_path)
+    conn.close()
+    return str(db_path)
+
+
+def lookup_entries(rows):
+    entries = pd.DataFrame(rows, columns=["name", "size", "category", "subcategory"], dtype=object)
+    return entries.astype({"category": "string", "subcategory": "string"})
+
+
+def test_category_lookup_sqlite_init_with_non_existing_db_path():
+    with pytest.raises(Exception):
+        CategoryLookupSQLite("/tmp/nonexistent_db.sqlite", "merc", "bucket")
+
+
+def test_category_lookup_sqlite_load_is_empty_at_first(sqlite_db_path):
+    lookup = CategoryLookupSQLite(sqlite_db_path, "merc", "bucket").load()
+
+    assert lookup.empty
+    assert list(lookup.columns) == ["name", "size", "category", "subcategory"]
+
+
+def test_category_lookup_sqlite_add_and_load_round_trip(sqlite_db_path):
+    recorder = CategoryLookupSQLite(sqlite_db_path, "merc", "bucket")
+    recorder.add(lookup_entries([("Leche", "1 l", "desayuno", "leche")]))
+    recorder.add(lookup_entries([("Pan", np.nan, "panaderia", pd.NA)]))
+
+    lookup = CategoryLookupSQLite(sqlite_db_path, "merc", "bucket").load()
+
+    pd.testing.assert_frame_equal(
+        lookup,
+        lookup_entries([("Leche", "1 l", "desayuno", "leche"), ("Pan", None, "panaderia", None)]),
+    )
+
+
+def test_category_lookup_sqlite_replace_only_affects_its_product_and_source(sqlite_db_path):
+    merc = CategoryLookupSQLite(sqlite_db_path, "merc", "bucket")
+    other_source = CategoryLookupSQLite(sqlite_db_path, "merc", "other-bucket")
+    merc.add(lookup_entries([("Leche", "1 l", "lacteos", "leche")]))
+    other_source.add(lookup_entries([("Agua", "1 l", "bebidas", "agua")]))
+
+    merc.replace(lookup_entries([("Leche", "1 l", "desayuno", "leche")]))
+
+    assert merc.load()["category"].tolist() == ["desayuno"]
+    assert other_source.load()["category"].tolist() == ["bebidas"]
@@ -1,11 +1,25 @@
+import json
+import logging
+import sqlite3
+from types import SimpleNamespace
 from unittest.mock import MagicMock
+from unittest.mock import patch
 
 import pandas as pd
+import pyarrow as pa
+import pytest
+from lookup_rec import CategoryLookupSQLite
+from main import _MetricsFormatter
+from main import LOG_FORMAT
 from main import parse_args
 from main import PIPELINE_DEFAULT_CONFIG
 from main import run_transformer
+from main import run_transformer_in_chunks
 from schemas import BQ_SCHEMA
+from sinks import Storage
 from transformers import CarrTransformer
+from transformers import MercTransformer
+from txn_rec import TxnRecSQLite
 
 
 def test_parse_args(monkeypatch):
@@ -188,3 +202,252 @@ def test_run_transformer_skips_write_when_transform_result_is_empty():
     transformer.transform.assert_called_once_with(input_df)
     destination.write_data.assert_not_called()
     txn_recorder.record.assert_not_called()
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Test: chunked reprocess
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+MERC_HISTORY = {
+    "merc/2024-11-01.csv": [
+        ("Leche", "1 l", "Lácteos > Leche", "1,00 €"),
+        ("Pan", "250 g", "Panadería > Pan", "0,80 €"),
+    ],
+    "merc/2024-11-04.csv": [("Leche", "1 l", "Lácteos > Leche", "1,05 €")],
+    "merc/2024-11-06.csv": [("Leche", "1 l", "Desayuno > Leche y bebidas", "1,05 €")],
+    "merc/2024-11-08.csv": [("Leche", "1 l", "Desayuno > Leche y bebidas", "1,10 €")],
+}
+
+
+def read_merc_history(blob_name):
+    rows = MERC_HISTORY[blob_name]
+    return pa.table(
+        {
+            "name": [row[0] for row in rows],
+            "size": [row[1] for row in rows],
+            "category": [row[2] for row in rows],
+            "original_price": [row[3] for row in rows],
+            "discount_price": [None] * len(rows),
+            "image_url": [None] * len(rows),
+            "date": [Storage.extract_date(blob_name).isoformat()] * len(rows),
+        }
+    )
+
+
+def merc_history_blobs():
+    return [SimpleNamespace(name=name) for name in MERC_HISTORY]
+
+
+@pytest.fixture
+def merc_history_storage():
+    with patch("sinks.StorageClient") as mock_storage_client_cls:
+        mock_storage_client_cls.return_value.list_blobs.side_effect = lambda *args, **kwargs: merc_history_blobs()
+        with patch.object(Storage, "read_blob", side_effect=read_merc_history):
+            yield Storage(bucket_name="bucket", prefix="merc", read_workers=2)
+
+
+def run_merc_chunks(storage, progress_recorder, resume=False):
+    destination = MagicMock()
+    txn_recorder = MagicMock()
+    run_transformer_in_chunks(
+        data_source=storage,
+        transformer=MercTransformer(),
+        destination=destination,
+        txn_recorder=txn_recorder,
+        progress_recorder=progress_recorder,
+        chunk_days=2,
+        resume=resume,
+    )
+    written = [c.args[0] for c in destination.write_partitions.call_args_list]
+    return written, txn_recorder
+
+
+def test_run_transformer_in_chunks_matches_a_full_transform(merc_history_storage):
+    progress_recorder = MagicMock()
+
+    written, txn_recorder = run_merc_chunks(merc_history_storage, progress_recorder)
+
+    expected = MercTransformer().transform(merc_history_storage.build_dataframe(merc_history_blobs()))
+    actual = pd.concat(written, ignore_index=True)
+    assert len(written) == 4
+    pd.testing.assert_frame_equal(
+        actual.astype({"category": "string", "subcategory": "string"}),
+        expected.reset_index(drop=True).astype({"category": "string", "subcategory": "string"}),
+    )
+    # Products are mapped to their categories after the reorganization, also in chunks that end before it
+    assert set(actual["category"].dropna()) == {"desayuno"}
+    assert [c.args for c in progress_recorder.record.call_args_list] == [
+        ("2024-11-01", "2024-11-01"),
+        ("2024-11-04", "2024-11-04"),
+        ("2024-11-06", "2024-11-06"),
+        ("2024-11-08", "2024-11-08"),
+        (None, None),
+    ]
+    txn_recorder.record.assert_called_once_with("2024-11-01", "2024-11-08")
+
+
+def test_run_transformer_in_chunks_resumes_after_last_chunk(merc_history_storage):
+    progress_recorder = MagicMock()
+    progress_recorder.get_last_txn_if_exists.return_value = SimpleNamespace(max_date="2024-11-04")
+
+    written, txn_recorder = run_merc_chunks(merc_history_storage, progress_recorder, resume=True)
+
+    assert [str(df["date"].dt.date.iloc[0]) for df in written] == ["2024-11-06", "2024-11-08"]
+    txn_recorder.record.assert_called_once_with("2024-11-06", "2024-11-08")
+
+
+def test_run_transformer_in_chunks_resume_after_a_finished_reprocess_starts_over(merc_history_storage, tmp_path):
+    db_path = tmp_path / "test_db.sqlite"
+    sqlite3.connect(db_path).close()
+    progress_recorder = TxnRecSQLite(str(db_path), "merc", "bucket", "project.dataset.table#reprocess")
+
+    run_merc_chunks(merc_history_storage, progress_recorder)
+    written, txn_recorder = run_merc_chunks(merc_history_storage, progress_recorder, resume=True)
+
+    assert len(written) == 4
+    txn_recorder.record.assert_called_once_with("2024-11-01", "2024-11-08")
+    assert progress_recorder.get_last_txn_if_exists().max_date is None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Test: incremental runs with a recorded category lookup
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def lookup_recorder(tmp_path):
+    db_path = tmp_path / "test_db.sqlite"
+    sqlite3.connect(db_path).close()
+    return CategoryLookupSQLite(str(db_path), "merc", "bucket")
+
+
+def run_merc_incremental(storage, lookup_recorder, last_txn_date):
+    destination = MagicMock()
+    txn_recorder = MagicMock()
+    txn_recorder.get_last_txn_if_exists.return_value = SimpleNamespace(max_date=last_txn_date)
+    run_transformer(
+        data_source=storage,
+        transformer=MercTransformer(),
+        destination=destination,
+        txn_recorder=txn_recorder,
+        reprocess=False,
+        lookup_recorder=lookup_recorder,
+    )
+    return destination.write_data.call_args.args[0]
+
+
+def as_comparable(df):
+    return df.reset_index(drop=True).astype({"category": "string", "subcategory": "string"})
+
+
+def test_run_transformer_incremental_matches_a_full_transform(merc_history_storage, lookup_recorder):
+    full = MercTransformer().transform(merc_history_storage.build_dataframe(merc_history_blobs()))
+
+    # Nothing recorded yet: the lookup is built from the history once, then recorded
+    actual = run_merc_incremental(merc_history_storage, lookup_recorder, last_txn_date="2024-11-04")
+
+    pd.testing.assert_frame_equal(as_comparable(actual), as_comparable(full[full["date"] > "2024-11-04"]))
+    assert lookup_recorder.load()[["name", "category"]].values.tolist() == [["Leche", "Desayuno"]]
+
+
+def test_run_transformer_incremental_uses_the_recorded_lookup(merc_history_storage, lookup_recorder):
+    lookup_recorder.add(
+        pd.DataFrame({"name": ["Leche"], "size": ["1 l"], "category": ["Ofertas"], "subcategory": ["Leche y bebidas"]})
+    )
+
+    with patch("main.build_transform_lookup") as build_transform_lookup:
+        actual = run_merc_incremental(merc_history_storage, lookup_recorder, last_txn_date="2024-11-06")
+
+    # The history is not read again, and the new day is mapped to the recorded categories as well as its own
+    build_transform_lookup.assert_not_called()
+    assert actual["category"].astype("string").tolist() == ["ofertas", "desayuno"]
+    assert lookup_recorder.load()["category"].tolist() == ["Ofertas", "Desayuno"]
+
+
+def test_run_transformer_records_no_transaction_when_the_lookup_is_not_recorded(merc_history_storage):
+    lookup_recorder = MagicMock()
+    lookup_recorder.load.return_value = pd.DataFrame(columns=["name", "size", "category", "subcategory"])
+    lookup_recorder.add.side_effect = sqlite3.OperationalError("database is locked")
+    txn_recorder = MagicMock()
+    txn_recorder.get_last_txn_if_exists.return_value = SimpleNamespace(max_date="2024-11-04")
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_transformer(
+            data_source=merc_history_storage,
+            transformer=MercTransformer(),
+            destination=MagicMock(),
+            txn_recorder=txn_recorder,
+            reprocess=False,
+            lookup_recorder=lookup_recorder,
+        )
+
+    # The next run transforms the same dates again rather than without their lookup entries
+    txn_recorder.record.assert_not_called()
+
+
+def test_run_transformer_in_chunks_records_the_lookup_before_the_transaction(merc_history_storage):
+    recorders = MagicMock()
+
+    run_transformer_in_chunks(
+        data_source=merc_history_storage,
+        transformer=MercTransformer(),
+        destination=MagicMock(),
+        txn_recorder=recorders.txn,
+        progress_recorder=recorders.progress,
+        chunk_days=2,
+        lookup_recorder=recorders.lookup,
+    )
+
+    calls = [name for name, _, _ in recorders.mock_calls if name in ("lookup.replace", "txn.record")]
+    assert calls == ["lookup.replace", "txn.record"]
+
+
+def test_run_transformer_reprocess_replaces_the_recorded_lookup(merc_history_storage, lookup_recorder):
+    lookup_recorder.add(
+        pd.DataFrame({"name": ["Pan"], "size": ["250 g"], "category": ["Obsoleta"], "subcategory": ["Pan"]})
+    )
+
+    run_transformer(
+        data_source=merc_history_storage,
+        transformer=MercTransformer(),
+        destination=MagicMock(),
+        txn_recorder=MagicMock(),
+        reprocess=True,
+        lookup_recorder=lookup_recorder,
+    )
+
+    assert lookup_recorder.load()[["name", "category"]].values.tolist() == [["Leche", "Desayuno"]]
+
+
+def test_parse_args_chunk_days_requires_reprocess(monkeypatch):
+    test_args = ["prog", "--gcs-source-bucket", "b", "--product", "merc", "--bq-destination-table", "t"]
+    monkeypatch.setattr("sys.argv", [*test_args, "--chunk-days", "30"])
+    with pytest.raises(SystemExit):
+        parse_args()
+
+    monkeypatch.setattr("sys.argv", [*test_args, "--reprocess", "--chunk-days", "30", "--resume"])
+    args = parse_args()
+    assert (args.chunk_days, args.resume) == (30, True)
+
+
+def test_parse_args_memory_optimized_flag(monkeypatch):
+    test_args = ["prog", "--gcs-source-bucket", "b", "--product", "merc", "--bq-destination-table", "t"]
+    monkeypatch.setattr("sys.argv", test_args)
+    assert parse_args().memory_optimized is False
+
+    monkeypatch.setattr("sys.argv", [*test_args, "--memory-optimized"])
+    assert parse_args().memory_optimized is True
+
+
+def test_metrics_formatter_appends_the_record_metrics_as_json():
+    formatter = _MetricsFormatter(LOG_FORMAT)
+    record = logging.LogRecord("profiling", logging.INFO, __file__, 1, "Transform summary", None, None)
+    plain = formatter.format(record)
+    record.metrics = {"runs": 1, "slowest_step": "parse_price_per_unit", "rss_delta_mb": None}
+
+    line = formatter.format(record)
+
+    assert plain.endswith(" - INFO - Transform summary")
+    assert line.startswith(plain)
+    assert json.loads(line.split(" - metrics: ", 1)[1]) == record.metrics
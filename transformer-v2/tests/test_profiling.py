@@ -0,0 +1,97 @@
+import logging
+import tracemalloc
+from functools import partial
+
+import pandas as pd
+from profiling import step_name
+from profiling import TransformProfiler
+from transformers import CarrTransformer
+from transformers import ensure_columns
+
+
+def drop_first_row(df: pd.DataFrame) -> pd.DataFrame:
+    return df.iloc[1:]
+
+
+def add_text_column(df: pd.DataFrame) -> pd.DataFrame:
+    df["text"] = [f"row {i}" * 100 for i in range(len(df))]
+    return df
+
+
+def test_step_name_unwraps_partials():
+    assert step_name(drop_first_row) == "drop_first_row"
+    assert step_name(partial(ensure_columns, default_values={"size": None})) == "ensure_columns"
+
+
+def test_profiler_records_rows_per_step_over_runs():
+    profiler = TransformProfiler()
+    steps = [drop_first_row, add_text_column]
+
+    profiler.run(pd.DataFrame({"a": range(5)}), steps)
+    actual = profiler.run(pd.DataFrame({"a": range(3)}), steps)
+
+    assert len(actual) == 2
+    assert list(profiler.steps) == ["drop_first_row", "add_text_column"]
+    drop = profiler.steps["drop_first_row"]
+    assert (drop.calls, drop.rows_in, drop.rows_out) == (2, 8, 6)
+    assert drop.frame_bytes is None and drop.traced_peak_bytes is None
+    summary = profiler.summary()
+    assert (summary["runs"], summary["rows_in"], summary["rows_out"]) == (2, 8, 6)
+    assert summary["seconds"] >= summary["steps"]["add_text_column"]["seconds"]
+
+
+def test_profiler_measures_frame_and_traced_memory():
+    profiler = TransformProfiler(frame_memory=True, trace_memory=True)
+
+    profiler.run(pd.DataFrame({"a": range(1000)}), [drop_first_row, add_text_column])
+
+    added = profiler.steps["add_text_column"]
+    assert added.frame_bytes > 999 * 600
+    assert added.traced_peak_bytes > 999 * 600
+    assert profiler.steps["drop_first_row"].frame_bytes < 1000 * 8 + 1000
+    # Tracing stops with the run that started it
+    assert not tracemalloc.is_tracing()
+
+
+def test_log_summary_emits_step_and_run_metrics(caplog):
+    profiler = TransformProfiler()
+    with caplog.at_level(logging.INFO, logger="profiling"):
+        profiler.log_summary()
+        assert caplog.records == []
+
+        profiler.run(pd.DataFrame({"a": range(3)}), [drop_first_row])
+        profiler.log_summary()
+
+    step_record, summary_record = caplog.records
+    assert step_record.metrics["step"] == "drop_first_row"
+    assert step_record.metrics["rows_out"] == 2
+    assert summary_record.metrics["slowest_step"] == "drop_first_row"
+    assert "Transform summary: 1 runs, 3 -> 2 rows" in summary_record.getMessage()
+
+
+def test_transformer_profiles_each_step_of_its_pipeline():
+    raw_df = pd.DataFrame(
+        {
+            "date": ["2026-02-21", "2026-02-21"],
+            "name": ["Leche", "Leche"],
+            "category": ["Frescos > Leche", "Frescos > Leche"],
+            "original_price": ["1,00 €", "1,00 €"],
+            "price_per_unit": ["1,00 €/l", "1,00 €/l"],
+        }
+    )
+    transformer = CarrTransformer()
+
+    transformer.transform(raw_df)
+
+    assert list(transformer.profiler.steps) == [
+        "ensure_columns",
+        "parse_price_per_unit",
+        "cats_date_column",
+        "cast_price_columns_as_float32",
+        "split_category_subcategory",
+        "standardize_string_columns",
+        "deduplicate_products_with_diff_prices_per_date",
+        "add_price_column",
+        "round_price_columns",
+    ]
+    assert {(step.rows_in, step.rows_out) for step in transformer.profiler.steps.values()} == {(2, 2)}
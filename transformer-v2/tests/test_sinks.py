@@ -1,10 +1,15 @@
+import time
 from datetime import date
 from io import BytesIO
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
 import pandas as pd
+import pyarrow as pa
 import pytest
+from google.api_core.exceptions import NotFound
+from google.api_core.exceptions import ServiceUnavailable
+from sinks import BigQuery
 from sinks import Storage
 
 
@@ -35,6 +40,12 @@ def test_storage(mock_storage_client_obj):
 # ----------------------------------------------------------------------------------------------------------------------
 
 
+def test_storage_init_rejects_no_read_workers():
+    with patch("sinks.StorageClient"):
+        with pytest.raises(ValueError, match="read_workers"):
+            Storage("test_bucket_name", "test_prefix", read_workers=0)
+
+
 def test_storage_init():
     with patch("sinks.StorageClient") as mock_storage_client_cls:
         test_bucket_name = "test_bucket_name"
@@ -96,13 +107,13 @@ def test_fetch_data_when_last_txn_date_is_a_str_date(
 def mock_storage_read_blob():
     def mock_read_blob(blob_name):
         if blob_name == "name1":
-            return pd.DataFrame({"col1": ["value1", "value1"]})
+            return pa.table({"col1": ["value1", "value1"]})
         elif blob_name == "name2":
-            return pd.DataFrame({"col1": ["value2"]})
+            return pa.table({"col1": ["value2"]})
         elif blob_name == "name3":
-            return pd.DataFrame({"col1": ["value3", "value3"]})
+            return pa.table({"col1": ["value3", "value3"]})
         else:
-            return pd.DataFrame()
+            return pa.table({})
 
     with patch.object(Storage, "read_blob", side_effect=mock_read_blob) as mock_read_blob:
         yield mock_read_blob
@@ -136,6 +147,38 @@ def test_build_dataframe_when_read_blod_return_empty_dfs(test_storage, mock_stor
     assert actual.empty
 
 
+def test_build_dataframe_skips_checkpoint_manifest(test_storage, mock_storage_read_blob, mock_storage_client_obj):
+    mock_blob = mock_storage_client_obj.bucket.return_value.blob.return_value
+    mock_blob.download_as_text.return_value = '{"run_date": "2026-10-17", "complete": true}'
+    test_storage_blobs = [
+        MockStorageBlob("carr/2026-10-17/_manifest.json", "manifest"),
+        MockStorageBlob("name1", "content1"),
+    ]
+
+    actual = test_storage.build_dataframe(test_storage_blobs)
+
+    mock_storage_read_blob.assert_called_once_with("name1")
+    pd.testing.assert_frame_equal(actual, pd.DataFrame({"col1": ["value1", "value1"]}))
+
+
+def test_build_dataframe_skips_incomplete_checkpointed_runs(
+    test_storage, mock_storage_read_blob, mock_storage_client_obj
+):
+    mock_blob = mock_storage_client_obj.bucket.return_value.blob.return_value
+    mock_blob.download_as_text.return_value = '{"run_date": "2026-10-17", "complete": false}'
+    test_storage_blobs = [
+        MockStorageBlob("name1", "content1"),
+        MockStorageBlob("carr/2026-10-17/_manifest.json", "manifest"),
+        MockStorageBlob("carr/2026-10-17/name2", "content2"),
+    ]
+
+    actual = test_storage.build_dataframe(test_storage_blobs)
+
+    mock_storage_client_obj.bucket.return_value.blob.assert_called_once_with("carr/2026-10-17/_manifest.json")
+    mock_storage_read_blob.assert_called_once_with("name1")
+    pd.testing.assert_frame_equal(actual, pd.DataFrame({"col1": ["value1", "value1"]}))
+
+
 def test_build_dataframe_when_storage_blobs_iter_is_empty(test_storage, mock_storage_read_blob):
     test_storage_blobs = []
     actual = test_storage.build_dataframe(test_storage_blobs)
@@ -143,44 +186,194 @@ def test_build_dataframe_when_storage_blobs_iter_is_empty(test_storage, mock_sto
     assert actual.empty
 
 
+def test_build_dataframe_reads_concurrently_in_blob_order(mock_storage_client_obj):
+    storage = Storage(bucket_name="test_bucket", prefix="test_prefix", read_workers=3)
+    delays = {"name1": 0.2, "name2": 0.1, "name3": 0.0}
+
+    def slow_read_blob(blob_name):
+        time.sleep(delays[blob_name])
+        return pa.table({"col1": [blob_name]})
+
+    with patch.object(Storage, "read_blob", side_effect=slow_read_blob):
+        start = time.monotonic()
+        actual = storage.build_dataframe([MockStorageBlob(name, "content") for name in delays])
+        elapsed = time.monotonic() - start
+
+    pd.testing.assert_frame_equal(actual, pd.DataFrame({"col1": ["name1", "name2", "name3"]}))
+    assert elapsed < sum(delays.values())
+
+
+def test_fetch_chunks_groups_whole_dates(test_storage, mock_storage_client_obj):
+    names = [
+        "test_prefix/2024-01-01_000.parquet",
+        "test_prefix/2024-01-01_001.parquet",
+        "test_prefix/2024-01-02.csv",
+        "test_prefix/2024-01-05.csv",
+        "test_prefix/latest.csv",
+    ]
+    mock_storage_client_obj.list_blobs.return_value = [MockStorageBlob(name, "content") for name in names]
+
+    with patch.object(Storage, "read_blob", side_effect=lambda name: pa.table({"name": [name]})):
+        chunks = list(test_storage.fetch_chunks(chunk_days=3))
+
+    assert [(c.first_date, c.last_date) for c in chunks] == [
+        (date(2024, 1, 1), date(2024, 1, 2)),
+        (date(2024, 1, 5), date(2024, 1, 5)),
+    ]
+    assert chunks[0].data["name"].tolist() == names[:3]
+
+
+def test_fetch_chunks_after_last_txn_date(test_storage, mock_storage_client_obj):
+    names = ["test_prefix/2024-01-01.csv", "test_prefix/2024-01-02.csv"]
+    mock_storage_client_obj.list_blobs.return_value = [MockStorageBlob(name, "content") for name in names]
+
+    with patch.object(Storage, "read_blob", side_effect=lambda name: pa.table({"name": [name]})):
+        chunks = list(test_storage.fetch_chunks(chunk_days=30, last_txn_date="2024-01-01"))
+
+    assert [c.data["name"].tolist() for c in chunks] == [["test_prefix/2024-01-02.csv"]]
+
+
+def test_with_columns_shares_the_client(test_storage):
+    projected = test_storage.with_columns(["name", "date"])
+
+    assert projected.columns == ["name", "date"]
+    assert test_storage.columns is None
+    assert projected.client is test_storage.client
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Test: Storage read_blob_with_retries
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def test_read_blob_with_retries_recovers_from_transient_errors(mock_storage_client_obj):
+    storage = Storage(bucket_name="test_bucket", prefix="test_prefix", initial_read_backoff=0)
+    expected = pa.table({"col1": ["a"]})
+
+    with patch.object(Storage, "read_blob", side_effect=[ServiceUnavailable("busy"), expected]) as mock_read_blob:
+        actual = storage.read_blob_with_retries("data/2024-01-01.csv")
+
+    assert mock_read_blob.call_count == 2
+    assert actual.equals(expected)
+
+
+def test_read_blob_with_retries_gives_up(mock_storage_client_obj):
+    storage = Storage(bucket_name="test_bucket", prefix="test_prefix", max_read_attempts=2, initial_read_backoff=0)
+
+    with patch.object(Storage, "read_blob", side_effect=ServiceUnavailable("busy")) as mock_read_blob:
+        with pytest.raises(ServiceUnavailable):
+            storage.read_blob_with_retries("data/2024-01-01.csv")
+
+    assert mock_read_blob.call_count == 2
+
+
+def test_read_blob_with_retries_does_not_retry_missing_objects(mock_storage_client_obj):
+    storage = Storage(bucket_name="test_bucket", prefix="test_prefix", initial_read_backoff=0)
+
+    with patch.object(Storage, "read_blob", side_effect=NotFound("gone")) as mock_read_blob:
+        with pytest.raises(NotFound):
+            storage.read_blob_with_retries("data/2024-01-01.csv")
+
+    mock_read_blob.assert_called_once()
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Test: Storage read_blob
 # ----------------------------------------------------------------------------------------------------------------------
 
 
-def test_read_blob_csv(test_storage, mock_storage_client_obj):
-    expected = pd.DataFrame({"col1": ["a", "b"]})
-    csv_content = expected.to_csv(index=False)
+def mock_blob_content(mock_storage_client_obj, content: bytes) -> MagicMock:
     mock_blob = MagicMock()
-    mock_blob.open.return_value.__enter__ = MagicMock(return_value=MagicMock(read=MagicMock(return_value=csv_content)))
+    mock_blob.open.return_value.__enter__ = MagicMock(return_value=MagicMock(read=MagicMock(return_value=content)))
     mock_blob.open.return_value.__exit__ = MagicMock(return_value=False)
     mock_storage_client_obj.bucket.return_value.blob.return_value = mock_blob
+    return mock_blob
+
+
+def test_read_blob_csv(test_storage, mock_storage_client_obj):
+    expected = pd.DataFrame({"col1": ["a", "b"]})
+    mock_blob = mock_blob_content(mock_storage_client_obj, expected.to_csv(index=False).encode("utf-8"))
 
     actual = test_storage.read_blob("data/2024-01-01.csv")
 
-    mock_blob.open.assert_called_once_with("r")
-    pd.testing.assert_frame_equal(actual, expected)
+    mock_blob.open.assert_called_once_with("rb")
+    pd.testing.assert_frame_equal(actual.to_pandas(), expected)
 
 
 def test_read_blob_parquet(test_storage, mock_storage_client_obj):
     expected = pd.DataFrame({"col1": ["a", "b"]})
     buffer = BytesIO()
     expected.to_parquet(buffer, index=False)
-    parquet_bytes = buffer.getvalue()
-
-    mock_blob = MagicMock()
-    mock_blob.open.return_value.__enter__ = MagicMock(
-        return_value=MagicMock(read=MagicMock(return_value=parquet_bytes))
-    )
-    mock_blob.open.return_value.__exit__ = MagicMock(return_value=False)
-    mock_storage_client_obj.bucket.return_value.blob.return_value = mock_blob
+    mock_blob = mock_blob_content(mock_storage_client_obj, buffer.getvalue())
 
     actual = test_storage.read_blob("data/2024-01-01_000.parquet")
 
     mock_blob.open.assert_called_once_with("rb")
+    pd.testing.assert_frame_equal(actual.to_pandas(), expected)
+
+
+def test_read_blob_projects_columns(mock_storage_client_obj):
+    storage = Storage(bucket_name="test_bucket", prefix="test_prefix", columns=["name", "size", "date"])
+    landing = pd.DataFrame({"name": ["Leche"], "product_url": ["https://x/p/1"], "date": ["2026-02-21"]})
+    buffer = BytesIO()
+    landing.to_parquet(buffer, index=False)
+
+    mock_blob_content(mock_storage_client_obj, buffer.getvalue())
+    parquet_table = storage.read_blob("carr/2026-02-21.parquet")
+    mock_blob_content(mock_storage_client_obj, landing.to_csv(index=False).encode("utf-8"))
+    csv_table = storage.read_blob("carr/2026-02-20.csv")
+
+    assert parquet_table.column_names == ["name", "date"]
+    assert csv_table.column_names == ["name", "date"]
+    assert csv_table.schema.field("date").type == pa.string()
+
+
+def test_read_blob_csv_reads_empty_fields_as_nulls(mock_storage_client_obj):
+    storage = Storage(bucket_name="test_bucket", prefix="test_prefix", columns=["name", "discount_price"])
+    mock_blob_content(mock_storage_client_obj, b'name,discount_price\nLeche,\nPan,"1,05 \xe2\x82\xac"\n')
+
+    actual = storage.read_blob("merc/2024-01-01.csv")
+
+    assert actual.column("discount_price").to_pylist() == [None, "1,05 €"]
+
+
+def test_build_dataframe_concatenates_parts_with_different_columns(test_storage):
+    parts = {
+        "merc/2024-01-01.csv": pa.table({"name": ["a"], "price_per_unit": [None]}),
+        "merc/2024-01-02_000.parquet": pa.table({"name": ["b"], "price_per_unit": ["1,00 €/kg"], "size": ["1 kg"]}),
+    }
+
+    with patch.object(Storage, "read_blob", side_effect=parts.get):
+        actual = test_storage.build_dataframe([MockStorageBlob(name, "content") for name in parts])
+
+    expected = pd.DataFrame({"name": ["a", "b"], "price_per_unit": [None, "1,00 €/kg"], "size": [None, "1 kg"]})
     pd.testing.assert_frame_equal(actual, expected)
 
 
+def test_build_dataframe_reads_dictionary_columns_as_categoricals(mock_storage_client_obj):
+    storage = Storage(
+        bucket_name="test_bucket", prefix="test_prefix", columns=["name", "date"], dictionary_columns=["date"]
+    )
+    buffer = BytesIO()
+    pd.DataFrame({"name": ["Leche"], "date": ["2024-01-02"]}).to_parquet(buffer, index=False)
+    contents = {
+        "merc/2024-01-01.csv": b"name,date\nPan,2024-01-01\nAgua,2024-01-01\n",
+        "merc/2024-01-02.parquet": buffer.getvalue(),
+    }
+    parts = {}
+    for name, content in contents.items():
+        mock_blob_content(mock_storage_client_obj, content)
+        parts[name] = storage.read_blob(name)
+
+    with patch.object(Storage, "read_blob", side_effect=parts.get):
+        actual = storage.build_dataframe([MockStorageBlob(name, "content") for name in parts])
+
+    assert actual["date"].dtype == "category"
+    assert actual["date"].tolist() == ["2024-01-01", "2024-01-01", "2024-01-02"]
+    assert actual["name"].dtype == pd.StringDtype("pyarrow")
+    assert actual["name"].tolist() == ["Pan", "Agua", "Leche"]
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Test: Storage filter_by_date
 # ----------------------------------------------------------------------------------------------------------------------
@@ -264,6 +457,7 @@ def test_filter_by_date_edge_case(test_storage):
         ("no-date-here.csv", None),
         ("2022-02-29.csv", None),  # invalid date
         ("2024-02-29.csv", date(2024, 2, 29)),  # leap year
+        ("carr/2026-10-17/part-frescos.parquet", date(2026, 10, 17)),  # checkpointed run part
         ("2023-13-01.csv", None),  # invalid month
         ("2023-00-01.csv", None),  # invalid month
         ("2023-12-32.csv", None),  # invalid day
@@ -275,3 +469,23 @@ def test_filter_by_date_edge_case(test_storage):
 def test_extract_date(filename, expected):
     result = Storage.extract_date(filename)
     assert result == expected
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Test: BigQuery write_partitions
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def test_write_partitions_loads_each_date_into_its_partition():
+    with patch("sinks.BigQueryClient") as mock_bigquery_client_cls:
+        destination = BigQuery(table_ref="project.dataset.merc", write_config={"write_disposition": "WRITE_TRUNCATE"})
+        df = pd.DataFrame({"date": pd.to_datetime(["2024-01-02", "2024-01-01", "2024-01-02"]), "name": ["a", "b", "c"]})
+
+        destination.write_partitions(df)
+
+    load = mock_bigquery_client_cls.return_value.load_table_from_dataframe
+    assert [c.args[1] for c in load.call_args_list] == [
+        "project.dataset.merc$20240101",
+        "project.dataset.merc$20240102",
+    ]
+    assert [c.args[0]["name"].tolist() for c in load.call_args_list] == [["b"], ["a", "c"]]
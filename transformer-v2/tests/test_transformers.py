@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from pathlib import Path
 
 import numpy as np
@@ -8,16 +9,27 @@ import pytest
 from main import run_transformer
 from sinks import Sink
 from transformers import add_price_column
+from transformers import apply_to_unique_values
+from transformers import build_category_lookup
 from transformers import CarrTransformer
 from transformers import cast_price_columns_as_float32
 from transformers import cats_date_column
 from transformers import deduplicate_products_with_diff_prices_per_date
+from transformers import DICTIONARY_COLUMNS
+from transformers import drop_duplicate_rows
 from transformers import ensure_columns
+from transformers import is_reordered_when_decomposed
+from transformers import map_old_categories
+from transformers import MercTransformer
 from transformers import OUTPUT_SCHEMA
 from transformers import parse_price_per_unit
+from transformers import parse_prices
 from transformers import round_price_columns
 from transformers import split_category_subcategory
 from transformers import standardize_string_columns
+from transformers import strip_accents
+from transformers import strip_accents_value
+from transformers import transform_merc
 from txn_rec import TransactionRecorder
 
 CARREFOUR_CSV_FILENAME = "carr_2026-02-21T21:04.csv"
@@ -212,6 +224,17 @@ def test_cast_price_columns_as_float32_with_concrete_values():
     assert actual["discount_price"].iloc[0] == pytest.approx(1.50, abs=1e-2)
     assert pd.isna(actual["discount_price"].iloc[1])
     assert actual["discount_price"].iloc[2] == pytest.approx(0.99, abs=1e-2)
+
+
+def test_cast_price_columns_as_float32_does_not_read_prices_per_unit():
+    df = pd.DataFrame({"original_price": ["2,10 €/kg", "2,10 €"], "discount_price": ["1,05 €/ud", None]})
+
+    actual = cast_price_columns_as_float32(df)
+
+    assert pd.isna(actual["original_price"].iloc[0])
+    assert actual["original_price"].iloc[1] == pytest.approx(2.10, abs=1e-2)
+    assert actual["discount_price"].isna().all()
+    assert "unit" not in actual.columns
     assert actual["original_price"].dtype == "float32"
     assert actual["discount_price"].dtype == "float32"
 
@@ -243,6 +266,291 @@ def test_standardize_string_columns_removes_accents_and_lowercases():
     assert actual["subcategory"].astype("string").iloc[1] == "jamon"
 
 
+def test_apply_to_unique_values_evaluates_each_value_once():
+    values = pd.Series(["a", "b", "a", None, "b", None], index=[10, 11, 12, 13, 14, 15])
+    seen = []
+
+    def upper(uniques: pd.Series) -> pd.Series:
+        seen.append(len(uniques))
+        return uniques.astype("string").str.upper()
+
+    actual = apply_to_unique_values(values, upper)
+
+    assert seen == [3]
+    assert actual.tolist() == ["A", "B", "A", pd.NA, "B", pd.NA]
+    assert actual.index.equals(values.index)
+
+
+def test_apply_to_unique_values_expands_frames():
+    values = pd.Series(["frescos > carne", "bebidas", "frescos > carne"], index=[0, 2, 5])
+
+    actual = apply_to_unique_values(values, lambda uniques: uniques.str.split(" > ", expand=True))
+
+    assert actual.index.equals(values.index)
+    assert actual[0].tolist() == ["frescos", "bebidas", "frescos"]
+    assert actual[1].tolist() == ["carne", None, "carne"]
+
+
+def test_apply_to_unique_values_keeps_categoricals():
+    values = pd.Series(pd.Categorical(["Frescos", "Bebidas", None, "Frescos"]), index=[3, 5, 7, 9])
+
+    actual = apply_to_unique_values(values, lambda uniques: uniques.astype("string").str.lower())
+
+    assert str(actual.dtype) == "category"
+    assert actual.index.equals(values.index)
+    assert actual.astype("string").tolist() == ["frescos", "bebidas", pd.NA, "frescos"]
+
+
+def _as_memory_optimized_input(df: pd.DataFrame) -> pd.DataFrame:
+    """The frame Storage reads with dictionary_columns: categoricals and Arrow-backed strings."""
+    return df.astype(
+        {column: "category" if column in DICTIONARY_COLUMNS else pd.StringDtype("pyarrow") for column in df.columns}
+    )
+
+
+def _comparable(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.astype({column: object for column in df.select_dtypes(exclude=["number", "datetime"]).columns})
+    return df.where(df.notna(), None)
+
+
+@pytest.mark.parametrize("transformer_cls", [CarrTransformer, MercTransformer])
+# Mercadona maps the old date's categories to the new one's, or to none when every date is old
+@pytest.mark.parametrize("dates", [("2024-11-01", "2024-11-08"), ("2024-10-01", "2024-10-08")])
+def test_memory_optimized_transform_matches_the_default_one(transformer_cls, dates):
+    raw_df = _load_carrefour_df().astype("string")
+    if transformer_cls is MercTransformer:
+        raw_df = raw_df.rename(columns={"price_per_unit": "size"})
+    raw_df = pd.concat([raw_df.assign(date=date) for date in dates], ignore_index=True)
+    raw_df = raw_df[[column for column in transformer_cls.INPUT_COLUMNS if column in raw_df.columns]]
+
+    expected = transformer_cls().transform(raw_df.copy())
+    actual = transformer_cls(memory_optimized=True).transform(_as_memory_optimized_input(raw_df))
+
+    assert actual["price"].dtype == expected["price"].dtype
+    pd.testing.assert_frame_equal(_comparable(actual), _comparable(expected))
+
+
+def test_memory_optimized_merc_transform_without_category_lookup_entries():
+    raw_df = pd.DataFrame(
+        {
+            "name": ["Leche", "Pan"],
+            "size": ["1 l", "250 g"],
+            "category": ["Lácteos > Leche", "Panadería > Pan"],
+            "original_price": ["1,00 €", "0,80 €"],
+            "discount_price": [None, None],
+            "image_url": ["https://example.com/leche.jpg", "https://example.com/pan.jpg"],
+            "date": ["2024-10-01", "2024-10-02"],
+        }
+    )
+
+    actual = transform_merc(raw_df.astype("category"), memory_optimized=True)
+
+    assert len(actual) == 2
+    assert actual["category"].isna().all() and actual["subcategory"].isna().all()
+    assert isinstance(actual["category"].dtype, pd.CategoricalDtype)
+
+
+def test_transforms_keep_values_with_their_rows_on_landing_data():
+    df = _load_carrefour_df().iloc[::2]  # a gapped index, as after drop_duplicates
+
+    actual = standardize_string_columns(split_category_subcategory(parse_price_per_unit(df.copy())))
+
+    expected_names = df["name"].astype("string").str.lower().str.strip().apply(strip_accents_value)
+    expected_categories = df["category"].astype("string").str.split(" > ").str[0].str.lower().str.strip()
+    assert actual.index.equals(df.index)
+    assert actual["name"].astype("string").tolist() == expected_names.tolist()
+    assert actual["category"].astype("string").tolist() == expected_categories.apply(strip_accents_value).tolist()
+    assert actual["unit"].notna().sum() == df["price_per_unit"].str.contains("€/", na=False).sum()
+
+
+def _parse_prices_with_str_methods(values: pd.Series) -> pd.DataFrame:
+    """The chained .str implementation parse_prices replaced."""
+    col = values.astype("string")
+    unit = col.str.extract(r"€/(\w+)", flags=re.IGNORECASE)[0]
+    price = (
+        col.str.replace(r"€/\w+", "", regex=True)
+        .str.replace("€", "", regex=False)
+        .str.replace(",", ".", regex=False)
+        .str.replace(" ", "", regex=False)
+    )
+    return pd.DataFrame({"price": pd.to_numeric(price, errors="coerce").astype("float32"), "unit": unit})
+
+
+PRICES = [
+    "1,23 €",
+    "12,50 €/kg",
+    "0,99 €/KG",
+    "1 €",
+    "3,45€/l",
+    "1,2 €/100 ml",
+    "€/kg",
+    "2,10 €/kg 1,05 €/ud",
+    "1.234,56 €",
+    "1 234,56 €",
+    "gratis",
+    "",
+    "  4,50  € ",
+    "7,10 €/docena",
+    None,
+]
+
+
+def test_parse_prices_matches_the_str_methods():
+    values = pd.Series(PRICES, index=range(10, 10 + len(PRICES)))
+
+    pd.testing.assert_frame_equal(parse_prices(values), _parse_prices_with_str_methods(values))
+
+
+def test_parse_prices_matches_the_str_methods_on_landing_data():
+    df = _load_carrefour_df()
+    for column in ["original_price", "discount_price", "price_per_unit"]:
+        pd.testing.assert_frame_equal(parse_prices(df[column]), _parse_prices_with_str_methods(df[column]))
+
+
+def test_parse_prices_splits_value_and_unit():
+    actual = parse_prices(pd.Series(["12,50 €/kg", "1,23 €", None]))
+
+    assert actual["price"].tolist()[:2] == pytest.approx([12.5, 1.23])
+    assert actual["unit"].tolist() == ["kg", pd.NA, pd.NA]
+    assert actual["price"].dtype == "float32"
+
+
+def test_strip_accents_is_identical_to_per_value_stripping_on_landing_data():
+    df = _load_carrefour_df()
+    for column in ["name", "category", "price_per_unit"]:
+        values = df[column].astype("string").str.lower().str.strip()
+
+        actual = strip_accents(values)
+
+        expected = values.apply(strip_accents_value)
+        assert actual.tolist() == expected.tolist()
+        assert actual.index.equals(values.index)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "jamón ibérico",
+        "pin\u0303a colada",  # already decomposed
+        "\u0301acento suelto",
+        "ﬁlete ½ kg · 3ª unidad",
+        "crème brûlée ÇÅØ",
+        "한국 라면",  # Hangul decomposes to jamo, which are kept
+        "café ☕ 🍰",
+        "देवनागरी",
+        "",
+    ],
+)
+def test_strip_accents_is_identical_to_per_value_stripping(value):
+    values = pd.Series([value, pd.NA, value.upper()], dtype="string")
+
+    actual = strip_accents(values)
+
+    assert actual.tolist()[0] == strip_accents_value(value)
+    assert actual.tolist()[2] == strip_accents_value(value.upper())
+    assert actual.isna().tolist() == [False, True, False]
+
+
+def test_strip_accents_is_identical_for_every_bmp_character():
+    chars = [chr(code) for code in range(0x10000) if not 0xD800 <= code <= 0xDFFF]
+    chars = [char for char in chars if not is_reordered_when_decomposed(char)]
+    values = pd.Series(chars + ["".join(chars)], dtype="string")
+
+    actual = strip_accents(values)
+
+    assert actual.tolist() == values.apply(strip_accents_value).tolist()
+
+
+def test_strip_accents_keeps_the_rows_of_a_gapped_index():
+    # e.g. after drop_duplicates: the values must stay with their rows, not be realigned to a fresh index
+    values = pd.Series(["jamón", "pâté", "leche"], index=[0, 2, 5], dtype="string")
+
+    actual = strip_accents(values)
+
+    assert actual.to_dict() == {0: "jamon", 2: "pate", 5: "leche"}
+
+
+def test_strip_accents_falls_back_when_kept_marks_could_be_reordered():
+    # U+1D165 is a combining mark that is not removed (Mc), and NFD sorts it after the removed acute accent
+    values = pd.Series(["á𝅥", "á𝅥"], dtype="string")
+
+    assert strip_accents(values).tolist() == values.apply(strip_accents_value).tolist()
+
+
+def _map_old_categories_with_merge(df: pd.DataFrame, category_lookup: pd.DataFrame) -> pd.DataFrame:
+    """The self-merge map_old_categories replaced."""
+    merged_df = pd.merge(df, category_lookup, on=["name", "size"], how="left", suffixes=("", "_new"))
+    merged_df["category"] = merged_df["category_new"]
+    merged_df["subcategory"] = merged_df["subcategory_new"]
+    return merged_df.drop(columns=["category_new", "subcategory_new"]).drop_duplicates()
+
+
+def _old_categories_df() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(
+                ["2024-11-01", "2024-11-01", "2024-11-01", "2024-11-08", "2024-11-08", "2024-11-09", "2024-11-01"]
+            ),
+            "name": ["Leche", "Leche", "Pan", "Leche", "Leche", None, None],
+            "size": ["1 l", "1 l", None, "1 l", "1 l", None, None],
+            "category": pd.array(
+                ["lacteos", "ofertas", "panaderia", "frescos", "bebidas", "varios", "otros"], "string"
+            ),
+            "subcategory": pd.array(["leche", "leche", "pan", "leche", "leche", "varios", "otros"], "string"),
+            "original_price": pd.array([1.0, 1.0, 0.5, 1.1, 1.1, 2.0, 3.0], dtype="float32"),
+        }
+    )
+
+
+def test_map_old_categories_maps_to_every_recent_category():
+    actual = map_old_categories(_old_categories_df())
+
+    leche = actual[actual["name"] == "Leche"]
+    # The two old listings of the same day collapse into one row per recent category
+    assert list(zip(leche["date"].dt.day, leche["category"])) == [
+        (1, "frescos"),
+        (1, "bebidas"),
+        (8, "frescos"),
+        (8, "bebidas"),
+    ]
+    # Not listed since the cutoff: no category
+    assert actual.loc[actual["name"] == "Pan", "category"].isna().all()
+    # Missing names and sizes match each other
+    assert actual.loc[actual["name"].isna(), "category"].tolist() == ["varios", "varios"]
+
+
+@pytest.mark.parametrize("external_lookup", [False, True])
+def test_map_old_categories_matches_the_merge(external_lookup):
+    rng = np.random.default_rng(7)
+    n = 400
+    df = pd.DataFrame(
+        {
+            "date": pd.to_datetime(rng.choice(["2024-11-01", "2024-11-08", "2024-11-09"], n)),
+            "name": rng.choice(np.array(["leche", "pan", "agua", None], dtype=object), n),
+            "size": rng.choice(np.array(["1 l", "2 l", None], dtype=object), n),
+            "category": pd.array(rng.choice(["frescos", "bebidas", "ofertas"], n), dtype="string"),
+            "subcategory": pd.array(rng.choice(["leche", "agua"], n), dtype="string"),
+            "original_price": rng.choice([1.0, 2.0], n).astype("float32"),
+        }
+    )
+    category_lookup = build_category_lookup(df.sample(frac=0.5, random_state=1)) if external_lookup else None
+
+    actual = map_old_categories(df.copy(), category_lookup)
+
+    expected = _map_old_categories_with_merge(
+        df, build_category_lookup(df) if category_lookup is None else category_lookup
+    )
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_drop_duplicate_rows_matches_drop_duplicates():
+    df = _old_categories_df()
+    df = pd.concat([df, df.iloc[[0, 2, 6]]], ignore_index=True)
+
+    pd.testing.assert_frame_equal(drop_duplicate_rows(df, subset=["date", "name"]), df.drop_duplicates())
+    pd.testing.assert_frame_equal(drop_duplicate_rows(df.head(3), subset=["category"]), df.head(3))
+
+
 def test_deduplicate_products_assigns_correct_dedup_ids():
     df = pd.DataFrame(
         {